@@ -5,36 +5,39 @@ Created on Tue Apr 21 11:43:33 2020.
 @author: joslaton
 """
 import PySimpleGUI as sg
+from multiprocessing import freeze_support
 from psv_mrd_gen import mrd_gendo
 from psv_test_gen import test_gendo
 from psv_report_gen import report_gendo
 
-sg.theme('TanBlue')
+if __name__ == '__main__':
+    # Worker processes re-import this module and must not open the GUI.
+    freeze_support()
+    sg.theme('TanBlue')
 
-windict = {'MRD Generator': mrd_gendo,
-           'Test Generator': test_gendo,
-           'Report Generator': report_gendo}
+    windict = {'MRD Generator': mrd_gendo,
+               'Test Generator': test_gendo,
+               'Report Generator': report_gendo}
 
-layout = [
-    [sg.Frame('Launch Utility',[
-        [sg.Button(button_text='MRD Generator', size=(30,1))],
-        [sg.Button(button_text='Test Generator', size=(30,1))],
-        [sg.Button(button_text='Report Generator', size=(30,1))],
-        [sg.Button(button_text='Exit', size=(15,1))]],
-        element_justification='center')
-]
-]
+    layout = [
+        [sg.Frame('Launch Utility',[
+            [sg.Button(button_text='MRD Generator', size=(30,1))],
+            [sg.Button(button_text='Test Generator', size=(30,1))],
+            [sg.Button(button_text='Report Generator', size=(30,1))],
+            [sg.Button(button_text='Exit', size=(15,1))]],
+            element_justification='center')
+    ]
+    ]
 
-main_window = sg.Window('PSVerGUI', layout)
+    main_window = sg.Window('PSVerGUI', layout)
 
 
-while True:
-    main_events, main_values = main_window.Read(timeout=100)
-    if main_events is None or main_events == 'Exit':
-        break
-    if main_events != '__TIMEOUT__':
+    while True:
+        main_events, main_values = main_window.Read()
+        if main_events is None or main_events == 'Exit':
+            break
         main_window.Disappear()
         windict[main_events]()
         main_window.Reappear()
 
-main_window.close()
\ No newline at end of file
+    main_window.close()
\ No newline at end of file
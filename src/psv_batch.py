@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""Batch MRD generation and the psv_batch command line."""
+import argparse
+import sys
+from importlib.util import find_spec
+import pandas as pd
+from multiprocessing import freeze_support
+from pathlib import Path
+from psv_bench import compare_bench, run_bench, save_bench
+from psv_mrd_gen import get_prd_files, mrd_batch, update_mrd
+from psv_db import ResultStore
+from psv_report_gen import (get_mgroups, get_result_files, pyarrow_missing,
+                            report_batch)
+from psv_sim import simulate
+
+###################################################################################################
+#   Batch Module   ################################################################################
+###################################################################################################
+
+
+def run_mrd(args):
+    """
+    Generate an MRD for every PRD selected on the command line.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed command line arguments.
+
+    Returns
+    -------
+    int
+        0 if every MRD was generated, otherwise 1.
+
+    """
+    prd_files = get_prd_files(args.prd)
+    if not prd_files:
+        print('No PRD files found.')
+        return 1
+    results = mrd_batch(prd_files,
+                        args.output_dir,
+                        workers=args.workers,
+                        standard_sheet=args.std_sheet,
+                        extended_sheet=args.ext_sheet,
+                        standard_pattern=args.std_pattern,
+                        extended_pattern=args.ext_pattern,
+                        use_cache=not args.no_cache)
+    failed = 0
+    for prd_file, result in results.items():
+        if isinstance(result, BaseException):
+            failed += 1
+            print(f'FAILED {prd_file}: {result}')
+        else:
+            print(f'{prd_file} -> {result}')
+    print(f'{len(results) - failed} of {len(results)} MRDs generated.')
+    return int(failed > 0)
+
+
+def run_mrd_update(args):
+    """
+    Regenerate an MRD from a revised PRD and report the changed fields.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed command line arguments.
+
+    Returns
+    -------
+    int
+        Always 0.
+
+    """
+    _, diff_df = update_mrd(args.prd, args.mrd, args.std_sheet,
+                            args.ext_sheet, output_file=args.output,
+                            diff_file=args.diff)
+    if diff_df.empty:
+        print('No MRD fields changed.')
+    else:
+        print(diff_df.to_string(index=False))
+    return 0
+
+
+def run_report(args):
+    """
+    Generate a report for every result file selected on the command line.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed command line arguments.
+
+    Returns
+    -------
+    int
+        0 if every report was generated, otherwise 1.
+
+    """
+    if args.export_dir is not None and find_spec('pyarrow') is None:
+        print(pyarrow_missing)
+        return 1
+    result_files = get_result_files(args.results)
+    if not result_files:
+        print('No result files found.')
+        return 1
+    md = get_mgroups(args.mgroups) if args.mgroups else {}
+    results = report_batch(result_files, args.rsa, args.mrd, args.template,
+                           args.output_dir, md, workers=args.workers,
+                           export_dir=args.export_dir,
+                           export_format=args.export_format,
+                           db_file=args.db, lot=args.lot, usid=args.usid)
+    failed = 0
+    for result_file, result in results.items():
+        if isinstance(result, BaseException):
+            failed += 1
+            print(f'FAILED {result_file}: {result!r}')
+        else:
+            print(f'{result_file} -> {result}')
+    print(f'{len(results) - failed} of {len(results)} reports generated.')
+    return int(failed > 0)
+
+
+def run_query(args):
+    """
+    Print the failing results or lots of a result database.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed command line arguments.
+
+    Returns
+    -------
+    int
+        Always 0.
+
+    """
+    store = ResultStore(args.db)
+    filters = {'trig': args.trig, 'register': args.register,
+               'test': args.test, 'mtrig_setting': args.mtrig_setting}
+    if args.lots:
+        df = store.get_failing_lots(**filters)
+    else:
+        df = store.get_failures(lot=args.lot, **filters)
+    store.close()
+    if df.empty:
+        print('No failures found.')
+    else:
+        print(df.to_string(index=False))
+    return 0
+
+
+def run_sim(args):
+    """
+    Run a test sequence on an RFFE device modelled from an MRD.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed command line arguments.
+
+    Returns
+    -------
+    int
+        Always 0.
+
+    """
+    sequence = Path(args.sequence)
+    output = args.output or str(sequence.with_name(f'{sequence.stem}_result.csv'))
+    md = get_mgroups(args.mgroups) if args.mgroups else None
+    stats = simulate(args.sequence, args.mrd, output, usid=args.usid,
+                     mgroups=md)
+    print(f'{args.sequence} -> {output}')
+    print(f"{stats['commands']} commands, {stats['failed']} failed reads, "
+          f"{stats['rate']:.0f} commands/s.")
+    return 0
+
+
+def run_benchmark(args):
+    """
+    Benchmark the generators on a synthetic PRD and save the timings.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed command line arguments.
+
+    Returns
+    -------
+    int
+        Always 0.
+
+    """
+    bench = run_bench(args.work_dir, args.registers, args.triggers,
+                      args.mgroups, args.mtrig_registers, args.tbyb_registers,
+                      args.seed, args.repeat, not args.no_memory)
+    if args.compare:
+        df = compare_bench(args.compare, bench)
+    else:
+        df = pd.DataFrame([{'Stage': k, 'Seconds': v['seconds'],
+                            'MiB': v.get('peak_bytes', float('nan')) / 2**20}
+                           for k, v in bench['stages'].items()])
+    print(df.to_string(index=False, float_format='{:.3f}'.format))
+    print(f'Saved {save_bench(bench, args.output)}')
+    return 0
+
+
+def get_parser():
+    """
+    Build the command line parser.
+
+    Returns
+    -------
+    parser : ArgumentParser
+        Parser for the batch command line.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog='psv_batch',
+        description='Run the PSVerGUI generators without the GUI.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    mrd = commands.add_parser('mrd', help='Generate MRDs from PRD workbooks.')
+    mrd.add_argument('prd', nargs='+',
+                     help='PRD .xlsx files, directories or glob patterns.')
+    mrd.add_argument('-o', '--output-dir', default='.',
+                     help='Directory in which the MRD csv files are saved.')
+    std = mrd.add_mutually_exclusive_group(required=True)
+    std.add_argument('--std-sheet', help='Name of the standard register sheet.')
+    std.add_argument('--std-pattern',
+                     help='Regular expression matching the standard register sheet.')
+    ext = mrd.add_mutually_exclusive_group(required=True)
+    ext.add_argument('--ext-sheet', help='Name of the extended register sheet.')
+    ext.add_argument('--ext-pattern',
+                     help='Regular expression matching the extended register sheet.')
+    mrd.add_argument('-j', '--workers', type=int, default=None,
+                     help='Number of worker processes. Defaults to one per core.')
+    mrd.add_argument('--no-cache', action='store_true',
+                     help='Re-parse every PRD instead of using the register map cache.')
+    mrd.set_defaults(func=run_mrd)
+
+    update = commands.add_parser(
+        'mrd-update',
+        help='Regenerate an MRD, recomputing only the registers whose PRD rows changed.')
+    update.add_argument('prd', help='Revised PRD .xlsx file.')
+    update.add_argument('mrd', help='Previous MRD csv file.')
+    update.add_argument('--std-sheet', required=True,
+                        help='Name of the standard register sheet.')
+    update.add_argument('--ext-sheet', required=True,
+                        help='Name of the extended register sheet.')
+    update.add_argument('-o', '--output', default=None,
+                        help='Path of the new MRD. Defaults to overwriting the previous MRD.')
+    update.add_argument('--diff', default=None,
+                        help='Path of a csv file listing the changed MRD fields.')
+    update.set_defaults(func=run_mrd_update)
+
+    template = (Path(__file__).parent.resolve() / 'Resources' /
+                'TEMPLATE_Post-Silicon Verification.xlsx')
+    report = commands.add_parser(
+        'report', help='Generate reports from TestStand result files.')
+    report.add_argument('results', nargs='+',
+                        help='Result .csv files, directories or glob patterns.')
+    report.add_argument('--rsa', required=True,
+                        help='Register Status Analyzer csv file.')
+    report.add_argument('--mrd', required=True, help='MRD csv file.')
+    report.add_argument('--template', default=str(template),
+                        help='Report template. Defaults to the bundled template.')
+    report.add_argument('--mgroups', default=None,
+                        help='.json or .csv file mapping the mTrig register nibbles to mGroups.')
+    report.add_argument('-o', '--output-dir', default='.',
+                        help='Directory in which the reports are saved.')
+    report.add_argument('-j', '--workers', type=int, default=None,
+                        help='Number of worker processes. Defaults to one per core.')
+    report.add_argument('--export-dir', default=None,
+                        help='Also save the result tables under this directory, partitioned by device and test.')
+    report.add_argument('--export-format', choices=['parquet', 'arrow'],
+                        default='parquet',
+                        help='File format of the exported tables. Requires pyarrow.')
+    report.add_argument('--db', default=None,
+                        help='Result database to which every run is added.')
+    report.add_argument('--lot', default=None,
+                        help='Lot stored with the runs in the result database.')
+    report.add_argument('--usid', type=lambda x: int(x, 0), default=None,
+                        help='USID stored with the runs in the result database.')
+    report.set_defaults(func=run_report)
+
+    query = commands.add_parser(
+        'query', help='Query the failures stored in a result database.')
+    query.add_argument('db', help='Result database.')
+    query.add_argument('--trig', default=None, help='Trigger, as T12 or TC3.')
+    query.add_argument('--register', default=None,
+                       help='Register address, as Reg0x2B or 0x2B.')
+    query.add_argument('--test', default=None,
+                       help='Test, as "Timed Trigger Test".')
+    query.add_argument('--mtrig-setting', default=None, help='mTrig setting.')
+    query.add_argument('--lot', default=None, help='Only list failures of this lot.')
+    query.add_argument('--lots', action='store_true',
+                       help='Count the failing devices of every lot instead of listing failures.')
+    query.set_defaults(func=run_query)
+
+    sim = commands.add_parser(
+        'sim', help='Run a test sequence on an RFFE device modelled from an MRD.')
+    sim.add_argument('sequence', help='Test sequence csv file.')
+    sim.add_argument('--mrd', required=True, help='MRD csv file of the device.')
+    sim.add_argument('-o', '--output', default=None,
+                     help='Path of the result csv. Defaults to the sequence name ending in _result.')
+    sim.add_argument('--mgroups', default=None,
+                     help='.json or .csv file mapping the mTrig register nibbles to mGroups. '
+                     'Defaults to the mTrig registers named in the MRD.')
+    sim.add_argument('--usid', type=lambda x: int(x, 0), default=None,
+                     help='USID of the device. Defaults to the USID in the MRD.')
+    sim.set_defaults(func=run_sim)
+
+    bench = commands.add_parser(
+        'bench', help='Time MRD, test and report generation on a synthetic PRD.')
+    bench.add_argument('-o', '--output', default='bench.json',
+                       help='Path of the benchmark .json file.')
+    bench.add_argument('--registers', type=int, default=64,
+                       help='Number of triggered registers.')
+    bench.add_argument('--triggers', type=int, default=8,
+                       help='Number of triggers the registers are spread over, at most 10.')
+    bench.add_argument('--mgroups', type=int, default=2, help='Number of mTrig groups.')
+    bench.add_argument('--mtrig-registers', type=int, default=2,
+                       help='Number of registers in every mTrig group.')
+    bench.add_argument('--tbyb-registers', type=int, default=8,
+                       help='Number of TBYB registers.')
+    bench.add_argument('--seed', type=int, default=0, help='Seed of the default values.')
+    bench.add_argument('--repeat', type=int, default=1,
+                       help='Number of timed runs of every stage. The best run is kept.')
+    bench.add_argument('--no-memory', action='store_true',
+                       help='Skip the traced run that measures the peak memory of every stage.')
+    bench.add_argument('--work-dir', default=None,
+                       help='Directory in which the generated files are kept. Defaults to a temporary directory.')
+    bench.add_argument('--compare', default=None,
+                       help='Baseline benchmark .json file to compare the stages with.')
+    bench.set_defaults(func=run_benchmark)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    freeze_support()
+    sys.exit(main())
@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of MRD, test and report generation."""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from string import ascii_uppercase as uc
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from psv_mrd_gen import get_register_df, import_cols, save_mrd
+from psv_report_gen import (get_tr_dict, psv_loadfile, psv_loadwriter,
+                            psv_processfile, psv_readchunks)
+from psv_sim import simulate
+from psv_test_gen import (format_commands, generate_mtrig_dict,
+                          get_estimated_registers, get_test, get_usid,
+                          save_commands)
+
+###################################################################################################
+#   Benchmark Module   ############################################################################
+###################################################################################################
+bench_sheets = ('Standard', 'Extended')
+bench_usid = 0xB
+# Tests in the order they are generated, and the function each one runs.
+bench_tests = {'-T-': 'triggered_write_test',
+               '-TBYB-': 'tbyb_test',
+               '-TT-': 'trig_counter_test',
+               '-MT-': 'mtrig_test'}
+default_template = str(Path(__file__).parent.resolve() / 'Resources' /
+                       'TEMPLATE_Post-Silicon Verification.xlsx')
+# Standard registers written by the generator besides the user registers.
+standard_registers = {0x1C: 'PM_TRIG',
+                      0x1D: 'PRODUCT_ID',
+                      0x1E: 'MANUFACTURER_ID',
+                      0x1F: 'USID'}
+# Register addresses free for the synthetic registers. Addresses below 0x80
+# are read from the standard sheet.
+free_addresses = [el for el in [*range(0x1C), *range(0x40, 0x100)]
+                  if el != 0xA4]
+
+
+def get_layout(registers, triggers, mgroups, mtrig_registers, tbyb_registers):
+    """
+    Place the synthetic registers of a PRD in the register space.
+
+    The triggered registers take the free addresses from 0x00, skipping the
+    RFFE registers from 0x1C to 0x3F. The mTrig registers and their control
+    registers follow them, and the TBYB registers take the extended
+    registers down from 0xFF, as they must lie above 0xA7.
+
+    Parameters
+    ----------
+    registers : int
+        Number of triggered registers.
+    triggers : int
+        Number of triggers, from 1 to 10, the registers are spread over.
+    mgroups : int
+        Number of mTrig groups.
+    mtrig_registers : int
+        Number of registers in every mTrig group.
+    tbyb_registers : int
+        Number of TBYB registers.
+
+    Returns
+    -------
+    layout : dict
+        Dictionary mapping each address to its name, trigger and TBYB flag.
+
+    """
+    if not 1 <= triggers <= 10:
+        raise ValueError('The PRD trigger names support triggers 0 to 9.')
+    if mgroups > len(uc):
+        raise ValueError(f'At most {len(uc)} mTrig groups are supported.')
+    free = free_addresses.copy()
+    controls = (mgroups + 1) // 2
+    count = registers + mgroups * mtrig_registers + controls + tbyb_registers
+    if count > len(free):
+        raise ValueError(f'{count} registers do not fit in the {len(free)}'
+                         ' free register addresses.')
+    tbyb = [el for el in free[::-1][:tbyb_registers] if el > 0xA7]
+    if len(tbyb) < tbyb_registers:
+        raise ValueError('The TBYB registers do not fit above 0xA7.')
+    free = free[:len(free) - tbyb_registers]
+    layout = {}
+    for i in range(registers):
+        layout[free.pop(0)] = {'Trig': f'T{i % triggers}'}
+    for i in range(mgroups * mtrig_registers):
+        layout[free.pop(0)] = {'Trig': f'M{uc[i % mgroups]}'}
+    # Every control register holds the nibbles of two groups.
+    for i in range(controls):
+        name = '_'.join(['MTRIG'] + list(uc[2 * i:min(2 * i + 2, mgroups)]))
+        layout[free.pop(0)] = {'Name': name}
+    for adrs in tbyb:
+        layout[adrs] = {'TBYB': True}
+    return layout
+
+
+def make_prd(prd_file, registers=64, triggers=8, mgroups=2, mtrig_registers=2,
+             tbyb_registers=8, seed=0):
+    """
+    Write a synthetic PRD workbook.
+
+    The workbook has a standard and an extended register sheet with the
+    import_cols columns. Every register is split into two nibble fields and
+    its default value is given in hex.
+
+    Parameters
+    ----------
+    prd_file : str
+        Path of the PRD .xlsx file.
+    registers : int, optional
+        Number of triggered registers. The default is 64.
+    triggers : int, optional
+        Number of triggers the registers are spread over. The default is 8.
+    mgroups : int, optional
+        Number of mTrig groups. The default is 2.
+    mtrig_registers : int, optional
+        Number of registers in every mTrig group. The default is 2.
+    tbyb_registers : int, optional
+        Number of TBYB registers. The default is 8.
+    seed : int, optional
+        Seed of the default values. The default is 0.
+
+    Returns
+    -------
+    prd_file : str
+        Path of the PRD .xlsx file.
+
+    """
+    layout = get_layout(registers, triggers, mgroups, mtrig_registers,
+                        tbyb_registers)
+    rng = np.random.default_rng(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(bench_sheets[0])
+    ws.append(import_cols['standard'])
+    for adrs in sorted(set(range(0x20)) | {el for el in layout if el < 0x80}):
+        reg = layout.get(adrs, {})
+        if adrs in standard_registers:
+            name, klass = standard_registers[adrs], 'Standard'
+        else:
+            name, klass = reg.get('Name', f'REG_{adrs:02X}'), 'User Defined'
+        value = 0x10 | bench_usid if adrs == 0x1F else int(rng.integers(256))
+        rw = 'R' if adrs in (0x1D, 0x1E) else 'R/W'
+        for bits in ('[7:4]', '[3:0]'):
+            first = bits == '[7:4]'
+            ws.append([klass if first else None,
+                       'Yes' if first else None,
+                       f'0x{adrs:02X}' if first else None,
+                       name if first else None,
+                       bits,
+                       f'{name}_{bits[1]}',
+                       f'0x{value:02X}' if first else None,
+                       'Yes',
+                       'Yes',
+                       reg.get('Trig') if first else None,
+                       'Yes',
+                       'Yes',
+                       rw])
+    ws = wb.create_sheet(bench_sheets[1])
+    ws.append(import_cols['extended'])
+    for adrs in sorted(set(layout) | {0xA4}):
+        if adrs < 0x80:
+            continue
+        reg = layout[adrs] if adrs != 0xA4 else {'Name': 'SIREV_ID'}
+        name = reg.get('Name', f'EXT_{adrs:02X}')
+        for bits in ('[7:4]', '[3:0]'):
+            first = bits == '[7:4]'
+            ws.append([f'0x{adrs:02X}' if first else None,
+                       name if first else None,
+                       4,
+                       bits,
+                       f'{name}_{bits[1]}',
+                       f'0x{int(rng.integers(256)):02X}' if first else None,
+                       reg.get('Trig', 'N') if first else None,
+                       'Y',
+                       ('Y' if reg.get('TBYB') else 'N') if first else None])
+    wb.save(prd_file)
+    return prd_file
+
+
+def make_rsa(mrd_df, rsa_file):
+    """
+    Write a Register Status Analyzer csv with the default of every register.
+
+    Parameters
+    ----------
+    mrd_df : DataFrame
+        DataFrame containing the MRD.
+    rsa_file : str
+        Path of the RSA csv file.
+
+    Returns
+    -------
+    rsa_file : str
+        Path of the RSA csv file.
+
+    """
+    rsa = pd.DataFrame({'Name': mrd_df['Name'].values,
+                        'Read': mrd_df['Value'].values,
+                        'Status': 'Pass'},
+                       index=mrd_df['Address'].values)
+    rsa.to_csv(rsa_file)
+    return rsa_file
+
+
+def get_selections(mrd_df):
+    """
+    Select the registers of every test as the test generator estimates them.
+
+    Parameters
+    ----------
+    mrd_df : DataFrame
+        DataFrame containing the MRD.
+
+    Returns
+    -------
+    selections : dict
+        Dictionary mapping each test key to its register selection. The
+        mTrig selection ends with the mTrig control register dict.
+
+    """
+    selections = {}
+    for key in bench_tests:
+        selections[key], _ = get_estimated_registers(key, mrd_df)
+    mtrig = selections['-MT-']
+    selections['-MT-'] = mtrig + [generate_mtrig_dict(mtrig, mrd_df)]
+    return selections
+
+
+def get_mgroups(mtrig_dict):
+    """
+    Convert the mTrig control register dict to the mGroup mapping.
+
+    Parameters
+    ----------
+    mtrig_dict : dict
+        Dictionary for the mtrig control group registers.
+
+    Returns
+    -------
+    md : dict
+        Dictionary containing the mappable trigger information, as from
+        psv_report_gen.get_mgroups.
+
+    """
+    md = {}
+    for grp, control in mtrig_dict.items():
+        if control['Reg']:
+            nibble = '0xF0' if control['U/L'] == 'L' else '0x0F'
+            md.setdefault(control['Reg'], {})[nibble] = grp[1:]
+    return md
+
+
+def render(key, usid, regs):
+    """
+    Generate and format a test, discarding the command lines.
+
+    Parameters
+    ----------
+    key : str
+        Key used to determine which test to generate.
+    usid : int
+        Integer decimal valued USID for testing purposes.
+    regs: list[list]
+        List of lists containing information on selected registers.
+
+    Returns
+    -------
+    count : int
+        Number of commands of the test.
+
+    """
+    count = 0
+    for records in get_test(key, usid, list(regs)):
+        format_commands(records)
+        count += len(records)
+    return count
+
+
+def run_stage(func, repeat=1, memory=True):
+    """
+    Time a stage and measure its peak traced memory.
+
+    The stage is timed repeat times without tracing. It is then run once
+    more under tracemalloc for its peak memory, as tracing slows it down.
+
+    Parameters
+    ----------
+    func : callable
+        Stage without arguments.
+    repeat : int, optional
+        Number of timed runs. The default is 1.
+    memory : Boolean, optional
+        Flag to measure the peak memory. The default is True.
+
+    Returns
+    -------
+    result : object
+        Return value of the last timed run.
+    stats : dict
+        Best and all run times in seconds, and the peak memory in bytes.
+
+    """
+    runs = []
+    for _ in range(repeat):
+        start = perf_counter()
+        result = func()
+        runs.append(perf_counter() - start)
+    stats = {'seconds': min(runs), 'runs': runs}
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            stats['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, stats
+
+
+def get_revision():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True,
+            text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_bench(work_dir=None, registers=64, triggers=8, mgroups=2,
+              mtrig_registers=2, tbyb_registers=8, seed=0, repeat=1,
+              memory=True, template_file=default_template):
+    """
+    Benchmark MRD, test and report generation on a synthetic PRD.
+
+    The PRD, MRD, sequence, result and report files are generated in
+    work_dir and every stage is timed on them in pipeline order.
+
+    Parameters
+    ----------
+    work_dir : str, optional
+        Directory of the generated files. The default is None, which uses a
+        temporary directory.
+    registers : int, optional
+        Number of triggered registers. The default is 64.
+    triggers : int, optional
+        Number of triggers the registers are spread over. The default is 8.
+    mgroups : int, optional
+        Number of mTrig groups. The default is 2.
+    mtrig_registers : int, optional
+        Number of registers in every mTrig group. The default is 2.
+    tbyb_registers : int, optional
+        Number of TBYB registers. The default is 8.
+    seed : int, optional
+        Seed of the default values. The default is 0.
+    repeat : int, optional
+        Number of timed runs of every stage. The default is 1.
+    memory : Boolean, optional
+        Flag to measure the peak memory of every stage. The default is True.
+    template_file : str, optional
+        Report template. The default is the bundled template.
+
+    Returns
+    -------
+    bench : dict
+        Configuration, environment, sizes and stage statistics.
+
+    """
+    if work_dir is None:
+        with tempfile.TemporaryDirectory() as work_dir:
+            return run_bench(work_dir, registers, triggers, mgroups,
+                             mtrig_registers, tbyb_registers, seed, repeat,
+                             memory, template_file)
+    config = {'registers': registers, 'triggers': triggers,
+              'mgroups': mgroups, 'mtrig_registers': mtrig_registers,
+              'tbyb_registers': tbyb_registers, 'seed': seed,
+              'repeat': repeat}
+    files = {el: os.path.join(work_dir, name) for el, name in
+             (('prd', 'bench_PRD.xlsx'), ('mrd', 'bench_MRD.csv'),
+              ('rsa', 'bench_RSA.csv'), ('sequence', 'bench_sequence.csv'),
+              ('result', 'bench_result.csv'), ('report', 'bench_Report.xlsx'))}
+    stages = {}
+
+    def stage(name, func):
+        result, stages[name] = run_stage(func, repeat, memory)
+        return result
+
+    stage('make_prd', lambda: make_prd(files['prd'], registers, triggers,
+                                       mgroups, mtrig_registers,
+                                       tbyb_registers, seed))
+    mrd_df, _ = stage('get_register_df', lambda: get_register_df(
+        files['prd'], *bench_sheets, use_cache=False))
+    save_mrd(mrd_df, files['mrd'])
+    make_rsa(mrd_df, files['rsa'])
+    usid = get_usid(mrd_df)
+    selections = get_selections(mrd_df)
+    sizes = {'mrd_registers': len(mrd_df)}
+    for key, name in bench_tests.items():
+        sizes[f'{name}_commands'] = stage(
+            name, lambda: render(key, usid, selections[key]))
+    stage('save_commands', lambda: save_commands(
+        (el for key in bench_tests
+         for el in get_test(key, usid, list(selections[key]))),
+        files['sequence']))
+    md = get_mgroups(selections['-MT-'][-1])
+    sim = stage('simulate', lambda: simulate(files['sequence'], files['mrd'],
+                                            files['result'], usid, md))
+    sizes['result_rows'] = sim['commands']
+    stage('psv_loadfile', lambda: psv_loadfile(files['result']))
+    tr_dict = get_tr_dict(None, md)
+
+    def report():
+        # The sheets are streamed into the report while they are processed.
+        writer = psv_loadwriter(template_file, files['report'])
+        psv_processfile(psv_readchunks(files['result']), writer, tr_dict,
+                        files['rsa'], files['mrd'])
+        writer.close()
+
+    stage('psv_processfile', report)
+    for el in ('prd', 'sequence', 'result', 'report'):
+        sizes[f'{el}_bytes'] = os.path.getsize(files[el])
+    return {'created': datetime.now().isoformat(timespec='seconds'),
+            'revision': get_revision(),
+            'platform': platform.platform(),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'config': config,
+            'sizes': sizes,
+            'stages': stages}
+
+
+def save_bench(bench, json_file):
+    with open(json_file, 'w') as f:
+        json.dump(bench, f, indent=2)
+    return json_file
+
+
+def compare_bench(baseline_file, bench):
+    """
+    Compare the stages of a benchmark with those of a saved baseline.
+
+    Parameters
+    ----------
+    baseline_file : str
+        Path to the baseline benchmark .json file.
+    bench : dict
+        Benchmark, as from run_bench.
+
+    Returns
+    -------
+    DataFrame
+        Seconds and peak memory of every stage in both benchmarks, with the
+        ratio of the new to the baseline seconds.
+
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    if baseline['config'] != bench['config']:
+        print('Warning: the benchmark configurations differ.')
+    rows = []
+    for name, stats in bench['stages'].items():
+        old = baseline['stages'].get(name, {})
+        rows.append({'Stage': name,
+                     'Baseline s': old.get('seconds', np.nan),
+                     'New s': stats['seconds'],
+                     'Baseline MiB': old.get('peak_bytes', np.nan) / 2**20,
+                     'New MiB': stats.get('peak_bytes', np.nan) / 2**20})
+    df = pd.DataFrame(rows)
+    df['Ratio'] = df['New s'] / df['Baseline s']
+    return df
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""SQLite database of report results and their failures."""
+import os
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+###################################################################################################
+#   Result Database   #############################################################################
+###################################################################################################
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    lot TEXT,
+    usid INTEGER,
+    source TEXT,
+    ingested TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    test TEXT NOT NULL,
+    address INTEGER NOT NULL,
+    trig TEXT,
+    mtrig_group TEXT,
+    mtrig_setting TEXT,
+    mtrig_test TEXT,
+    passed INTEGER NOT NULL,
+    counter_passed INTEGER,
+    debug TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_device ON runs(device);
+CREATE INDEX IF NOT EXISTS runs_lot ON runs(lot);
+CREATE INDEX IF NOT EXISTS results_trig ON results(trig, address);
+CREATE INDEX IF NOT EXISTS results_address ON results(address, test);
+CREATE INDEX IF NOT EXISTS results_setting ON results(mtrig_setting);
+CREATE INDEX IF NOT EXISTS results_run ON results(run_id);
+"""
+# Debug sheet columns stored for every test.
+sheet_columns = {'Trigger Test Debug': 'Trigger Test',
+                 'Timed Trigger Test Debug': 'Timed Trigger Test',
+                 'mTrig Test Debug': 'mTrig Test',
+                 'TBYB Test': 'TBYB Test'}
+
+
+def get_address(register):
+    """
+    Get the integer address of a register given as 'Reg0x2B', '0x2B' or 43.
+
+    Parameters
+    ----------
+    register : str or int
+        Register address.
+
+    Returns
+    -------
+    int
+        Register address.
+
+    """
+    if isinstance(register, str):
+        return int(register.strip().replace('Reg', ''), 16)
+    return int(register)
+
+
+class ResultStore:
+    """
+    The ResultStore class is a SQLite database of report results.
+
+    Every ingested result file is a run keyed by device, lot and USID. The
+    debug rows of its tests are stored with their register address,
+    trigger and mTrig setting, so failures can be queried across runs
+    without opening the reports.
+
+    Parameters
+    ----------
+    db_file : str
+        Path to the database file. It is created if it does not exist.
+
+    """
+
+    def __init__(self, db_file):
+        """
+        Instantiate the ResultStore class.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.db_file = db_file
+        # Reports of a batch are ingested from several processes.
+        self.connection = sqlite3.connect(db_file, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        with self.connection:
+            self.connection.executescript(schema)
+
+    def close(self):
+        self.connection.close()
+
+    def add_run(self, device, lot=None, usid=None, source=None):
+        """
+        Add a run, replacing an earlier run of the same device, lot and USID.
+
+        Parameters
+        ----------
+        device : str
+            Device name, as the result file name.
+        lot : str, optional
+            Lot of the device. The default is None.
+        usid : int, optional
+            USID of the device. The default is None.
+        source : str, optional
+            Path of the result file. The default is None.
+
+        Returns
+        -------
+        run_id : int
+            Key of the run.
+
+        """
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM runs WHERE device = ? AND lot IS ? AND usid IS ?',
+                (device, lot, usid))
+            cursor = self.connection.execute(
+                'INSERT INTO runs (device, lot, usid, source, ingested) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (device, lot, usid, source,
+                 datetime.now().isoformat(timespec='seconds')))
+        return cursor.lastrowid
+
+    def add_sheet(self, run_id, df, sheet_name):
+        """
+        Store the rows of a debug sheet, or of the TBYB result sheet.
+
+        Other sheets hold summaries of the debug rows and are skipped.
+
+        Parameters
+        ----------
+        run_id : int
+            Key of the run.
+        df : DataFrame
+            DataFrame of the sheet.
+        sheet_name : str
+            Name of the report sheet.
+
+        Returns
+        -------
+        None.
+
+        """
+        if sheet_name not in sheet_columns or df.empty:
+            return
+        rows = pd.DataFrame({'run_id': run_id,
+                             'test': sheet_columns[sheet_name]},
+                            index=df.index)
+        if sheet_name == 'TBYB Test':
+            rows['address'] = df['Address'].map(get_address)
+            rows['passed'] = df['TBYB Result'] == 'O'
+        else:
+            rows['address'] = df['Register Address'].map(get_address)
+            rows['trig'] = df['Trigger Register']
+            rows['passed'] = df['Trigger Test'] == 'O'
+            if 'Counter Test' in df:
+                rows['counter_passed'] = df['Counter Test'].map(
+                    {'O': 1, '---': 0})
+            rows['debug'] = df['Debug']
+        if sheet_name == 'mTrig Test Debug':
+            rows['mtrig_group'] = df['mTrig Group']
+            rows['mtrig_setting'] = df['mTrig Setting']
+            rows['mtrig_test'] = df['Test Name']
+        rows['passed'] = rows['passed'].astype(int)
+        columns = ', '.join(rows.columns)
+        marks = ', '.join('?' * len(rows.columns))
+        values = rows.astype(object).where(rows.notna(), None)
+        with self.connection:
+            self.connection.executemany(
+                f'INSERT INTO results ({columns}) VALUES ({marks})',
+                values.itertuples(index=False, name=None))
+
+    def query(self, sql, params=()):
+        """
+        Run a SQL query on the database.
+
+        Parameters
+        ----------
+        sql : str
+            Query on the runs and results tables.
+        params : tuple or dict, optional
+            Query parameters. The default is ().
+
+        Returns
+        -------
+        DataFrame
+            Query result.
+
+        """
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def get_filter(self, trig=None, register=None, test=None,
+                   mtrig_setting=None, lot=None):
+        clauses = []
+        params = []
+        for column, value in (('r.trig', trig), ('r.test', test),
+                              ('r.mtrig_setting', mtrig_setting),
+                              ('u.lot', lot)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if register is not None:
+            clauses.append('r.address = ?')
+            params.append(get_address(register))
+        where = ' AND '.join(clauses) if clauses else '1'
+        return where, params
+
+    def get_failures(self, trig=None, register=None, test=None,
+                     mtrig_setting=None, lot=None):
+        """
+        Get the failing results, optionally of one trigger and register.
+
+        A result fails when its trigger test fails or, for timed triggers,
+        when its counter readback fails.
+
+        Parameters
+        ----------
+        trig : str, optional
+            Trigger, as 'T12' or 'TC3'. The default is None.
+        register : str or int, optional
+            Register address, as 'Reg0x2B'. The default is None.
+        test : str, optional
+            Test, as 'Timed Trigger Test'. The default is None.
+        mtrig_setting : str, optional
+            mTrig setting. The default is None.
+        lot : str, optional
+            Lot. The default is None.
+
+        Returns
+        -------
+        DataFrame
+            Failing results with the device, lot and USID of their run.
+
+        """
+        where, params = self.get_filter(trig, register, test, mtrig_setting,
+                                        lot)
+        return self.query(
+            "SELECT u.device, u.lot, u.usid, r.test, "
+            "printf('0x%02X', r.address) AS register, r.trig, "
+            "r.mtrig_group, r.mtrig_setting, r.mtrig_test, r.passed, "
+            "r.counter_passed, r.debug "
+            "FROM results r JOIN runs u USING (run_id) "
+            f"WHERE ({where}) AND (r.passed = 0 OR r.counter_passed = 0) "
+            "ORDER BY u.lot, u.device, r.address", params).astype(
+                {'usid': 'Int64', 'counter_passed': 'Int64'})
+
+    def get_failing_lots(self, trig=None, register=None, test=None,
+                         mtrig_setting=None):
+        """
+        Count the tested and failing devices of every lot.
+
+        Parameters
+        ----------
+        trig : str, optional
+            Trigger, as 'T12'. The default is None.
+        register : str or int, optional
+            Register address, as 'Reg0x2B'. The default is None.
+        test : str, optional
+            Test, as 'Trigger Test'. The default is None.
+        mtrig_setting : str, optional
+            mTrig setting. The default is None.
+
+        Returns
+        -------
+        DataFrame
+            Lots with at least one failing device, with the number of
+            tested and failing devices.
+
+        """
+        where, params = self.get_filter(trig, register, test, mtrig_setting)
+        return self.query(
+            "SELECT u.lot, COUNT(DISTINCT u.run_id) AS devices, "
+            "COUNT(DISTINCT CASE WHEN r.passed = 0 OR r.counter_passed = 0 "
+            "THEN u.run_id END) AS failing "
+            "FROM results r JOIN runs u USING (run_id) "
+            f"WHERE {where} GROUP BY u.lot HAVING failing > 0 "
+            "ORDER BY failing DESC, u.lot", params)
+
+
+class RunRecorder:
+    """
+    The RunRecorder class ingests the report sheets of a run into a store.
+
+    It is passed to psv_processfile as an exporter.
+
+    Parameters
+    ----------
+    db_file : str
+        Path to the database file.
+    device : str
+        Device name, as the result file name.
+    lot : str, optional
+        Lot of the device. The default is None.
+    usid : int, optional
+        USID of the device. The default is None.
+    source : str, optional
+        Path of the result file. The default is None.
+
+    """
+
+    def __init__(self, db_file, device, lot=None, usid=None, source=None):
+        """
+        Instantiate the RunRecorder class.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.store = ResultStore(db_file)
+        self.run = (device, lot, usid,
+                    None if source is None else os.path.abspath(source))
+        self.sheets = []
+
+    def write_sheet(self, df, sheet_name):
+        self.sheets.append((df, sheet_name))
+
+    def write_raw(self, chunks):
+        return chunks
+
+    def close(self):
+        """
+        Store the run once all its sheets are written.
+
+        Returns
+        -------
+        None.
+
+        """
+        run_id = self.store.add_run(*self.run)
+        for df, sheet_name in self.sheets:
+            self.store.add_sheet(run_id, df, sheet_name)
+        self.sheets = []
+        self.store.close()
+
+    def abort(self):
+        """
+        Drop the sheets of an unfinished run and close the store.
+
+        It is called while an error is raised, so it never raises itself.
+        A run that was closed stays stored.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.sheets = []
+        try:
+            self.store.close()
+        except Exception:
+            pass
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Background jobs of the PSVerGUI window."""
+import multiprocessing
+import threading
+from time import monotonic
+
+###################################################################################################
+#   Background Jobs   #############################################################################
+###################################################################################################
+# Event posted to the job window when the worker thread ends.
+job_done = '-JOB DONE-'
+# Event posted to the job window with the (done, total, text) of a job.
+job_progress = '-JOB PROGRESS-'
+# Seconds between progress events, so a fast job does not flood the window.
+progress_interval = 0.1
+progress_steps = 1000
+# Seconds between checks for cancellation while a process runs.
+cancel_interval = 0.2
+
+
+class JobCancelled(Exception):
+    """
+    The JobCancelled exception is raised in a job the user has cancelled.
+
+    """
+
+    def __init__(self, message='Cancelled.'):
+        super().__init__(message)
+
+
+def call_in_process(func, args, kwargs):
+    # Pool workers die on SystemExit, so it is returned like any error.
+    try:
+        return True, func(*args, **kwargs)
+    except (Exception, SystemExit) as e:
+        return False, e
+
+
+class Job:
+    """
+    The Job class carries the progress and the cancellation of a job.
+
+    The worker updates the progress, which is posted to the job window. An
+    update raises JobCancelled once the user cancels, so a job stops at its
+    next update. Without a window a job only checks for cancellation.
+
+    Parameters
+    ----------
+    window : Window, optional
+        Job window the progress is posted to. The default is None.
+
+    """
+
+    def __init__(self, window=None):
+        """
+        Instantiate the Job class.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.window = window
+        self.cancelled = threading.Event()
+        self.done = 0
+        self.total = None
+        self.text = ''
+        self.posted = 0
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def update(self, done=None, total=None, text=None, force=False):
+        """
+        Update the progress of the job.
+
+        Parameters
+        ----------
+        done : int or float, optional
+            Work done, in the unit of total. The default is None.
+        total : int or float, optional
+            Work of the whole job. The default is None, which keeps the
+            total of earlier updates.
+        text : str, optional
+            Status shown above the progress bar. The default is None.
+        force : Boolean, optional
+            Flag to post the update even if the last one was posted less
+            than progress_interval ago. The default is False.
+
+        Raises
+        ------
+        JobCancelled
+            The user cancelled the job.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.check()
+        if done is not None:
+            self.done = done
+        if total is not None:
+            self.total = total
+        if text is not None:
+            self.text = text
+        now = monotonic()
+        if self.window is not None and (
+                force or now - self.posted >= progress_interval):
+            self.posted = now
+            self.window.write_event_value(job_progress,
+                                          (self.done, self.total, self.text))
+
+    def run_process(self, func, *args, **kwargs):
+        """
+        Run a function in a worker process that is killed on cancellation.
+
+        The function must be picklable, as a module level function.
+
+        Parameters
+        ----------
+        func : callable
+            Function run in the worker process.
+        *args
+            Arguments of func.
+        **kwargs
+            Keyword arguments of func.
+
+        Raises
+        ------
+        JobCancelled
+            The user cancelled the job.
+
+        Returns
+        -------
+        object
+            Return value of func.
+
+        """
+        with multiprocessing.Pool(1) as pool:
+            # Leaving the pool terminates the worker, even while it runs.
+            result = pool.apply_async(call_in_process, (func, args, kwargs))
+            while True:
+                try:
+                    ok, value = result.get(cancel_interval)
+                    break
+                except multiprocessing.TimeoutError:
+                    self.check()
+        if not ok:
+            raise value
+        return value
+
+
+def get_job_layout(message, progress):
+    import PySimpleGUI as sg
+
+    layout = [[sg.Text(message, size=(50, 1), key='-JOB TEXT-')]]
+    if progress:
+        layout += [[sg.ProgressBar(progress_steps, size=(40, 20),
+                                   key='-JOB BAR-')],
+                   [sg.Stretch(), sg.Cancel(size=(10, 1)), sg.Stretch()]]
+    return layout
+
+
+def run_job(title, func, *args, message='Working...', progress=False,
+            **kwargs):
+    """
+    Run a long function in a worker thread while a status window is shown.
+
+    The window blocks on its events, so the GUI is idle while it waits. The
+    worker posts job_done with write_event_value when it ends. An exception
+    of the function is raised again in the GUI thread.
+
+    Parameters
+    ----------
+    title : str
+        Title of the status window.
+    func : callable
+        Function run in the worker. It must not open windows of its own.
+    *args
+        Arguments of func.
+    message : str, optional
+        Status shown while func runs. The default is 'Working...'.
+    progress : Boolean, optional
+        Flag to show a progress bar and a Cancel button. func is then passed
+        the Job as the keyword job. The default is False.
+    **kwargs
+        Keyword arguments of func.
+
+    Raises
+    ------
+    JobCancelled
+        The user cancelled the job.
+
+    Returns
+    -------
+    object
+        Return value of func.
+
+    """
+    import PySimpleGUI as sg
+
+    outcome = {}
+
+    def work():
+        try:
+            outcome['result'] = func(*args, **kwargs)
+        except (Exception, SystemExit) as e:
+            outcome['error'] = e
+        window.write_event_value(job_done, None)
+
+    window = sg.Window(title, get_job_layout(message, progress),
+                       disable_close=True, finalize=True)
+    job = Job(window)
+    if progress:
+        kwargs['job'] = job
+    worker = threading.Thread(target=work, daemon=True)
+    worker.start()
+    while True:
+        event, values = window.read()
+        # A destroyed window returns None at once, so wait on the worker.
+        if event in (job_done, None):
+            break
+        if event == job_progress:
+            done, total, text = values[job_progress]
+            if total:
+                window['-JOB BAR-'].update(
+                    int(progress_steps * min(done / total, 1)))
+            window['-JOB TEXT-'].update(text)
+        elif event == 'Cancel':
+            job.cancel()
+            window['-JOB TEXT-'].update('Cancelling...')
+            window['Cancel'].update(disabled=True)
+    window.close()
+    worker.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
@@ -5,12 +5,24 @@ Created on Wed Apr 29 16:17:20 2020.
 @author: joslaton
 """
 
-import PySimpleGUI as sg
+import numpy as np
 import pandas as pd
+import hashlib
+import json
+import os
+import posixpath
+import re
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from xml.etree.ElementTree import iterparse
 from zipfile import ZipFile
 from xmltodict import parse
 
+from psv_jobs import JobCancelled, run_job
+from psv_trace import tracer
+
 
 ###################################################################################################
 #   MRD Gen Module   ##############################################################################
@@ -41,14 +53,27 @@ import_cols = {'standard': ['Register Class',
                             'Triggered',
                             'Mask-Write Support',
                             'TBYB']}
+xlsx_ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+# Cell strings that pandas.read_excel treats as missing by default.
+xlsx_na_strings = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN',
+                   '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA',
+                   'NULL', 'NaN', 'n/a', 'nan', 'null'}
+# Bump whenever a change to the import or the MRD engine alters its output,
+# so that cached register maps from older versions are not reused.
+cache_version = 2
+cache_max_size = 256 * 2**20
 
 
 # Class Definition
 
 
-class Register:
+class RegisterMap:
     """
-    The Register class holds all information needed for a register.
+    The RegisterMap class holds all information needed for the 256 registers.
+
+    Each field is stored in a fixed-width typed array indexed by address.
+    The MRD strings are only rendered when the map is exported, except for
+    the Value, which keeps the digits and case the PRD gave it.
 
     Parameters
     ----------
@@ -56,407 +81,507 @@ class Register:
 
     """
 
-    def __init__(self, address):
-        """
-        Instantiate the Register class.
+    flag_names = ['RZW', 'RW', 'ERW', 'MRW', 'RR', 'ERR', 'RST',
+                  'BSID', 'GSID1', 'GSID2']
 
-        Parameters
-        ----------
-        address : STRING
-            HEX STRING with the format '0x01', '0x0A' etc.
+    def __init__(self):
+        """
+        Instantiate the RegisterMap class.
 
         Returns
         -------
         None.
 
         """
-        self.d = {}
-        self.d['Name'] = ''
-        self.d['Address'] = address
-        self.d['Value'] = '---'
-        self.d['D7'] = '-'
-        self.d['D6'] = '-'
-        self.d['D5'] = '-'
-        self.d['D4'] = '-'
-        self.d['D3'] = '-'
-        self.d['D2'] = '-'
-        self.d['D1'] = '-'
-        self.d['D0'] = '-'
-        self.d['Trig N'] = '-'
-        self.d['RZW'] = '-' if address != '0x00' else 'O'
-        self.d['RW'] = '-'
-        self.d['ERW'] = '-'
-        self.d['MRW'] = '-'
-        self.d['RR'] = '-'
-        self.d['ERR'] = '-'
-        self.d['RST'] = '-'
-        self.d['BSID'] = '-'
-        self.d['GSID1'] = '-'
-        self.d['GSID2'] = '-'
-
-    def set_name(self, df_slice):
+        self.implemented = np.zeros(256, dtype=bool)
+        self.name = np.full(256, '', dtype=object)
+        # Value as written to the MRD and the bits of its low byte, which
+        # are 0 for bits given as 'x' in the PRD.
+        self.value_text = np.full(256, '---', dtype=object)
+        self.value = np.zeros(256, dtype=np.uint8)
+        self.trig = np.full(256, '-', dtype='<U2')
+        # One bit per entry of flag_names.
+        self.flags = np.zeros(256, dtype=np.uint16)
+        self.flags[0] = self.flag_mask('RZW')
+        # Per-bit access codes packed one register per byte.
+        self.writable = np.zeros(256, dtype=np.uint8)
+        self.reserved = np.zeros(256, dtype=np.uint8)
+
+    def flag_mask(self, flag):
         """
-        Set the register name.
+        Get the bit mask of a flag.
 
         Parameters
         ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+        flag : str
+            Name of the flag such as 'ERW'.
 
         Returns
         -------
-        None.
+        mask : int
+            Bit mask of the flag in the flags array.
 
         """
-        if self.d['Address'] < '0x80':
-            a = [el for el in df_slice['Register name'].tolist() if
-                 type(el) == str]
-            if a:
-                self.d['Name'] = a[0]
-        else:
-            a = [el for el in df_slice['Register Name'].tolist() if
-                 type(el) == str]
-            if a:
-                self.d['Name'] = a[0]
+        return 1 << self.flag_names.index(flag)
 
-    def set_dv(self, df_slice):
+    def set_registers(self, addresses, fields):
         """
-        Set the Value.
+        Set the fields of implemented registers.
 
         Parameters
         ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+        addresses : list
+            List containing the addresses of the registers as hex strings.
+        fields : dict
+            Dictionary containing an entry per register for 'Name', 'Value',
+            'Trig N' and the flags other than 'RZW', as well as boolean
+            arrays of shape
+            (registers, 8) for the 'Writable' and 'Reserved' bits.
 
         Returns
         -------
         None.
 
         """
-        dv = ''.join([el for el in df_slice['Default'].tolist() if
-                      type(el) == str])
-        if self.d['Address'] < '0x80':
-            try:
-                if dv[1] in ['x', 'X']:
-                    self.d['Value'] = dv.replace('X', 'x')
-                else:
-                    dv = int(dv, 2)
-                    self.d['Value'] = f'0x{dv:2X}'.replace(' ', '0')
-            except ValueError:
-                raise Exception(f"Register {self.d['Address']} has an invalid"
-                                f" default value of \"{dv}\"."
-                                "\nOnly numeric values are accepted."
-                                " Please change the value in Excel and try again.")
-        else:
-            try:
-                assert len(dv) == 4
-                self.d['Value'] = dv.replace('X', 'x')
-            except AssertionError:
-                raise Exception(f"Register {self.d['Address']} has an invalid"
-                                f" default value of \"{dv}\"."
-                                "\nOnly numeric values are accepted."
-                                " Please change the value in Excel and try again.")
-
-    def set_trign(self, df_slice):
+        if not len(addresses):
+            return
+        idx = np.array([int(el, 16) for el in addresses])
+        values, _, _ = parse_values(fields['Value'])
+        self.implemented[idx] = True
+        self.name[idx] = np.asarray(fields['Name'], dtype=object)
+        self.value_text[idx] = np.asarray(fields['Value'], dtype=object)
+        self.value[idx] = values
+        self.trig[idx] = np.asarray(fields['Trig N'])
+        flags = self.flags[idx]
+        for flag in self.flag_names:
+            if flag in fields:
+                flags[np.asarray(fields[flag], dtype=bool)] |= \
+                    self.flag_mask(flag)
+        self.flags[idx] = flags
+        self.writable[idx] = np.packbits(fields['Writable'], axis=1,
+                                         bitorder='little')[:, 0]
+        self.reserved[idx] = np.packbits(fields['Reserved'], axis=1,
+                                         bitorder='little')[:, 0]
+
+    def clear_registers(self, addresses):
         """
-        Set the trigger.
+        Reset registers to the not implemented state.
 
         Parameters
         ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+        addresses : list
+            List containing the addresses of the registers as hex strings.
 
         Returns
         -------
         None.
 
         """
-        if self.d['Address'] < '0x80':
-            a = [el for el in df_slice['Active Trigger '].tolist() if
-                 type(el) == str]
-            if a:
-                a = a[0]
-                a = a[0] + a[-1] if a[0] != 'E' else 'T' + a[-1]
-                self.d['Trig N'] = a
-        else:
-            a = [el for el in df_slice['Triggered'].tolist() if
-                 type(el) == str]
-            if a:
-                if a[0] not in ['N', 'n', 'No']:
-                    a = a[0]
-                    a = a[0] + a[-1] if a[0] != 'E' else 'T' + a[-1]
-                    self.d['Trig N'] = a
-
-    def set_rw(self, df_slice):
+        idx = np.array([int(el, 16) for el in addresses], dtype=int)
+        self.implemented[idx] = False
+        self.name[idx] = ''
+        self.value_text[idx] = '---'
+        self.value[idx] = 0
+        self.trig[idx] = '-'
+        self.flags[idx] = np.where(idx == 0, self.flag_mask('RZW'), 0)
+        self.writable[idx] = 0
+        self.reserved[idx] = 0
+
+    def load_df(self, df):
         """
-        Set the register write field.
+        Load the register map from an MRD DataFrame.
 
         Parameters
         ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+        df : DataFrame
+            DataFrame containing MRD as written by save_mrd.
 
         Returns
         -------
         None.
 
         """
-        if self.d['Address'] < '0x80':
-            a = [el for el in df_slice['R/W'].tolist() if type(el) == str]
-            if all([any(['R/W' in a, 'W' in a]), self.d['Address'] < '0x20']):
-                self.d['RW'] = 'O'
-        else:
-            pass
-
-    def set_rr(self, df_slice):
+        idx = np.array([int(el, 16) for el in df['Address']])
+        values = df['Value'].to_numpy(dtype=str)
+        self.implemented[idx] = values != '---'
+        self.name[idx] = df['Name'].to_numpy(dtype=object)
+        ints, _, _ = parse_values(values)
+        self.value_text[idx] = values.astype(object)
+        self.value[idx] = ints
+        self.trig[idx] = df['Trig N'].to_numpy(dtype=str)
+        flags = np.zeros(len(df), dtype=np.uint16)
+        for flag in self.flag_names:
+            flags[df[flag].to_numpy() == 'O'] |= self.flag_mask(flag)
+        self.flags[idx] = flags
+        bits = np.stack([df[f'D{i}'].to_numpy(dtype=str) for i in range(8)],
+                        axis=1)
+        self.writable[idx] = np.packbits(bits == 'R/W', axis=1,
+                                         bitorder='little')[:, 0]
+        self.reserved[idx] = np.packbits(np.isin(bits, ['R0', 'R1']), axis=1,
+                                         bitorder='little')[:, 0]
+
+    def get_values(self):
         """
-        Set the register read field.
-
-        Parameters
-        ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+        Render the Value field of all registers.
 
         Returns
         -------
-        None.
+        values : ndarray
+            Array containing strings such as '0x1F', '0x5a', '0x1x' or '---'.
 
         """
-        if self.d['Address'] < '0x20':
-            a = [el for el in df_slice['R/W'].tolist() if type(el) == str]
-            if any(['R/W' in a, 'R' in a]):
-                self.d['RR'] = 'O'
-        else:
-            pass
+        return np.where(self.implemented, self.value_text, '---')
 
-    def set_erw(self, df_slice):
+    def get_bits(self):
         """
-        Set the extended register write field.
-
-        Parameters
-        ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+        Render the D0 to D7 fields of all registers.
 
         Returns
         -------
-        None.
+        bits : dict
+            Dictionary containing an array of strings for each of the
+            fields 'D7' to 'D0'.
 
         """
-        if self.d['Address'] < '0x80':
-            a = [el for el in df_slice['R/W'].tolist() if type(el) == str]
-            b = [el for el in df_slice['Extended Register R/W'].tolist() if
-                 type(el) == str]
-            if all([any(['R/W' in a, 'W' in a]), 'Yes' in b]):
-                self.d['ERW'] = 'O'
-        else:
-            a = [el for el in df_slice['TBYB'].tolist() if type(el) == str]
-            b = list(set([el for el in df_slice['Register Name'].tolist() if
-                          type(el) == str]))
-            if all([a, b]):
-                if all([a[0] in ['N', 'No'],
-                        b[0].lower() not in ['sirev_id']]):
-                    self.d['ERW'] = 'O'
-
-    def set_err(self, df_slice):
+        bits = {}
+        for i in range(7, -1, -1):
+            writable = (self.writable >> i) & 1
+            reserved = (self.reserved >> i) & 1
+            value = (self.value >> i) & 1
+            bits[f'D{i}'] = np.where(
+                ~self.implemented, '-',
+                np.where(writable, 'R/W',
+                         np.where(reserved,
+                                  np.where(value, 'R1', 'R0'),
+                                  'R')))
+        return bits
+
+    def to_df(self):
         """
-        Set the extended register read field.
-
-        Parameters
-        ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+        Export the register map as an MRD DataFrame.
 
         Returns
         -------
-        None.
+        register_df : DataFrame
+            DataFrame containing MRD.
 
         """
-        if self.d['Address'] < '0x80':
-            a = [el for el in df_slice['R/W'].tolist() if type(el) == str]
-            b = [el for el in df_slice['Extended Register R/W'].tolist() if
-                 type(el) == str]
-            if all([any(['R/W' in a, 'R' in a]), 'Yes' in b]):
-                self.d['ERR'] = 'O'
-        else:
-            self.d['ERR'] = 'O'
+        d = {'Name': self.name,
+             'Address': [f'0x{el:02X}' for el in range(256)],
+             'Value': self.get_values(),
+             **self.get_bits(),
+             'Trig N': self.trig}
+        for flag in self.flag_names:
+            d[flag] = np.where(self.flags & self.flag_mask(flag), 'O', '-')
+        register_df = pd.DataFrame(d)
+        return register_df.astype(object)
 
-    def set_mrw(self, df_slice):
-        """
-        Set the extended register write field.
 
-        Parameters
-        ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+# Function Definition
+def get_sheet_ids(file_path):
+    with ZipFile(file_path, 'r') as zip_ref:
+        sheet_names = list(get_sheet_parts(zip_ref).keys())
+    return sheet_names
 
-        Returns
-        -------
-        None.
 
-        """
-        if self.d['Address'] < '0x80':
-            a = [el for el in df_slice['R/W'].tolist() if type(el) == str]
-            b = [el for el in df_slice['Masked Write Support'].tolist() if
-                 type(el) == str]
-            if all([any(['R/W' in a, 'W' in a]), 'Yes' in b]):
-                self.d['MRW'] = 'O'
-        else:
-            a = [el for el in df_slice['TBYB'].tolist() if type(el) == str]
-            if a:
-                if a[0] in ['N', 'No']:
-                    b = [el for el in df_slice['Mask-Write Support'] if
-                         type(el) == str]
-                    if b:
-                        if b[0] not in ['N', 'No']:
-                            self.d['MRW'] = 'O'
-
-    def set_bgg(self, df_slice):
-        """
-        Set the BSID/GSID1/GSID2 write field.
+def get_sheet_parts(zip_ref):
+    """
+    Locate the XML part of each sheet in an open XLSX archive.
 
-        Parameters
-        ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+    Parameters
+    ----------
+    zip_ref : ZipFile
+        Open XLSX archive.
 
-        Returns
-        -------
-        None.
+    Returns
+    -------
+    sheet_parts : dict
+        Dictionary mapping sheet names, in workbook order, to part paths.
 
-        """
-        if self.d['Address'] < '0x80':
-            a = [el for el in df_slice['R/W'].tolist() if type(el) == str]
-            b = [el for el in df_slice[
-                'Broadcast Slave ID and Group Slave ID Support'] if
-                type(el) == str]
-            if all([any(['R/W' in a, 'W' in a]), 'Yes' in b]):
-                self.d['BSID'] = 'O'
-                self.d['GSID1'] = 'O'
-                self.d['GSID2'] = 'O'
+    """
+    workbook = parse(zip_ref.open(r'xl/workbook.xml').read())['workbook']
+    rels = parse(zip_ref.open(r'xl/_rels/workbook.xml.rels').read())
+    rels = rels['Relationships']['Relationship']
+    if not isinstance(rels, list):
+        rels = [rels]
+    targets = {}
+    for rel in rels:
+        target = rel['@Target']
+        if target.startswith('/'):
+            target = target[1:]
         else:
-            pass
+            target = 'xl/' + target
+        targets[rel['@Id']] = posixpath.normpath(target)
+    sheets = workbook['sheets']['sheet']
+    if not isinstance(sheets, list):
+        sheets = [sheets]
+    sheet_parts = {}
+    for sheet in sheets:
+        rid = [v for k, v in sheet.items() if k.endswith(':id')][0]
+        sheet_parts[sheet['@name']] = targets[rid]
+    return sheet_parts
+
+
+def get_shared_strings(zip_ref):
+    """
+    Read the shared-strings table of an open XLSX archive.
 
-    def set_rst(self, df_slice):
-        """
-        Set the RST field.
+    Parameters
+    ----------
+    zip_ref : ZipFile
+        Open XLSX archive.
 
-        Parameters
-        ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+    Returns
+    -------
+    shared_strings : list
+        List containing the shared strings in table order.
 
-        Returns
-        -------
-        None.
+    """
+    shared_strings = []
+    if r'xl/sharedStrings.xml' not in zip_ref.namelist():
+        return shared_strings
+    with zip_ref.open(r'xl/sharedStrings.xml') as f:
+        for _, elem in iterparse(f):
+            if elem.tag != xlsx_ns + 'si':
+                continue
+            # Join the text of rich text runs but skip phonetic runs.
+            text = [elem.find(xlsx_ns + 't')]
+            text += [el.find(xlsx_ns + 't')
+                     for el in elem.findall(xlsx_ns + 'r')]
+            shared_strings.append(''.join([el.text or '' for el in text
+                                           if el is not None]))
+            elem.clear()
+    return shared_strings
+
+
+def get_column_index(ref):
+    """
+    Convert a cell reference such as 'AB12' into a zero based column index.
 
-        """
-        if self.d['Address'] < '0x80':
-            a = self.d['ERW'] == 'O'
-            b = self.d['ERR'] == 'O'
-            c = [el for el in df_slice['Register Class'].tolist() if
-                 type(el) == str]
-            d = 'RFFE Reserved'
-            if all([a, b, d not in c]):
-                self.d['RST'] = 'O'
-        else:
-            if self.d['ERW'] == 'O':
-                self.d['RST'] = 'O'
+    Parameters
+    ----------
+    ref : str
+        Cell reference.
 
-    def set_bits(self, df_slice):
-        """
-        Set the DX fields.
+    Returns
+    -------
+    index : int
+        Zero based column index.
 
-        Parameters
-        ----------
-        df_slice : dataframe
-            A dataframe limited to the current address.
+    """
+    index = 0
+    for el in ref:
+        if el.isdigit():
+            break
+        index = index * 26 + ord(el.upper()) - 64
+    return index - 1
 
-        Returns
-        -------
-        None.
 
-        """
-        for i in range(8):
-            self.d[f'D{i}'] = 'R'
-        a = [el.strip('[]') for el in df_slice['Data Bits'].tolist() if
-             type(el) == str]
-        if self.d['Address'] < '0x80':
-            b = [el for el in df_slice['Bit Name'].tolist() if
-                 type(el) == str]
-            c = [el for el in df_slice['R/W'].tolist() if type(el) == str]
-            sb_dict = dict(zip(a, b))
-            reserved_dict = {}
-            # Expand the '7:5' style data bits until each bit is represented.
-            for k in sb_dict.keys():
-                if ':' in k:
-                    hi_dex = int(k[0]) + 1
-                    lo_dex = int(k[-1])
-                    for i in range(lo_dex, hi_dex):
-                        reserved_dict[f"{i}"] = sb_dict[k]
-                else:
-                    reserved_dict[k] = sb_dict[k]
-            # Now must become boolean
-            for k in reserved_dict.keys():
-                reserved_dict[k] = 'reserved' in reserved_dict[k].lower()
-                if 'R' in c:
-                    reserved_dict[k] = True
-                if reserved_dict[k]:
-                    try:
-                        val = int(self.d['Value'], 16)
-                    except ValueError:
-                        print(f"Default value at Register {self.d['Address']}"
-                              " is invalid.\n")
-                        sys.exit(1)
-                    self.d[f'D{k}'] += f'{val:008b}'[-1::-1][int(k)]
-                else:
-                    self.d[f'D{k}'] += '/W'
-        else:
-            b = [el for el in df_slice['Function'].tolist() if
-                 type(el) == str]
-            c = [el for el in df_slice['TBYB'].tolist() if type(el) == str]
-            sb_dict = dict(zip(a, b))
-            # Need to expand because sometimes not all bits are implemented.
-            reserved_dict = {'0': 'RESERVED', '1': 'RESERVED',
-                             '2': 'RESERVED', '3': 'RESERVED',
-                             '4': 'RESERVED', '5': 'RESERVED',
-                             '6': 'RESERVED', '7': 'RESERVED'}
-            # Expand the '7:5' style data bits until each bit is represented.
-            for k in sb_dict.keys():
-                if ':' in k:
-                    hi_dex = int(k[0]) + 1
-                    lo_dex = int(k[-1])
-                    for i in range(lo_dex, hi_dex):
-                        reserved_dict[f"{i}"] = sb_dict[k]
-                else:
-                    reserved_dict[k] = sb_dict[k]
-            # Now must become boolean
-            for k in reserved_dict.keys():
-                reserved_dict[k] = any(['reserved' in reserved_dict[k].lower(),
-                                        'y' in c[0].lower()])
-                if reserved_dict[k]:
-                    val = int(self.d['Value'], 16)
-                    self.d[f'D{k}'] += f'{val:008b}'[-1::-1][int(k)]
+def iter_sheet_rows(zip_ref, sheet_part, shared_strings):
+    """
+    Stream the rows of a sheet from an open XLSX archive.
+
+    Parameters
+    ----------
+    zip_ref : ZipFile
+        Open XLSX archive.
+    sheet_part : str
+        Path of the sheet XML part within the archive.
+    shared_strings : list
+        List containing the shared strings of the workbook.
+
+    Yields
+    ------
+    row : int
+        Zero based row number.
+    cells : dict
+        Dictionary mapping zero based column indices to cell values.
+
+    """
+    row_tag = xlsx_ns + 'row'
+    cell_tag = xlsx_ns + 'c'
+    row_num = -1
+    with zip_ref.open(sheet_part) as f:
+        sheet_data = None
+        for event, elem in iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == xlsx_ns + 'sheetData':
+                    sheet_data = elem
+                continue
+            if elem.tag != row_tag:
+                continue
+            row_num = int(elem.get('r', row_num + 2)) - 1
+            cells = {}
+            col = -1
+            for c in elem.iter(cell_tag):
+                col = get_column_index(c.get('r')) if c.get('r') else col + 1
+                typ = c.get('t', 'n')
+                if typ == 'inlineStr':
+                    value = ''.join([el.text or '' for el in
+                                     c.iter(xlsx_ns + 't')])
                 else:
-                    self.d[f'D{k}'] += '/W'
+                    v = c.find(xlsx_ns + 'v')
+                    if v is None or v.text is None:
+                        continue
+                    value = v.text
+                    if typ == 's':
+                        value = shared_strings[int(value)]
+                    elif typ == 'b':
+                        value = value == '1'
+                    elif typ == 'e':
+                        continue
+                    elif typ == 'n':
+                        value = float(value)
+                        if value.is_integer():
+                            value = int(value)
+                if isinstance(value, str) and value in xlsx_na_strings:
+                    continue
+                cells[col] = value
+            # Drop parsed rows so memory stays flat on large sheets.
+            if sheet_data is not None:
+                sheet_data.clear()
+            yield row_num, cells
+
+
+def convert_numeric(values):
+    """
+    Convert a column to numbers when every entry is numeric.
 
+    Parameters
+    ----------
+    values : list
+        List containing the cell values of a column.
 
-# Function Definition
-def get_sheet_ids(file_path):
-    sheet_names = []
-    with ZipFile(file_path, 'r') as zip_ref:
-        xml = zip_ref.open(r'xl/workbook.xml').read()
-        dictionary = parse(xml)
+    Returns
+    -------
+    values : list
+        List containing the converted cell values.
 
-        if not isinstance(dictionary['workbook']['sheets']['sheet'], list):
-            sheet_names.append(dictionary['workbook']['sheets']['sheet']['@name'])
-        else:
-            for sheet in dictionary['workbook']['sheets']['sheet']:
-                sheet_names.append(sheet['@name'])
-    return sheet_names
+    """
+    converted = []
+    for el in values:
+        if isinstance(el, str):
+            try:
+                el = float(el)
+            except ValueError:
+                return values
+            if el.is_integer():
+                el = int(el)
+        elif isinstance(el, bool):
+            return values
+        converted.append(el)
+    return converted
+
+
+def read_sheet(zip_ref, sheet_part, shared_strings, usecols):
+    """
+    Read selected columns of a sheet from an open XLSX archive.
+
+    The first row containing data is used as the header.
+
+    Parameters
+    ----------
+    zip_ref : ZipFile
+        Open XLSX archive.
+    sheet_part : str
+        Path of the sheet XML part within the archive.
+    shared_strings : list
+        List containing the shared strings of the workbook.
+    usecols : list
+        List containing the names of the columns to read.
+
+    Returns
+    -------
+    df : DataFrame
+        DataFrame containing the selected columns.
+
+    """
+    header = None
+    index = []
+    data = {el: [] for el in usecols}
+    for row_num, cells in iter_sheet_rows(zip_ref, sheet_part, shared_strings):
+        if header is None:
+            if not cells:
+                continue
+            header = row_num
+            names = {}
+            for col, name in sorted(cells.items()):
+                names.setdefault(name, col)
+            missing = [el for el in usecols if el not in names]
+            if missing:
+                raise ValueError('Usecols do not match columns, columns'
+                                 f' expected but not found: {missing}')
+            cols = {el: names[el] for el in usecols}
+            continue
+        values = {k: cells[v] for k, v in cols.items() if v in cells}
+        if not values:
+            continue
+        index.append(row_num - header - 1)
+        for k in usecols:
+            data[k].append(values.get(k, np.nan))
+    if header is None:
+        raise ValueError('No columns to parse from file')
+    for k in usecols:
+        numbers = convert_numeric([el for el in data[k] if el is not np.nan])
+        if numbers and not isinstance(numbers[0], str):
+            numbers = iter(numbers)
+            data[k] = [el if el is np.nan else next(numbers)
+                       for el in data[k]]
+    return pd.DataFrame(data, index=index, columns=usecols)
+
+
+def read_register_sheets(prd_file, standard_sheet, extended_sheet):
+    """
+    Read the register map sheets from a PRD with one pass over the archive.
+
+    Only the two selected sheet parts and the shared-strings table are
+    parsed, and only the import_cols columns are kept.
+
+    Parameters
+    ----------
+    prd_file : str
+        string path to file containing register map sheets.
+    standard_sheet : str
+        string name of standard register map sheet.
+    extended_sheet : str
+        string name of extended register map sheet.
+
+    Returns
+    -------
+    s_df : DataFrame
+        DataFrame containing the raw standard register map.
+    e_df : DataFrame
+        DataFrame containing the raw extended register map.
+
+    """
+    try:
+        zip_ref = ZipFile(prd_file, 'r')
+    except Exception as e:
+        print(e)
+        raise Exception(f"Unable to import {standard_sheet} as standard register map.\n"
+                        f"Please ensure that {standard_sheet} is properly formatted as a table.")
+    with zip_ref:
+        try:
+            sheet_parts = get_sheet_parts(zip_ref)
+            shared_strings = get_shared_strings(zip_ref)
+            s_df = read_sheet(zip_ref, sheet_parts[standard_sheet],
+                              shared_strings, import_cols['standard'])
+        except Exception as e:
+            print(e)
+            raise Exception(f"Unable to import {standard_sheet} as standard register map.\n"
+                            f"Please ensure that {standard_sheet} is properly formatted as a table.")
+        try:
+            e_df = read_sheet(zip_ref, sheet_parts[extended_sheet],
+                              shared_strings, import_cols['extended'])
+        except Exception:
+            raise Exception(f"Unable to import {extended_sheet} as extended register map.\n"
+                            f"Please ensure that {extended_sheet} is properly formatted as a table.")
+    return s_df, e_df
 
 
 def get_register_sheets(sheet_names):
+    import PySimpleGUI as sg
+
     frame1_layout = [[sg.Text('Standard Register Sheet', size=(20,1)), sg.Combo(sheet_names, default_value=sheet_names[0], size=(70, 1), key='-STD-', readonly=True)],
                     [sg.Text('Extended Register Sheet', size=(20,1)), sg.Combo(sheet_names, default_value=sheet_names[1], size=(70, 1), key='-EXT-', readonly=True)]]
     frame2_layout = [[sg.Ok(size=(10, 1)), sg.Cancel(size=(10, 1))]]
@@ -545,138 +670,1240 @@ def get_implemented_registers(s_df, e_df):
     return implemented_registers
 
 
-def populate_register_fields(s_df, e_df, implemented_registers, register_pack):
+class AddressGroups:
     """
-    Populate the register fields for implemented registers.
+    The AddressGroups class groups the rows of a register map by address.
+
+    The register address column is encoded once so that every field can be
+    computed over whole columns instead of per register slice.
 
     Parameters
     ----------
-    s_df : DataFrame
-        DataFrame containing information on the standard registers.
-    e_df : DataFrame
-        DataFrame containing information on the extended registers.
-    implemented_registers : list
-        List containing the addresses of implemented registers.
-    register_pack : list
-        List containing Register objects for all registers.
+    df : DataFrame
+        DataFrame containing a conditioned register map.
+    addresses : list
+        List containing the unique addresses of the registers to group.
+
+    """
+
+    def __init__(self, df, addresses):
+        """
+        Instantiate the AddressGroups class.
+
+        Parameters
+        ----------
+        df : DataFrame
+            DataFrame containing a conditioned register map.
+        addresses : list
+            List containing the unique addresses of the registers to group.
+
+        Returns
+        -------
+        None.
+
+        """
+        codes = pd.Index(addresses).get_indexer(df['Register Address (Hex.)'])
+        self.addresses = addresses
+        self.df = df[codes >= 0]
+        self.codes = codes[codes >= 0]
+
+    def strings(self, column):
+        """
+        Collect the string entries of a column.
+
+        Parameters
+        ----------
+        column : str
+            Name of the column to collect.
+
+        Returns
+        -------
+        codes : ndarray
+            Array containing the register position of each entry.
+        values : ndarray
+            Array containing the string entries in row order.
+
+        """
+        values = self.df[column].values
+        mask = np.array([type(el) == str for el in values], dtype=bool)
+        return self.codes[mask], values[mask]
+
+    def first(self, column):
+        """
+        Get the first string entry of a column for each register.
+
+        Parameters
+        ----------
+        column : str
+            Name of the column to collect.
+
+        Returns
+        -------
+        first : Series
+            Series indexed by address. Registers without an entry are NaN.
+
+        """
+        codes, values = self.strings(column)
+        first = np.full(len(self.addresses), np.nan, dtype=object)
+        codes, idx = np.unique(codes, return_index=True)
+        first[codes] = values[idx]
+        return pd.Series(first, index=self.addresses)
+
+    def joined(self, column):
+        """
+        Join the string entries of a column for each register.
+
+        Parameters
+        ----------
+        column : str
+            Name of the column to collect.
+
+        Returns
+        -------
+        joined : Series
+            Series indexed by address containing the joined strings.
+
+        """
+        codes, values = self.strings(column)
+        joined = pd.Series(values).groupby(codes).agg(''.join)
+        return pd.Series(joined.reindex(range(len(self.addresses))
+                                        ).fillna('').values,
+                         index=self.addresses)
+
+    def any(self, column, values):
+        """
+        Flag the registers for which a column contains any of values.
+
+        Parameters
+        ----------
+        column : str
+            Name of the column to search.
+        values : list
+            List of strings to search for.
+
+        Returns
+        -------
+        flags : ndarray
+            Boolean array with one entry per register.
+
+        """
+        hits = self.df[column].isin(values).values
+        return np.bincount(self.codes[hits],
+                           minlength=len(self.addresses)) > 0
+
+
+def get_positions(codes):
+    """
+    Number the entries of each register in row order.
+
+    Parameters
+    ----------
+    codes : ndarray
+        Array containing the register position of each entry.
 
     Returns
     -------
-    register_pack : list
-        List containing Register objects for all registers.
+    positions : ndarray
+        Array containing the position of each entry within its register.
 
     """
-    for address in implemented_registers:
-        if address < '0x80':
-            df_slice = s_df[
-                s_df['Register Address (Hex.)'] == address
-                ]
-        else:
-            df_slice = e_df[
-                e_df['Register Address (Hex.)'] == address
-                ]
-        register_pack[address].set_name(df_slice)
-        register_pack[address].set_dv(df_slice)
-        register_pack[address].set_trign(df_slice)
-        register_pack[address].set_rw(df_slice)
-        register_pack[address].set_rr(df_slice)
-        register_pack[address].set_erw(df_slice)
-        register_pack[address].set_err(df_slice)
-        register_pack[address].set_mrw(df_slice)
-        register_pack[address].set_bgg(df_slice)
-        register_pack[address].set_rst(df_slice)
-        register_pack[address].set_bits(df_slice)
-    return register_pack
-
-
-def get_register_df(prd_file, standard_sheet, extended_sheet):
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes) if len(codes) else np.array([], dtype=int)
+    starts = np.cumsum(counts) - counts
+    positions = np.empty(len(codes), dtype=int)
+    positions[order] = np.arange(len(codes)) - np.repeat(starts, counts)
+    return positions
+
+
+def get_trigger_names(triggers):
     """
-    Import the register maps and construct the MRD DataFrame.
+    Convert PRD trigger entries into MRD trigger names.
 
     Parameters
     ----------
-    prd_file : str
-        string path to file containing register map sheets.
-    standard_sheet : str
-        string name of standard register map sheet.
-    extended_sheet : str
-        string name of extended register map sheet.
+    triggers : Series
+        Series containing the PRD trigger entries.
 
     Returns
     -------
-    register_df : DataFrame
-        DataFrame containing MRD.
-    usid : int
-        Base 10 integer value of device USID.
+    names : Series
+        Series containing names such as 'T0' or 'MA'. Empty entries are '-'.
 
     """
-    # Import the PRD Register Maps.
-    try:
-        s_df = pd.read_excel(prd_file,
-                            sheet_name=standard_sheet,
-                            header=0,
-                            usecols=import_cols['standard'])
-    except Exception as e:
-        print(e)
-        raise Exception(f"Unable to import {standard_sheet} as standard register map.\n"
-                        f"Please ensure that {standard_sheet} is properly formatted as a table.")
-    try:
-        e_df = pd.read_excel(prd_file,
-                            sheet_name=extended_sheet,
-                            header=0,
-                            usecols=import_cols['extended'])
-    except:
-        raise Exception(f"Unable to import {extended_sheet} as extended register map.\n"
-                        f"Please ensure that {extended_sheet} is properly formatted as a table.")    
-    s_df = condition_df(s_df)
-    e_df = condition_df(e_df, ext=True)
-    implemented_registers = get_implemented_registers(s_df, e_df)
-    # Initialize reg_lst
-    reg_lst = [f'0x{el:02X}' for el in range(256)]
-    # Create empty register dict
-    register_pack = {el: Register(el) for el in reg_lst}
-    # Populate register fields
-    register_pack = populate_register_fields(s_df,
-                                             e_df,
-                                             implemented_registers,
-                                             register_pack)
-    # Construct output from register pack dictionaries
-    register_df = pd.DataFrame([register.d for register
-                                in register_pack.values()])
-    # usid sets the USID used during testing.
-    usid = register_df.query('Address == "0x1F"')['Value'].values.tolist()
-    usid = usid[0][3]
-    usid = int(usid, 16)
-    return register_df, usid
+    head = triggers.str[0]
+    head = head.where(head != 'E', 'T')
+    return (head + triggers.str[-1]).fillna('-')
 
 
-def save_mrd(df, output_file):
+def get_bit_names(groups, name_column):
     """
-    Save the MRD DataFrame to the output_file path.
+    Map each data bit of each register to the name of its field.
+
+    Data bit entries are paired with name entries in order, as zip would.
+    Fields spanning several bits, such as '[7:5]', are expanded so that each
+    bit is represented, and the last field listed for a bit wins.
 
     Parameters
     ----------
-    df : DataFrame
-        DataFrame containing the MRD.
-    output_file : str
-        String path to which MRD will be saved.
+    groups : AddressGroups
+        Rows of the register map grouped by register address.
+    name_column : str
+        Name of the column containing the field names.
 
     Returns
     -------
-    None.
+    listed : ndarray
+        Boolean array of shape (registers, 8) flagging named bits.
+    reserved : ndarray
+        Boolean array of shape (registers, 8) flagging reserved bits.
 
     """
-    df.to_csv(path_or_buf=output_file, index=False)
+    n = len(groups.addresses)
+    b_codes, keys = groups.strings('Data Bits')
+    n_codes, names = groups.strings(name_column)
+    # Pair the n-th data bit entry with the n-th name entry of a register.
+    width = max(len(b_codes), len(n_codes)) + 1
+    b_ids = b_codes * width + get_positions(b_codes)
+    n_ids = n_codes * width + get_positions(n_codes)
+    order = np.argsort(n_ids)
+    paired = np.isin(b_ids, n_ids)
+    codes = b_codes[paired]
+    names = names[order][np.searchsorted(n_ids[order], b_ids[paired])]
+    keys = np.array([el.strip('[]') for el in keys[paired]], dtype=object)
+    # A repeated field keeps its first position but takes its last name.
+    key_codes, key_uniques = pd.factorize(keys)
+    ids = codes * (len(key_uniques) + 1) + key_codes
+    _, first = np.unique(ids, return_index=True)
+    _, last = np.unique(ids[::-1], return_index=True)
+    last = len(ids) - 1 - last[np.argsort(first)]
+    first = np.sort(first)
+    codes = codes[first]
+    key_codes = key_codes[first]
+    names = names[last]
+    # Expand the '7:5' style data bits until each bit is represented.
+    his = np.array([int(el[0]) if ':' in el else int(el)
+                    for el in key_uniques], dtype=int)
+    los = np.array([int(el[-1]) if ':' in el else int(el)
+                    for el in key_uniques], dtype=int)
+    counts = np.clip(his[key_codes] - los[key_codes] + 1, 0, None)
+    entry = np.repeat(np.arange(len(codes)), counts)
+    bits = los[key_codes][entry] + get_positions(entry)
+    codes = codes[entry]
+    names = names[entry]
+    in_range = (bits >= 0) & (bits < 8)
+    ids = (codes * 8 + bits)[in_range][::-1]
+    names = names[in_range][::-1]
+    ids, last = np.unique(ids, return_index=True)
+    listed = np.zeros(n * 8, dtype=bool)
+    listed[ids] = True
+    reserved = np.zeros(n * 8, dtype=bool)
+    reserved[ids] = ['reserved' in el.lower() for el in names[last]]
+    return listed.reshape(n, 8), reserved.reshape(n, 8)
+
+
+def invalid_default(address, dv):
+    """
+    Create the exception raised for an invalid default value.
 
+    Parameters
+    ----------
+    address : str
+        Address of the register.
+    dv : str
+        Default value given in the PRD.
 
+    Returns
+    -------
+    Exception
+        Exception describing the invalid default value.
+
+    """
+    return Exception(f"Register {address} has an invalid"
+                     f" default value of \"{dv}\"."
+                     "\nOnly numeric values are accepted."
+                     " Please change the value in Excel and try again.")
+
+
+def parse_values(values):
+    """
+    Parse register values from hex strings.
+
+    Values wider than 8 bits keep their low byte. Values that are not
+    numbers, such as '0x1x' or 'TBD.', are written to the MRD as given and
+    only fail when the bits of a reserved field are taken from them.
+
+    Parameters
+    ----------
+    values : list
+        List containing values such as '0x1F', '0x1FF', '0x1x' or '1F'.
+
+    Returns
+    -------
+    ints : ndarray
+        Array containing the low byte of each register value. Bits given as
+        'x' are 0 and values that are not hex numbers are 0.
+    dont_care : ndarray
+        Array flagging the bits of the low byte given as 'x'.
+    valid : ndarray
+        Boolean array flagging the values that are hex numbers.
+
+    """
+    ints = np.zeros(len(values), dtype=np.uint8)
+    dont_care = np.zeros(len(values), dtype=np.uint8)
+    valid = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            ints[i] = int(value, 16) & 0xFF
+            valid[i] = True
+            continue
+        except ValueError:
+            pass
+        digits = value[2:] if value[:2] in ['0x', '0X'] else value
+        digits = digits.lower()[-2:].rjust(2, '0')
+        if all(el in '0123456789abcdefx' for el in digits):
+            ints[i] = int(digits.replace('x', '0'), 16)
+            dont_care[i] = int(''.join(['f' if el == 'x' else '0'
+                                        for el in digits]), 16)
+    return ints, dont_care, valid
+
+
+def get_standard_fields(df, addresses):
+    """
+    Compute the MRD fields of the implemented standard registers.
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame containing information on the standard registers.
+    addresses : list
+        List containing the addresses of implemented standard registers.
+
+    Returns
+    -------
+    fields : dict
+        Dictionary containing the MRD fields of the registers in the format
+        expected by RegisterMap.set_registers.
+    errors : dict
+        Dictionary mapping addresses to the exception raised for them.
+
+    """
+    groups = AddressGroups(df, addresses)
+    errors = {}
+    # Set the Value.
+    dv = groups.joined('Default')
+    value = dv.str.replace('X', 'x')
+    for address in dv.index[~dv.str[1].isin(['x', 'X'])]:
+        try:
+            value[address] = f'0x{int(dv[address], 2):02X}'
+        except ValueError:
+            errors[address] = invalid_default(address, dv[address])
+    # Set the access fields.
+    low = np.array(addresses, dtype=object) < '0x20'
+    write = groups.any('R/W', ['R/W', 'W'])
+    read = groups.any('R/W', ['R/W', 'R'])
+    ext = groups.any('Extended Register R/W', ['Yes'])
+    bsid = write & groups.any(
+        'Broadcast Slave ID and Group Slave ID Support', ['Yes'])
+    rfu = groups.any('Register Class', ['RFFE Reserved'])
+    flags = {'RW': write & low,
+             'RR': read & low,
+             'ERW': write & ext,
+             'ERR': read & ext,
+             'MRW': write & groups.any('Masked Write Support', ['Yes']),
+             'BSID': bsid,
+             'GSID1': bsid,
+             'GSID2': bsid,
+             'RST': write & read & ext & ~rfu}
+    # Set the DX fields.
+    listed, reserved = get_bit_names(groups, 'Bit Name')
+    reserved |= listed & groups.any('R/W', ['R'])[:, None]
+    # Reserved bits take the default, which must then be a hex number.
+    _, _, valid = parse_values(value)
+    for address in value.index[~valid & reserved.any(axis=1)]:
+        errors.setdefault(address, SystemExit(1))
+    fields = {'Name': groups.first('Register name').fillna(''),
+              'Value': value,
+              'Trig N': get_trigger_names(groups.first('Active Trigger ')),
+              **flags,
+              'Writable': listed & ~reserved,
+              'Reserved': reserved}
+    return fields, errors
+
+
+def get_extended_fields(df, addresses):
+    """
+    Compute the MRD fields of the implemented extended registers.
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame containing information on the extended registers.
+    addresses : list
+        List containing the addresses of implemented extended registers.
+
+    Returns
+    -------
+    fields : dict
+        Dictionary containing the MRD fields of the registers in the format
+        expected by RegisterMap.set_registers.
+    errors : dict
+        Dictionary mapping addresses to the exception raised for them.
+
+    """
+    groups = AddressGroups(df, addresses)
+    errors = {}
+    # Set the Value.
+    dv = groups.joined('Default')
+    for address in dv.index[dv.str.len() != 4]:
+        errors[address] = invalid_default(address, dv[address])
+    value = dv.str.replace('X', 'x')
+    trig = groups.first('Triggered')
+    trig = trig.where(~trig.isin(['N', 'n', 'No']))
+    # Set the access fields.
+    name = groups.first('Register Name')
+    tbyb = groups.first('TBYB')
+    no_tbyb = tbyb.isin(['N', 'No']).values
+    erw = no_tbyb & name.notna().values & (
+        name.str.lower() != 'sirev_id').values
+    mask_write = groups.first('Mask-Write Support')
+    no = np.zeros(len(addresses), dtype=bool)
+    flags = {'RW': no,
+             'RR': no,
+             'ERW': erw,
+             'ERR': ~no,
+             'MRW': no_tbyb & mask_write.notna().values & ~mask_write.isin(
+                 ['N', 'No']).values,
+             'BSID': no,
+             'GSID1': no,
+             'GSID2': no,
+             'RST': erw}
+    # Set the DX fields. Bits that are not listed are reserved.
+    listed, reserved = get_bit_names(groups, 'Function')
+    reserved |= ~listed
+    reserved |= tbyb.str.lower().str.contains(
+        'y', regex=False).fillna(False).values.astype(bool)[:, None]
+    # Reserved bits take the default, which must then be a hex number.
+    _, _, valid = parse_values(value)
+    for address in value.index[~valid & reserved.any(axis=1)]:
+        errors.setdefault(address, ValueError(
+            "invalid literal for int() with base 16:"
+            f" '{value[address]}'"))
+    fields = {'Name': name.fillna(''),
+              'Value': value,
+              'Trig N': get_trigger_names(trig),
+              **flags,
+              'Writable': listed & ~reserved,
+              'Reserved': reserved}
+    return fields, errors
+
+
+def populate_register_fields(s_df, e_df, implemented_registers, register_map):
+    """
+    Populate the register fields for implemented registers.
+
+    Parameters
+    ----------
+    s_df : DataFrame
+        DataFrame containing information on the standard registers.
+    e_df : DataFrame
+        DataFrame containing information on the extended registers.
+    implemented_registers : list
+        List containing the addresses of implemented registers.
+    register_map : RegisterMap
+        RegisterMap containing all registers.
+
+    Returns
+    -------
+    register_map : RegisterMap
+        RegisterMap containing all registers.
+
+    """
+    addresses = list(dict.fromkeys(implemented_registers))
+    s_addresses = [el for el in addresses if el < '0x80']
+    e_addresses = [el for el in addresses if not el < '0x80']
+    s_fields, s_errors = get_standard_fields(s_df, s_addresses)
+    e_fields, e_errors = get_extended_fields(e_df, e_addresses)
+    # Report the first invalid register in the order it is implemented.
+    errors = {**s_errors, **e_errors}
+    for address in addresses:
+        if address in errors:
+            if isinstance(errors[address], SystemExit):
+                print(f"Default value at Register {address}"
+                      " is invalid.\n")
+            raise errors[address]
+    register_map.set_registers(s_addresses, s_fields)
+    register_map.set_registers(e_addresses, e_fields)
+    return register_map
+
+
+def build_register_tables(prd_file, standard_sheet, extended_sheet):
+    """
+    Import the register maps and construct the MRD DataFrame.
+
+    Parameters
+    ----------
+    prd_file : str
+        string path to file containing register map sheets.
+    standard_sheet : str
+        string name of standard register map sheet.
+    extended_sheet : str
+        string name of extended register map sheet.
+
+    Returns
+    -------
+    tables : dict
+        Dictionary containing the conditioned register maps 's_df' and
+        'e_df', the MRD 'register_df' and the device 'usid'.
+
+    """
+    # Import the PRD Register Maps.
+    s_df, e_df = read_register_sheets(prd_file, standard_sheet,
+                                      extended_sheet)
+    s_df = condition_df(s_df)
+    e_df = condition_df(e_df, ext=True)
+    implemented_registers = get_implemented_registers(s_df, e_df)
+    # Create empty register map
+    register_map = RegisterMap()
+    # Populate register fields
+    register_map = populate_register_fields(s_df,
+                                            e_df,
+                                            implemented_registers,
+                                            register_map)
+    # Construct output from the register map
+    register_df = register_map.to_df()
+    # usid sets the USID used during testing.
+    usid = register_df.query('Address == "0x1F"')['Value'].values.tolist()
+    usid = usid[0][3]
+    usid = int(usid, 16)
+    return {'s_df': s_df, 'e_df': e_df, 'register_df': register_df,
+            'usid': usid}
+
+
+def get_cache_dir():
+    """
+    Return the directory holding cached register maps.
+
+    Returns
+    -------
+    cache_dir : str
+        Value of the PSV_CACHE_DIR environment variable, or a psv_cache
+        directory in the cache directory of the user.
+
+    """
+    cache_dir = os.environ.get('PSV_CACHE_DIR')
+    if cache_dir is not None:
+        return cache_dir
+    if os.name == 'nt':
+        root = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        root = os.environ.get('XDG_CACHE_HOME') or \
+            os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'psv_cache')
+
+
+def open_cache_dir(cache_dir):
+    """
+    Create the cache directory, private to the user, and check that it is.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory holding cached register maps.
+
+    Raises
+    ------
+    PermissionError
+        The directory belongs to another user.
+
+    Returns
+    -------
+    None.
+
+    """
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    if os.name != 'posix':
+        return
+    stat = os.stat(cache_dir)
+    if stat.st_uid != os.getuid():
+        raise PermissionError(f'{cache_dir} belongs to another user.')
+    if stat.st_mode & 0o077:
+        os.chmod(cache_dir, 0o700)
+
+
+def pack_tables(tables):
+    """
+    Convert register tables to arrays that load without pickle.
+
+    Numeric and Boolean columns are stored as arrays. Object columns, which
+    mix strings with NaN, are stored in the JSON metadata.
+
+    Parameters
+    ----------
+    tables : dict
+        Tables returned by build_register_tables.
+
+    Raises
+    ------
+    TypeError
+        A table holds a value JSON cannot store.
+
+    Returns
+    -------
+    arrays : dict
+        Arrays of an .npz file, with the JSON metadata as 'meta'.
+
+    """
+    meta = {'usid': tables['usid'], 'tables': {}}
+    arrays = {}
+    for name, df in tables.items():
+        if not isinstance(df, pd.DataFrame):
+            continue
+        columns = []
+        for i, (col, values) in enumerate(df.items()):
+            if values.dtype == object:
+                columns.append({'name': col, 'values': values.tolist()})
+            else:
+                arrays[f'{name}_{i}'] = values.to_numpy()
+                columns.append({'name': col, 'dtype': values.dtype.str})
+        arrays[f'{name}_index'] = df.index.to_numpy()
+        meta['tables'][name] = columns
+    arrays['meta'] = np.array(json.dumps(meta))
+    return arrays
+
+
+def unpack_tables(arrays):
+    """
+    Convert the arrays of pack_tables back to register tables.
+
+    Parameters
+    ----------
+    arrays : NpzFile or dict
+        Arrays from pack_tables.
+
+    Returns
+    -------
+    tables : dict
+        Tables as returned by build_register_tables.
+
+    """
+    meta = json.loads(str(arrays['meta']))
+    tables = {}
+    for name, columns in meta['tables'].items():
+        data = {}
+        for i, col in enumerate(columns):
+            if 'values' in col:
+                data[col['name']] = np.array(col['values'], dtype=object)
+            else:
+                data[col['name']] = arrays[f'{name}_{i}']
+        index = arrays[f'{name}_index']
+        if np.array_equal(index, np.arange(len(index))):
+            index = None
+        tables[name] = pd.DataFrame(data, index=index)
+    tables['usid'] = meta['usid']
+    return tables
+
+
+def get_cache_key(prd_file, standard_sheet, extended_sheet):
+    """
+    Compute the cache key of a PRD and its register sheet selection.
+
+    Parameters
+    ----------
+    prd_file : str
+        string path to file containing register map sheets.
+    standard_sheet : str
+        string name of standard register map sheet.
+    extended_sheet : str
+        string name of extended register map sheet.
+
+    Returns
+    -------
+    key : str
+        Hex digest of the workbook content, the sheet names, import_cols
+        and cache_version.
+
+    """
+    digest = hashlib.sha256()
+    with open(prd_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(2**20), b''):
+            digest.update(chunk)
+    digest.update(repr((standard_sheet, extended_sheet, import_cols,
+                        cache_version)).encode())
+    return digest.hexdigest()
+
+
+def load_cached_tables(key, cache_dir):
+    """
+    Load cached register tables, marking them as recently used.
+
+    Parameters
+    ----------
+    key : str
+        Cache key from get_cache_key.
+    cache_dir : str
+        Directory holding cached register maps.
+
+    Returns
+    -------
+    tables : dict
+        Cached tables, or None if the key is not cached.
+
+    """
+    path = os.path.join(cache_dir, f'{key}.npz')
+    try:
+        # Entries hold no pickled objects, so loading one runs no code.
+        with np.load(path, allow_pickle=False) as arrays:
+            tables = unpack_tables(arrays)
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Truncated or stale entry. Drop it and rebuild.
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    return tables
+
+
+def evict_cache(cache_dir, max_size=cache_max_size):
+    """
+    Remove the least recently used entries until the cache fits max_size.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory holding cached register maps.
+    max_size : int, optional
+        Maximum total size of the cache in bytes. The default is
+        cache_max_size.
+
+    Returns
+    -------
+    None.
+
+    """
+    entries = []
+    for el in os.scandir(cache_dir):
+        if el.name.endswith('.npz'):
+            try:
+                stat = el.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, el.path))
+    total = sum(el[1] for el in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def store_cached_tables(key, tables, cache_dir, max_size=cache_max_size):
+    """
+    Store register tables in the cache and evict old entries.
+
+    Parameters
+    ----------
+    key : str
+        Cache key from get_cache_key.
+    tables : dict
+        Tables returned by build_register_tables.
+    cache_dir : str
+        Directory holding cached register maps.
+    max_size : int, optional
+        Maximum total size of the cache in bytes. The default is
+        cache_max_size.
+
+    Returns
+    -------
+    None.
+
+    """
+    open_cache_dir(cache_dir)
+    arrays = pack_tables(tables)
+    # Write to a temporary file first so that concurrent readers never see
+    # a partial entry.
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, os.path.join(cache_dir, f'{key}.npz'))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    evict_cache(cache_dir, max_size)
+
+
+def get_register_tables(prd_file, standard_sheet, extended_sheet,
+                        use_cache=True, cache_dir=None):
+    """
+    Return the register tables of a PRD, using the on-disk cache.
+
+    Parameters
+    ----------
+    prd_file : str
+        string path to file containing register map sheets.
+    standard_sheet : str
+        string name of standard register map sheet.
+    extended_sheet : str
+        string name of extended register map sheet.
+    use_cache : bool, optional
+        Whether to read from and write to the cache. The default is True.
+    cache_dir : str, optional
+        Directory holding cached register maps. The default is None, which
+        uses get_cache_dir().
+
+    Returns
+    -------
+    tables : dict
+        Dictionary containing the conditioned register maps 's_df' and
+        'e_df', the MRD 'register_df' and the device 'usid'.
+
+    """
+    if not use_cache:
+        return build_register_tables(prd_file, standard_sheet,
+                                     extended_sheet)
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    try:
+        open_cache_dir(cache_dir)
+    except OSError:
+        # A cache that is not private to the user is not used.
+        return build_register_tables(prd_file, standard_sheet,
+                                     extended_sheet)
+    key = get_cache_key(prd_file, standard_sheet, extended_sheet)
+    with tracer.span('load_cached_tables') as span:
+        tables = load_cached_tables(key, cache_dir)
+        span.add(hit=tables is not None)
+    if tables is None:
+        with tracer.span('build_register_tables'):
+            tables = build_register_tables(prd_file, standard_sheet,
+                                           extended_sheet)
+        try:
+            store_cached_tables(key, tables, cache_dir)
+        except (OSError, TypeError):
+            # A read-only or full cache, or a table that cannot be stored,
+            # must not stop MRD generation.
+            pass
+    return tables
+
+
+def get_register_df(prd_file, standard_sheet, extended_sheet,
+                    use_cache=True, cache_dir=None):
+    """
+    Import the register maps and construct the MRD DataFrame.
+
+    Parameters
+    ----------
+    prd_file : str
+        string path to file containing register map sheets.
+    standard_sheet : str
+        string name of standard register map sheet.
+    extended_sheet : str
+        string name of extended register map sheet.
+    use_cache : bool, optional
+        Whether to use the on-disk register map cache. The default is True.
+    cache_dir : str, optional
+        Directory holding cached register maps. The default is None.
+
+    Returns
+    -------
+    register_df : DataFrame
+        DataFrame containing MRD.
+    usid : int
+        Base 10 integer value of device USID.
+
+    """
+    tables = get_register_tables(prd_file, standard_sheet, extended_sheet,
+                                 use_cache, cache_dir)
+    return tables['register_df'], tables['usid']
+
+
+def save_mrd(df, output_file):
+    """
+    Save the MRD DataFrame to the output_file path.
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame containing the MRD.
+    output_file : str
+        String path to which MRD will be saved.
+
+    Returns
+    -------
+    None.
+
+    """
+    df.to_csv(path_or_buf=output_file, index=False)
+
+
+def get_row_hashes(s_df, e_df):
+    """
+    Hash the rows of each register address in the conditioned register maps.
+
+    Parameters
+    ----------
+    s_df : DataFrame
+        DataFrame containing information on the standard registers.
+    e_df : DataFrame
+        DataFrame containing information on the extended registers.
+
+    Returns
+    -------
+    row_hashes : dict
+        Dictionary mapping each address to the hex digest of its rows in
+        both register maps.
+
+    """
+    digests = {}
+    for sheet, df in [('standard', s_df), ('extended', e_df)]:
+        address = df['Register Address (Hex.)'].to_numpy(dtype=object)
+        rows = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        keep = np.array([isinstance(el, str) and len(el) == 4
+                         for el in address], dtype=bool)
+        address, rows = address[keep], rows[keep]
+        # Stable sort keeps the rows of an address in sheet order.
+        order = np.argsort(address.astype(str), kind='stable')
+        uniques, starts = np.unique(address[order].astype(str),
+                                    return_index=True)
+        for el, rows_el in zip(uniques, np.split(rows[order], starts[1:])):
+            digest = digests.setdefault(el, hashlib.sha256())
+            digest.update(sheet.encode())
+            digest.update(rows_el.tobytes())
+    return {el: digests[el].hexdigest() for el in sorted(digests)}
+
+
+def get_hash_version():
+    """
+    Identify the import and engine that produced a set of row hashes.
+
+    Returns
+    -------
+    version : str
+        String changing whenever previously saved row hashes cannot be
+        trusted.
+
+    """
+    return f'{cache_version}-{pd.__version__}-' + hashlib.sha256(
+        repr(import_cols).encode()).hexdigest()[:16]
+
+
+def get_hash_file(mrd_file):
+    """
+    Return the path of the row hashes saved next to an MRD.
+
+    Parameters
+    ----------
+    mrd_file : str
+        String path to the MRD.
+
+    Returns
+    -------
+    hash_file : str
+        String path to the row hashes.
+
+    """
+    return f'{os.path.splitext(mrd_file)[0]}.hashes.json'
+
+
+def save_row_hashes(row_hashes, mrd_file):
+    """
+    Save the row hashes of the PRD an MRD was generated from.
+
+    Parameters
+    ----------
+    row_hashes : dict
+        Dictionary returned by get_row_hashes.
+    mrd_file : str
+        String path to the MRD.
+
+    Returns
+    -------
+    None.
+
+    """
+    with open(get_hash_file(mrd_file), 'w') as f:
+        json.dump({'version': get_hash_version(), 'rows': row_hashes}, f,
+                  indent=1)
+
+
+def load_row_hashes(mrd_file):
+    """
+    Load the row hashes saved next to an MRD.
+
+    Parameters
+    ----------
+    mrd_file : str
+        String path to the MRD.
+
+    Returns
+    -------
+    row_hashes : dict
+        Dictionary mapping addresses to row hashes. Empty if no usable
+        hashes were saved, in which case every register is recomputed.
+
+    """
+    try:
+        with open(get_hash_file(mrd_file)) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if saved.get('version') != get_hash_version():
+        return {}
+    return saved['rows']
+
+
+def get_mrd_diff(old_df, new_df):
+    """
+    List the MRD fields that differ between two MRDs.
+
+    Parameters
+    ----------
+    old_df : DataFrame
+        DataFrame containing the previous MRD.
+    new_df : DataFrame
+        DataFrame containing the new MRD.
+
+    Returns
+    -------
+    diff_df : DataFrame
+        DataFrame with one row per changed field and the columns 'Address',
+        'Field', 'Old' and 'New'.
+
+    """
+    old = old_df.astype(str).to_numpy()
+    new = new_df[old_df.columns].astype(str).to_numpy()
+    rows, cols = np.nonzero(old != new)
+    return pd.DataFrame({'Address': new_df['Address'].to_numpy()[rows],
+                         'Field': old_df.columns.to_numpy()[cols],
+                         'Old': old[rows, cols],
+                         'New': new[rows, cols]})
+
+
+def update_mrd(prd_file, mrd_file, standard_sheet, extended_sheet,
+               output_file=None, diff_file=None):
+    """
+    Regenerate an MRD, recomputing only the registers whose PRD rows changed.
+
+    Parameters
+    ----------
+    prd_file : str
+        string path to file containing the revised register map sheets.
+    mrd_file : str
+        String path to the previous MRD. Its row hashes are read from the
+        file next to it; without them every register is recomputed.
+    standard_sheet : str
+        string name of standard register map sheet.
+    extended_sheet : str
+        string name of extended register map sheet.
+    output_file : str, optional
+        String path to which the new MRD will be saved. The default is None,
+        which overwrites mrd_file.
+    diff_file : str, optional
+        String path to which the changed MRD fields will be saved. The
+        default is None, which does not save them.
+
+    Returns
+    -------
+    register_df : DataFrame
+        DataFrame containing the new MRD.
+    diff_df : DataFrame
+        DataFrame containing the changed MRD fields.
+
+    """
+    if output_file is None:
+        output_file = mrd_file
+    old_df = pd.read_csv(mrd_file, dtype=str, keep_default_na=False)
+    s_df, e_df = read_register_sheets(prd_file, standard_sheet,
+                                      extended_sheet)
+    s_df = condition_df(s_df)
+    e_df = condition_df(e_df, ext=True)
+    row_hashes = get_row_hashes(s_df, e_df)
+    old_hashes = load_row_hashes(mrd_file)
+    implemented_registers = get_implemented_registers(s_df, e_df)
+    register_map = RegisterMap()
+    if old_hashes:
+        changed = {el for el in set(row_hashes) | set(old_hashes)
+                   if row_hashes.get(el) != old_hashes.get(el)
+                   and re.fullmatch('0[xX][0-9a-fA-F]{2}', el)}
+        implemented_registers = [el for el in implemented_registers
+                                 if el in changed]
+        register_map.load_df(old_df)
+        register_map.clear_registers(sorted(changed))
+    register_map = populate_register_fields(s_df,
+                                            e_df,
+                                            implemented_registers,
+                                            register_map)
+    register_df = register_map.to_df()
+    diff_df = get_mrd_diff(old_df, register_df)
+    save_mrd(register_df, output_file)
+    save_row_hashes(row_hashes, output_file)
+    if diff_file is not None:
+        diff_df.to_csv(path_or_buf=diff_file, index=False)
+    return register_df, diff_df
+
+
+def find_sheet(sheet_names, name=None, pattern=None):
+    """
+    Select a register sheet by name or by pattern.
+
+    Parameters
+    ----------
+    sheet_names : list
+        List containing the sheet names of the PRD.
+    name : str, optional
+        Exact name of the sheet. The default is None.
+    pattern : str, optional
+        Case insensitive regular expression matched against the sheet
+        names. The first matching sheet is selected. The default is None.
+
+    Returns
+    -------
+    sheet : str
+        Name of the selected sheet.
+
+    """
+    if name is not None:
+        if name not in sheet_names:
+            raise Exception(f'Sheet {name} does not exist.')
+        return name
+    matches = [el for el in sheet_names
+               if re.search(pattern, el, flags=re.IGNORECASE)]
+    if not matches:
+        raise Exception(f'No sheet matches the pattern {pattern}.')
+    return matches[0]
+
+
+def generate_mrd(prd_file, output_file, standard_sheet=None,
+                 extended_sheet=None, standard_pattern=None,
+                 extended_pattern=None, use_cache=True):
+    """
+    Generate and save the MRD of a PRD without user interaction.
+
+    Parameters
+    ----------
+    prd_file : str
+        string path to file containing register map sheets.
+    output_file : str
+        String path to which MRD will be saved. The row hashes used by
+        update_mrd are saved next to it.
+    standard_sheet : str, optional
+        string name of standard register map sheet. The default is None.
+    extended_sheet : str, optional
+        string name of extended register map sheet. The default is None.
+    standard_pattern : str, optional
+        Pattern used to find the standard register map sheet when no name
+        is given. The default is None.
+    extended_pattern : str, optional
+        Pattern used to find the extended register map sheet when no name
+        is given. The default is None.
+    use_cache : bool, optional
+        Whether to use the on-disk register map cache. The default is True.
+
+    Returns
+    -------
+    output_file : str
+        String path to which MRD was saved.
+
+    """
+    sheet_names = get_sheet_ids(prd_file)
+    std_sheet = find_sheet(sheet_names, standard_sheet, standard_pattern)
+    ext_sheet = find_sheet(sheet_names, extended_sheet, extended_pattern)
+    if std_sheet == ext_sheet:
+        raise Exception('Standard Sheet and Extended sheet cannot be the'
+                        ' same selections.')
+    tables = get_register_tables(prd_file, std_sheet, ext_sheet, use_cache)
+    save_mrd(tables['register_df'], output_file)
+    save_row_hashes(get_row_hashes(tables['s_df'], tables['e_df']),
+                    output_file)
+    return output_file
+
+
+def get_prd_files(paths):
+    """
+    Expand directories and glob patterns into a list of PRD files.
+
+    Parameters
+    ----------
+    paths : list
+        List containing files, directories or glob patterns.
+
+    Returns
+    -------
+    prd_files : list
+        List containing the paths of the PRD files.
+
+    """
+    prd_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            prd_files += sorted(glob(os.path.join(path, '*.xlsx')))
+        else:
+            prd_files += sorted(glob(path))
+    prd_files = [os.path.abspath(el) for el in prd_files]
+    # Skip the lock files Excel leaves next to open workbooks.
+    return [el for el in dict.fromkeys(prd_files)
+            if not os.path.basename(el).startswith('~$')]
+
+
+def mrd_batch(prd_files, output_dir, workers=None, **sheets):
+    """
+    Generate the MRD of many PRDs in a process pool.
+
+    Parameters
+    ----------
+    prd_files : list
+        List containing the paths of the PRD files.
+    output_dir : str
+        Directory in which one '<PRD name>_MRD.csv' file per PRD is saved.
+    workers : int, optional
+        Number of worker processes. The default is None, which uses one
+        process per core.
+    **sheets
+        Sheet names or patterns and use_cache passed on to generate_mrd.
+
+    Returns
+    -------
+    results : dict
+        Dictionary mapping each PRD file to the path of its MRD, or to the
+        exception raised while generating it.
+
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for prd_file in prd_files:
+            stem = os.path.splitext(os.path.basename(prd_file))[0]
+            output_file = os.path.join(output_dir, f'{stem}_MRD.csv')
+            futures[executor.submit(generate_mrd, prd_file, output_file,
+                                    **sheets)] = prd_file
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except (Exception, SystemExit) as e:
+                results[futures[future]] = e
+    return {el: results[el] for el in prd_files}
+
+
+@tracer.session('mrd_gendo')
 def mrd_gendo():
+    import PySimpleGUI as sg
+
     prd_filename = sg.popup_get_file('Select file with register tables',file_types=(("Excel Files","*.xlsx"),))
     if prd_filename is None or prd_filename == '':
         return
     if prd_filename.split('.')[-1] != "xlsx":
         sg.popup(f'{prd_filename} is not an XLSX file.')
         return
-    sheetnames = get_sheet_ids(prd_filename)
+    with tracer.span('get_sheet_ids'):
+        sheetnames = get_sheet_ids(prd_filename)
     if len(sheetnames) < 2:
         sg.popup('File does not meet requirements. At least two sheets are required.')
         return
@@ -687,12 +1914,23 @@ def mrd_gendo():
         sg.popup('Standard Sheet and Extended sheet cannot be the same selections.')
         return
     try:
-        register_df, _ = get_register_df(prd_filename, std_sheet, ext_sheet)
+        with tracer.span('get_register_df') as span:
+            # Cancelling kills the process reading the register maps.
+            register_df, _ = run_job(
+                'MRD Generator',
+                lambda job: job.run_process(get_register_df, prd_filename,
+                                            std_sheet, ext_sheet),
+                message='Reading register maps...', progress=True)
+            span.add(rows=len(register_df))
+    except JobCancelled:
+        return
     except Exception as e:
         sg.popup(e.args[0])
         return
     mrd_filename = sg.popup_get_file('Save MRD As', save_as=True, file_types=(("CSV Files","*.csv"),))
     if mrd_filename is None or mrd_filename == '':
         return
-    save_mrd(register_df, mrd_filename)
+    with tracer.span('save_mrd', rows=len(register_df)):
+        run_job('MRD Generator', save_mrd, register_df, mrd_filename,
+                message='Saving MRD...')
 
@@ -6,32 +6,544 @@ Created on Wed Apr 29 16:17:20 2020.
 """
 
 
+import numpy as np
 import pandas as pd
-import PySimpleGUI as sg
 import os
 import errno
+import importlib.util
+import json
+import re
 import sys
 import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
 from pathlib import Path
 from string import ascii_uppercase as uc
+from xml.sax.saxutils import escape, quoteattr
+
+from psv_jobs import JobCancelled, run_job
+from psv_trace import tracer
+
+# Columns of the TestStand result csv and their compact dtypes. The columns
+# are parsed leniently and downcast once their values are validated.
+result_columns = {' COND_TYPE': 'Type',
+                  ' COND_REG_ADDR': 'Address',
+                  ' COND_WRITE_MASK': 'Mask',
+                  ' COND_WRITE_DATA': 'Write',
+                  ' COND_EXPECTED_DATA': 'Expected',
+                  ' MEAS_READ_DATA': 'Read',
+                  ' MEAS_PARITY_OK': 'Parity',
+                  ' MEAS_PASS': 'Pass'}
+result_dtypes = {' COND_TYPE': 'category',
+                 ' COND_REG_ADDR': np.uint8,
+                 ' COND_WRITE_MASK': np.uint8,
+                 ' COND_WRITE_DATA': np.uint8,
+                 ' COND_EXPECTED_DATA': np.int16,
+                 ' MEAS_READ_DATA': np.int16,
+                 ' MEAS_PARITY_OK': bool,
+                 ' MEAS_PASS': bool}
+# Value of a missing or invalid cell. Reads and expected values of -1 never
+# match, and a bad measurement fails.
+result_fills = {' COND_REG_ADDR': 0,
+                ' COND_WRITE_MASK': 0,
+                ' COND_WRITE_DATA': 0,
+                ' COND_EXPECTED_DATA': -1,
+                ' MEAS_READ_DATA': -1,
+                ' MEAS_PARITY_OK': False,
+                ' MEAS_PASS': False}
+# Text of the flags in a column that mixes them with numbers or blanks.
+result_bools = {'True': 1, 'TRUE': 1, 'true': 1,
+                'False': 0, 'FALSE': 0, 'false': 0}
+result_chunk_size = 2**20
+# The export of the results is the only user of the optional pyarrow.
+pyarrow_missing = ('Exporting the results requires pyarrow. Install it with '
+                   'pip install -r requirements-export.txt.')
+# Frame header code of each test, in the order the tests are run.
+test_codes = {0: 'Trigger Test',
+              2: 'TBYB Test',
+              3: 'Timed Trigger Test',
+              5: 'mTrig Test'}
+trigger_summary = {'Successful Triggers': 'Trigger Test'}
+# Hex name of every register address and value.
+hex_names = np.array([f'0x{el:02X}' for el in range(256)], dtype=object)
+counter_summary = {'Successful Timed Triggers': 'Trigger Test',
+                   'Successful Counter Readback': 'Counter Test'}
 
 ###################################################################################################
 #   Report Gen Functions   ########################################################################
 ###################################################################################################
+class FrameIndex:
+    """
+    The FrameIndex class locates the frame headers of a test result.
+
+    A frame header is a write to Reg0xFF and the written value is its code:
+    0 trigger frame, 1 trigger sub-frame, 2 TBYB frame, 3 timed trigger
+    frame, 4 timed trigger sub-frame, 5 mTrig frame and 6 mTrig setting.
+    The headers are found in one pass, frames and sub-frames are then
+    looked up by binary search.
+
+    Parameters
+    ----------
+    df : DataFrame or Segment
+        Test results.
+
+    """
+
+    codes = range(7)
+
+    def __init__(self, df):
+        """
+        Instantiate the FrameIndex class.
+
+        Returns
+        -------
+        None.
+
+        """
+        address = np.asarray(df['Address'])
+        write = np.asarray(df['Write'])
+        headers = np.flatnonzero(address == 255)
+        header_codes = write[headers]
+        self.positions = {code: headers[header_codes == code]
+                          for code in self.codes}
+        self.length = len(df)
+
+    def find(self, code, start=0, stop=None):
+        """
+        Get the positions of the headers with a code.
+
+        Parameters
+        ----------
+        code : int
+            Header code.
+        start : int, optional
+            First row searched. The default is 0.
+        stop : int, optional
+            Row after the last row searched. The default is None, which
+            searches to the end.
+
+        Returns
+        -------
+        positions : ndarray
+            Array containing the row positions of the headers.
+
+        """
+        positions = self.positions[code]
+        if stop is None:
+            stop = self.length
+        lo, hi = np.searchsorted(positions, [start, stop])
+        return positions[lo:hi]
+
+    def frames(self, code, start=0, stop=None):
+        """
+        Get the row ranges of the frames starting with a header code.
+
+        Each frame runs up to the next header with the same code, the last
+        frame runs up to stop.
+
+        Parameters
+        ----------
+        code : int
+            Header code of the frames.
+        start : int, optional
+            First row searched. The default is 0.
+        stop : int, optional
+            Row after the last row searched. The default is None, which
+            searches to the end.
+
+        Returns
+        -------
+        frames : list
+            List of (start, stop) row ranges.
+
+        """
+        if stop is None:
+            stop = self.length
+        starts = self.find(code, start, stop).tolist()
+        return list(zip(starts, starts[1:] + [stop]))
+
+    def subset(self, start, stop):
+        """
+        Get the index of a row range, with positions relative to start.
+
+        Parameters
+        ----------
+        start : int
+            First row of the range.
+        stop : int
+            Row after the last row of the range.
+
+        Returns
+        -------
+        FrameIndex
+            Index of the rows start to stop.
+
+        """
+        index = FrameIndex.__new__(FrameIndex)
+        index.positions = {code: self.find(code, start, stop) - start
+                           for code in self.codes}
+        index.length = stop - start
+        return index
+
+    def sub_frames(self, code, sub_code):
+        """
+        Get all sub-frames of the frames starting with a header code.
+
+        Parameters
+        ----------
+        code : int
+            Header code of the frames.
+        sub_code : int
+            Header code of the sub-frames.
+
+        Returns
+        -------
+        starts : ndarray
+            Array containing the first row of each frame.
+        stops : ndarray
+            Array containing the row after the last row of each frame.
+        sub_starts : ndarray
+            Array containing the first row of each sub-frame.
+        owners : ndarray
+            Array containing the frame number of each sub-frame.
+
+        """
+        starts = self.find(code)
+        stops = np.append(starts[1:], self.length)
+        sub_starts = self.find(sub_code, starts[0] if len(starts) else
+                               self.length)
+        owners = np.searchsorted(starts, sub_starts, side='right') - 1
+        return starts, stops, sub_starts, owners
+
+
+class Segment:
+    """
+    The Segment class is a row range over shared result column arrays.
+
+    Columns are NumPy arrays and a segment only holds slices of them, so
+    splitting a result into tests, frames and settings copies no rows.
+    Positions in a segment are relative to its first row.
+
+    Parameters
+    ----------
+    columns : dict
+        Dictionary of column name to array of the whole result.
+    start : int
+        First row of the segment.
+    stop : int
+        Row after the last row of the segment.
+    frame_index : FrameIndex, optional
+        Frame headers of the segment. The default is None, which indexes
+        the segment.
+
+    """
+
+    def __init__(self, columns, start, stop, frame_index=None):
+        """
+        Instantiate the Segment class.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.columns = columns
+        self.start = start
+        self.stop = stop
+        if frame_index is None:
+            frame_index = FrameIndex(self)
+        self.frame_index = frame_index
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Get a segment spanning a whole result DataFrame.
+
+        Parameters
+        ----------
+        df : DataFrame
+            DataFrame containing the test results.
+
+        Returns
+        -------
+        Segment
+            Segment of all rows of df.
+
+        """
+        columns = {k: df[k].to_numpy() for k in df.columns}
+        return cls(columns, 0, len(df))
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, name):
+        return self.columns[name][self.start:self.stop]
+
+    def __getstate__(self):
+        # Only the rows of the segment are sent to worker processes.
+        columns = {k: v[self.start:self.stop] for k, v in self.columns.items()}
+        return {'columns': columns, 'start': 0, 'stop': len(self),
+                'frame_index': self.frame_index}
+
+    def segment(self, start, stop):
+        """
+        Get a segment of a row range of this segment.
+
+        Parameters
+        ----------
+        start : int
+            First row of the range, relative to this segment.
+        stop : int
+            Row after the last row of the range, relative to this segment.
+
+        Returns
+        -------
+        Segment
+            Segment of the rows start to stop.
+
+        """
+        return Segment(self.columns, self.start + start, self.start + stop,
+                       self.frame_index.subset(start, stop))
+
+
+def as_segment(df):
+    """
+    Get a segment of test results.
+
+    Parameters
+    ----------
+    df : DataFrame or Segment
+        Test results.
+
+    Returns
+    -------
+    Segment
+        df itself if it is a segment, otherwise a segment of all its rows.
+
+    """
+    if isinstance(df, Segment):
+        return df
+    return Segment.from_frame(df)
+
+
+def take(values, positions, stops):
+    """
+    Gather values at row positions that must lie inside their frames.
+
+    Parameters
+    ----------
+    values : ndarray
+        Array containing a result column.
+    positions : ndarray
+        Array containing the row positions to gather.
+    stops : ndarray
+        Array containing the row after the last row of the frame of each
+        position.
+
+    Returns
+    -------
+    ndarray
+        Array containing the values at positions.
+
+    """
+    outside = positions >= stops
+    if outside.any():
+        raise KeyError(int(positions[outside][0]))
+    return values[positions]
+
+
+def is_pass(values):
+    """
+    Evaluate the truthiness of Pass values.
+
+    Parameters
+    ----------
+    values : ndarray
+        Array containing Pass values.
+
+    Returns
+    -------
+    ndarray
+        Boolean array that is False where a value is falsy.
+
+    """
+    return values.astype(bool)
+
+
+class TriggerTable:
+    """
+    The TriggerTable class holds the trigger names of trig_reg_ddict by number.
+
+    Names are looked up with integer arrays instead of hex string keys.
+    trigger_ids maps a register and a written value to a name id, which
+    covers the trigger registers and the mTrig group of a register nibble
+    mask. counter_ids maps a counter register and mtrig_ids an mTrig
+    setting to a name id. Id 0 means no name.
+
+    Parameters
+    ----------
+    trig_reg_ddict : dict
+        Multlevel dictionary containing register information, as from
+        get_tr_dict.
+
+    """
+
+    def __init__(self, trig_reg_ddict):
+        """
+        Instantiate the TriggerTable class.
+
+        Returns
+        -------
+        None.
+
+        """
+        names = {None: 0}
+        self.trigger_ids = np.zeros((256, 256), dtype=np.uint16)
+        self.counter_ids = np.zeros(256, dtype=np.uint16)
+        self.mtrig_ids = np.zeros(256, dtype=np.uint16)
+        for reg, value in trig_reg_ddict.items():
+            if reg == 'mtrig':
+                for setting, name in value.items():
+                    self.mtrig_ids[int(setting, 16)] = names.setdefault(
+                        name, len(names))
+            elif isinstance(value, dict):
+                for val, name in value.items():
+                    self.trigger_ids[int(reg, 16), int(val, 16)] = \
+                        names.setdefault(name, len(names))
+            else:
+                self.counter_ids[int(reg, 16)] = names.setdefault(
+                    value, len(names))
+        self.names = np.array(list(names), dtype=object)
+
+    def get_names(self, ids, keys):
+        """
+        Get the names of name ids, raising KeyError for missing names.
+
+        Parameters
+        ----------
+        ids : ndarray
+            Array containing name ids.
+        keys : ndarray
+            Array containing the register or setting of every id, used in
+            the error.
+
+        Returns
+        -------
+        ndarray
+            Array containing the names.
+
+        """
+        missing = ids == 0
+        if missing.any():
+            raise KeyError(hex_names[np.asarray(keys)[missing][0]])
+        return self.names[ids]
+
+    def get_triggers(self, regs, vals):
+        regs = np.asarray(regs).astype(np.intp)
+        vals = np.asarray(vals).astype(np.intp)
+        return self.get_names(self.trigger_ids[regs, vals], regs)
+
+    def get_counters(self, regs):
+        regs = np.asarray(regs).astype(np.intp)
+        return self.get_names(self.counter_ids[regs], regs)
+
+    def get_mtrigs(self, settings):
+        settings = np.asarray(settings).astype(np.intp)
+        return self.get_names(self.mtrig_ids[settings], settings)
+
+
+def get_trigger_table(trig_reg_ddict):
+    """
+    Get the trigger table of trig_reg_ddict.
+
+    Parameters
+    ----------
+    trig_reg_ddict : dict or TriggerTable
+        Multlevel dictionary containing register information.
+
+    Returns
+    -------
+    TriggerTable
+        trig_reg_ddict itself if it is a table, otherwise its table.
+
+    """
+    if isinstance(trig_reg_ddict, TriggerTable):
+        return trig_reg_ddict
+    return TriggerTable(trig_reg_ddict)
+
+
+def summarize_registers(debug_df, columns):
+    """
+    Summarize the passing trigger registers of every register address.
+
+    Parameters
+    ----------
+    debug_df : DataFrame
+        DataFrame containing one row per register address and trigger.
+    columns : dict
+        Dictionary mapping the result column names to the debug column
+        holding the pass flag of each trigger.
+
+    Returns
+    -------
+    result_df : DataFrame
+        DataFrame with a row per sorted register address, listing the
+        passing trigger registers in test order.
+
+    """
+    addresses = sorted(set(debug_df['Register Address'].values.tolist()))
+    result = {'Register Address': addresses}
+    for result_column, test_column in columns.items():
+        passed = debug_df[debug_df[test_column] == 'O']
+        joined = passed.groupby('Register Address', sort=False)[
+            'Trigger Register'].agg('; '.join)
+        result[result_column] = [joined.get(adrs, '') for adrs in addresses]
+    return pd.DataFrame(result)
+
+
+def get_mtrig_registers(df):
+    """
+    Get the register and nibble mask of every masked write of the results.
+
+    Parameters
+    ----------
+    df : DataFrame or iterable
+        DataFrame containing the test results or an iterable of its chunks.
+
+    Returns
+    -------
+    mtrigs : [[str,str]]
+        Sorted list of register, nibble mask pairs, as ['0x2D', '0xF0'].
+
+    """
+    if isinstance(df, pd.DataFrame):
+        df = [df]
+    mtrigs = set()
+    for chunk in df:
+        mtrigs.update(map(tuple, chunk.query('Type == "MASKED_WRITE"')[['Address','Mask']].values.astype(int).tolist()))
+    mtrigs = list(mtrigs)
+    mtrigs = [[f'0x{el[0]:02X}', f'0x{el[1]:02X}'] for el in mtrigs]
+    mtrigs.sort()
+    return mtrigs
+
+
 def get_mtrigs_result(df):
     """
     Generate mtrigs dictionary from the test result df.
 
     Parameters
     ----------
-    df : DataFrame
-        DataFrame containing the test results
+    df : DataFrame or iterable
+        DataFrame containing the test results or an iterable of its chunks.
     
     Returns
     -------
     md : dict
         Dictionary containing the mappable trigger information.
     """
+    import PySimpleGUI as sg
+
     def get_md(ml, mi):
         """
         Get dictionary containing the mappable trigger information from user input.
@@ -58,568 +570,1644 @@ def get_mtrigs_result(df):
         return md
 
 
-    mtrigs = df.query('Type == "MASKED_WRITE"')[['Address','Mask']].values.astype(int).tolist()
-    mtrigs = [(el[0], el[1]) for el in mtrigs]
-    mtrigs = list(set(mtrigs))
-    mtrigs = [[f'0x{el[0]:02X}', f'0x{el[1]:02X}'] for el in mtrigs]
-    mtrigs.sort()
-    
-    col1_layout = [[sg.Text('Register')]]
-    col2_layout = [[sg.Text('Nibble')]]
-    col3_layout = [[sg.Text('mGroup')]]
-    mnt = {'0xF0': '[3:0]', '0x0F': '[7:4]'}
-    
-    for i in range(len(mtrigs)):
-        col1_layout += [[sg.Text(f'Reg{mtrigs[i][0]}')]]
-        col2_layout += [[sg.Text(f'{mnt[mtrigs[i][1]]}')]]
-        col3_layout += [[sg.DropDown([el for el in uc], size=(6, 1), key=f'-{i}-')]]
-    
-    layout = [[sg.Column(col1_layout), sg.Column(col2_layout), sg.Column(col3_layout)],
-              [sg.Stretch(), sg.Ok(size=(10, 1)), sg.Cancel(size=(10, 1)), sg.Stretch()]]
-    
-    mt_window = sg.Window('mTrig Setup', layout=layout)
+    mtrigs = run_job('mTrig Setup', get_mtrig_registers, df,
+                     message='Reading the mTrig registers of the results...')
+    
+    col1_layout = [[sg.Text('Register')]]
+    col2_layout = [[sg.Text('Nibble')]]
+    col3_layout = [[sg.Text('mGroup')]]
+    mnt = {'0xF0': '[3:0]', '0x0F': '[7:4]'}
+    
+    for i in range(len(mtrigs)):
+        col1_layout += [[sg.Text(f'Reg{mtrigs[i][0]}')]]
+        col2_layout += [[sg.Text(f'{mnt[mtrigs[i][1]]}')]]
+        col3_layout += [[sg.DropDown([el for el in uc], size=(6, 1), key=f'-{i}-')]]
+    
+    layout = [[sg.Column(col1_layout), sg.Column(col2_layout), sg.Column(col3_layout)],
+              [sg.Stretch(), sg.Ok(size=(10, 1)), sg.Cancel(size=(10, 1)), sg.Stretch()]]
+    
+    mt_window = sg.Window('mTrig Setup', layout=layout)
+
+    while True:
+        mt_evts, mt_vals = mt_window.read()
+        if mt_evts is None or mt_evts == 'Cancel':
+            mt_window.close()
+            return None
+        if mt_evts == 'Ok' and all(mt_vals.values()):
+            md = get_md(mtrigs, mt_vals)
+            mt_window.close()
+            break
+    return md 
+
+def process_tbyb(df, trig_reg_ddict):
+    """
+    Process the TBYB df to generate result list.
+
+    Parameters
+    ----------
+    df : DataFrame or Segment
+        Contains all TBYB tests.
+
+    Returns
+    -------
+    res_dict : dict of results
+        Dictionary containing result of all TBYB tests.
+
+    """
+    df = as_segment(df)
+    # Get indices of test starts.
+    indices = df.frame_index.find(2).tolist()
+    adrs_offset = 5
+    dv_offset = 5
+    dv2_offset = 7
+    nv1_offset = 10
+    nv2_offset = 12
+    fv_offset = 15
+    address = df['Address']
+    read = df['Read']
+    res_list = []
+    for idx in indices:
+        res_dict = {}
+        adrs = int(address[idx + adrs_offset])
+        adrs = f'Reg0x{adrs:02X}'
+        res_dict['Address'] = adrs
+        dv = int(read[idx + dv_offset])
+        dv2 = int(read[idx + dv2_offset])
+        nv1 = int(read[idx + nv1_offset])
+        nv2 = int(read[idx + nv2_offset])
+        fv = int(read[idx + fv_offset])
+        check1 = dv == dv2
+        check2 = nv1 != dv
+        check3 = nv2 != dv
+        check4 = fv == nv2
+        if all([check1, any([check2, check3]), check4]):
+            res_dict['TBYB Result'] = 'O'
+        else:
+            res_dict['TBYB Result'] = '---'
+        res_list += [res_dict]
+    res_df = pd.DataFrame(res_list)
+    debug_df = pd.DataFrame(res_list)
+    return debug_df, res_df
+
+
+def process_counters(df, trig_reg_ddict, mtrig=False):
+    """
+    Process the Counter df to generate result list.
+
+    Each test frame begins with a write of 0x03 to Reg0xFF.
+    The test frame will contain the results of each counter
+    register on the register address associated with the test frame.
+
+    Parameters
+    ----------
+    df : DataFrame or Segment
+        Contains all Counter test frames.
+
+    Returns
+    -------
+    debug_df : pandas dataframe
+        Dataframe containing result of timed trigger tests
+        with debug information.
+
+    result_df: pandas dataframe
+        Dataframe containing condensed result of timed trigger tests.
+
+    """
+    # mtrig trigger test cant reset so we need to change the offset.
+    # If not mtrig, add 1
+    mtrig = int(not mtrig)
+    df = as_segment(df)
+    trig_table = get_trigger_table(trig_reg_ddict)
+    adrs_offset = 5 + mtrig
+    # dv_offset = 4 + mtrig      Works but unnecessary.
+    nv1_offset = 6 + mtrig
+    nv2_offset = 11 + mtrig
+    count_offset = 13 + mtrig
+    count_width = 16
+    fv_offset = 29 + mtrig
+    address = df['Address']
+    read = df['Read']
+    passed = df['Pass']
+    starts, stops, sub_idx, owners = df.frame_index.sub_frames(3, 4)
+    # get the address of every frame
+    adrs = hex_names[take(address, starts + adrs_offset, stops)]
+    sub_stops = stops[owners]
+    # get the first and second new values
+    nv1 = take(read, sub_idx + nv1_offset, sub_stops)
+    nv2 = take(read, sub_idx + nv2_offset, sub_stops)
+    # get the trigger counter register
+    count_reg = take(address, sub_idx + count_offset, sub_stops)
+    # get the count window, cut short at the end of the frame
+    window = sub_idx[:, None] + count_offset + np.arange(count_width)
+    in_frame = window < sub_stops[:, None]
+    window = np.where(in_frame, window, 0)
+    c_chk = (is_pass(passed[window]) | ~in_frame).all(axis=1)
+    # get final value
+    fv = take(read, sub_idx + fv_offset, sub_stops)
+    # Check 1: Verify nv1 not 0
+    chk1 = nv1 != 0
+    # Check 2: Verify nv2 == nv1
+    chk2 = nv2 == nv1
+    # Check 3: Verify final value == 0
+    chk3 = fv == 0
+    count_reg = trig_table.get_counters(count_reg)
+    debug = count_reg + ':\t'
+    # Only failures add to the debug string.
+    for i in np.flatnonzero(~(chk1 & chk2 & chk3 & c_chk)):
+        if not chk1[i]:
+            debug[i] += "Write failed with all triggers unmasked.\t"
+        if not chk2[i]:
+            debug[i] += "Write occurred with all triggers masked.\t"
+        if not chk3[i]:
+            debug[i] += f"Final value of 0x{int(fv[i]):02X}" + \
+                " is unexpected with write value of 0x00\t"
+        if not c_chk[i]:
+            c = read[window[i][in_frame[i]]]
+            debug[i] += 'Count failure. Count reads: '
+            debug[i] += '; '.join([f'0x{int(el):02X}' for el in c])
+    debug_df = pd.DataFrame({
+        'Register Address': adrs[owners],
+        'Trigger Register': count_reg,
+        'Counter Test': np.where(c_chk, 'O', '---'),
+        'Trigger Test': np.where(chk1 & chk2 & chk3, 'O', '---'),
+        'Debug': debug}).astype(object)
+    result_df = summarize_registers(debug_df, counter_summary)
+    return debug_df, result_df
+
+
+def process_triggers(df, trig_reg_ddict, mtrig=False):
+    """
+    Process the trigger df to generate result list.
+
+    Each test frame begins with a write of 0x00 to Reg0xFF.
+    The test frame will contain the results of each trigger
+    register on the register address associated with the test frame.
+
+    Parameters
+    ----------
+    df : DataFrame or Segment
+        Contains all trigger test frames.
+
+    Returns
+    -------
+    debug_df : pandas dataframe
+        Dataframe containing result of trigger tests with debug information.
+
+    result_df: pandas dataframe
+        Dataframe containing condensed result of trigger tests.
+
+    """
+    df = as_segment(df)
+    trig_table = get_trigger_table(trig_reg_ddict)
+    # mtrig trigger test cant reset so we need to change the offset.
+    # If not mtrig, add 1
+    mtrig = int(not mtrig)
+    adrs_offset = 5 + mtrig
+    # Default value works but is unnecessary
+    # dv_offset = 5
+    nv1_offset = 6 + mtrig
+    nv2_offset = 11 + mtrig
+    trig_offset = 12 + mtrig
+    fv_offset = 13 + mtrig
+    address = df['Address']
+    write = df['Write']
+    read = df['Read']
+    starts, stops, sub_idx, owners = df.frame_index.sub_frames(0, 1)
+    # get the address of every frame
+    adrs = hex_names[take(address, starts + adrs_offset, stops)]
+    sub_stops = stops[owners]
+    # get the first and second new values
+    nv1 = take(read, sub_idx + nv1_offset, sub_stops)
+    nv2 = take(read, sub_idx + nv2_offset, sub_stops)
+    # get the trigger register and value
+    trig_reg = take(address, sub_idx + trig_offset, sub_stops)
+    trig_val = take(write, sub_idx + trig_offset, sub_stops)
+    # get the trig from the register and value
+    trig = trig_table.get_triggers(trig_reg, trig_val)
+    # get final value
+    fv = take(read, sub_idx + fv_offset, sub_stops)
+    # Check 1: Verify nv1 not 0
+    chk1 = nv1 != 0
+    # Check 2: Verify nv2 == nv1
+    chk2 = nv2 == nv1
+    # Check 3: Verify final value == 0
+    chk3 = fv == 0
+    debug = hex_names[trig_reg.astype(np.intp)] + ':\t'
+    # Only failures add to the debug string.
+    for i in np.flatnonzero(~(chk1 & chk2 & chk3)):
+        if not chk1[i]:
+            debug[i] += "Write failed with all triggers unmasked.\t"
+        if not chk2[i]:
+            debug[i] += "Write occurred with all triggers masked.\t"
+        if not chk3[i]:
+            debug[i] += f"Final value of 0x{int(fv[i]):02X}" + \
+                " is unexpected with write value of 0x00\t"
+    debug_df = pd.DataFrame({
+        'Register Address': adrs[owners],
+        'Trigger Register': trig,
+        'Trigger Test': np.where(chk1 & chk2 & chk3, 'O', '---'),
+        'Debug': debug}).astype(object)
+    result_df = summarize_registers(debug_df, trigger_summary)
+    return debug_df, result_df
+
+
+def get_mtrig_settings(df, trig_reg_ddict):
+    """
+    Split the mtrig df into the test of every mTrig setting.
+
+    Each test frame begins with a write of 0x05 to Reg0xFF and every
+    setting of the mTrig group begins with a write of 0x06 to Reg0xFF.
+
+    Parameters
+    ----------
+    df : DataFrame or Segment
+        Contains all mtrig test frames.
+    trig_reg_ddict or TriggerTable : dict or TriggerTable
+        Multlevel dictionary containing register information.
+
+    Yields
+    ------
+    setting_df : Segment
+        Segment containing the test of one mTrig setting.
+    adrs : str
+        Register address of the test frame.
+    mtrig_grp : str
+        mTrig group of the test frame.
+    setting : str
+        mTrig setting.
+
+    """
+    df = as_segment(df)
+    trig_table = get_trigger_table(trig_reg_ddict)
+    address = df['Address']
+    mask = df['Mask']
+    write = df['Write']
+    # Offsets referenced from indices
+    adrs_offset = 8
+    mtrig_offset = 2
+    # Offsets referenced from sub_indices
+    setting_offset = -1
+    for start, stop in df.frame_index.frames(5):
+        # Split off an mtrig frame
+        # get the address
+        adrs = hex_names[address[start + adrs_offset]]
+        mtrig_adrs = address[start + mtrig_offset]
+        msk = int(mask[start + mtrig_offset])
+        mtrig_grp = trig_table.get_triggers([mtrig_adrs], [msk])[0]
+        # Get indices of each mtrig setting.
+        sub_indices = df.frame_index.find(6, start, stop).tolist()
+        sub_indices = [el+2 for el in sub_indices]
+        sub_indices += [stop]
+        for j in range(len(sub_indices)-1):
+            setting_df = df.segment(sub_indices[j], sub_indices[j+1])
+            setting = write[sub_indices[j] + setting_offset]
+            if msk == 0xF0:
+                setting = int(setting)
+            else:
+                setting = int(setting) >> 4
+            setting = trig_table.get_mtrigs([setting])[0]
+            yield setting_df, adrs, mtrig_grp, setting
+
+
+def process_mtrig_setting(setting_df, trig_reg_ddict, adrs, mtrig_grp,
+                          setting):
+    """
+    Process the test of one mTrig setting.
+
+    Parameters
+    ----------
+    setting_df : DataFrame or Segment
+        Contains the test of one mTrig setting.
+    trig_reg_ddict or TriggerTable : dict or TriggerTable
+        Multlevel dictionary containing register information.
+    adrs : str
+        Register address of the test frame.
+    mtrig_grp : str
+        mTrig group of the test frame.
+    setting : str
+        mTrig setting.
+
+    Returns
+    -------
+    debug_list : list
+        List containing the trigger and timed trigger debug dataframes.
+    tmp_dict : dict
+        Dictionary containing the condensed result of the setting.
+
+    """
+    trig_res_debug_df, trig_res_df = process_triggers(
+        setting_df, trig_reg_ddict, mtrig=True)
+    tt_res_debug_df, tt_res_df = process_counters(
+        setting_df, trig_reg_ddict, mtrig=True)
+    success_trigs = trig_res_df[
+        'Successful Triggers'].values.tolist()[0]
+    success_ttrigs = tt_res_df[
+        'Successful Timed Triggers'].values.tolist()[0]
+    success_count = tt_res_df[
+        'Successful Counter Readback'].values.tolist()[0]
+    tmp_dict = {'Register Address': adrs,
+                'mTrig Group': mtrig_grp,
+                'mTrig Setting': setting,
+                'Successful Triggers': success_trigs,
+                'Successful Timed Triggers': success_ttrigs,
+                'Successful Counter Readback': success_count}
+    # Need to add mTrig group and mTrig setting
+    trig_res_debug_df['mTrig Group'] = mtrig_grp
+    tt_res_debug_df['mTrig Group'] = mtrig_grp
+    trig_res_debug_df['mTrig Setting'] = setting
+    tt_res_debug_df['mTrig Setting'] = setting
+    trig_res_debug_df['Test Name'] = 'Trigger'
+    tt_res_debug_df['Test Name'] = 'Timed Trigger'
+    return [trig_res_debug_df, tt_res_debug_df], tmp_dict
+
+
+def combine_mtrigs(setting_results):
+    """
+    Combine the results of the mTrig settings in test order.
+
+    Parameters
+    ----------
+    setting_results : iterable
+        Iterable of process_mtrig_setting results.
+
+    Returns
+    -------
+    debug_df : pandas dataframe
+        Dataframe containing result of mtrig tests with debug information.
+
+    result_df: pandas dataframe
+        Dataframe containing condensed result of mtrig tests.
+
+    """
+    result_list = []
+    debug_list = []
+    for setting_debug, tmp_dict in setting_results:
+        result_list += [tmp_dict]
+        debug_list += setting_debug
+    debug_df = pd.concat(debug_list, ignore_index=True, sort=False)
+    debug_df = debug_df[['Register Address',
+                         'mTrig Group',
+                         'mTrig Setting',
+                         'Trigger Register',
+                         'Trigger Test',
+                         'Counter Test',
+                         'Debug',
+                         'Test Name']]
+    result_df = pd.DataFrame(result_list)
+    return debug_df, result_df
+
+
+def process_mtrigs(df, trig_reg_ddict):
+    """
+    Process the mtrig df to generate result list.
+
+    Each test frame begins with a write of 0x05 to Reg0xFF.
+    The test frame will contain the results of each trigger
+    register and trigger counter on the register address associated
+    with the test frame.
+
+    Parameters
+    ----------
+    df : DataFrame or Segment
+        Contains all mtrig test frames.
+
+    Returns
+    -------
+    debug_df : pandas dataframe
+        Dataframe containing result of mtrig tests with debug information.
+
+    result_df: pandas dataframe
+        Dataframe containing condensed result of mtrig tests.
+
+    """
+    return combine_mtrigs(
+        process_mtrig_setting(setting_df, trig_reg_ddict, *setting)
+        for setting_df, *setting in get_mtrig_settings(df, trig_reg_ddict))
+
+
+class ReportWriter:
+    """
+    The ReportWriter class streams DataFrames into a copy of an xlsx template.
+
+    Every sheet is written once, straight into the output zip, with its
+    strings added to one deduplicated shared string table. The template
+    parts that are not written are copied unchanged. Excel is told to
+    recalculate the template formulas on load, as the cached values are
+    stale once the data sheets change.
+
+    Parameters
+    ----------
+    template_path : string
+        Path to the excel template.
+    output_path : string
+        Path to which the output will be written.
+
+    """
+
+    ns = {'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+          'r': 'http://schemas.openxmlformats.org/officeDocument/2006/'
+               'relationships',
+          'rel': 'http://schemas.openxmlformats.org/package/2006/'
+                 'relationships'}
+    sheet_type = ('application/vnd.openxmlformats-officedocument.'
+                  'spreadsheetml.worksheet+xml')
+    sheet_rel = ('http://schemas.openxmlformats.org/officeDocument/2006/'
+                 'relationships/worksheet')
+    empty_sheet = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '\n<worksheet xmlns="' + ns['main'] + '"><sheetData/>'
+                   '</worksheet>')
+    rows_per_write = 1024
+    # Workbook children that follow calcPr, in schema order.
+    after_calc = ('oleSize', 'customWorkbookViews', 'pivotCaches',
+                  'smartTagPr', 'smartTagTypes', 'webPublishing',
+                  'fileRecoveryPr', 'webPublishObjects', 'extLst')
+    # Characters XML 1.0 does not allow in cell text.
+    illegal_chars = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+    def __init__(self, template_path, output_path):
+        """
+        Instantiate the ReportWriter class.
+
+        Returns
+        -------
+        None.
+
+        """
+        import xml.etree.ElementTree as ET
+
+        self.template = zipfile.ZipFile(template_path)
+        self.output = zipfile.ZipFile(output_path, 'w',
+                                      compression=zipfile.ZIP_DEFLATED)
+        workbook = ET.fromstring(self.template.read('xl/workbook.xml'))
+        rels = ET.fromstring(self.template.read('xl/_rels/workbook.xml.rels'))
+        targets = {el.get('Id'): el.get('Target')
+                   for el in rels.iter(f"{{{self.ns['rel']}}}Relationship")}
+        self.sheets = {}
+        for el in workbook.iter(f"{{{self.ns['main']}}}sheet"):
+            target = targets[el.get(f"{{{self.ns['r']}}}id")]
+            if target.startswith('/'):
+                self.sheets[el.get('name')] = target[1:]
+            else:
+                self.sheets[el.get('name')] = 'xl/' + target
+        self.new_sheets = []
+        self.shared_strings = []
+        self.strings = {}
+        self.string_count = 0
+        if 'xl/sharedStrings.xml' in self.template.namelist():
+            # Template sheets refer to the template strings by position.
+            sst = self.template.read('xl/sharedStrings.xml')
+            for el in re.findall(rb'<si>.*?</si>|<si/>', sst, flags=re.S):
+                self.strings.setdefault(el, len(self.shared_strings))
+                self.shared_strings.append(el)
+            count = re.search(rb'<sst[^>]* count="(\d+)"', sst)
+            self.string_count = int(count.group(1)) if count else \
+                len(self.shared_strings)
+        self.written = set()
+
+    def write_sheet(self, df, sheet_name):
+        """
+        Write a DataFrame with a header row and no index to a sheet.
+
+        Parameters
+        ----------
+        df : DataFrame
+            DataFrame written from cell A1.
+        sheet_name : string
+            Name of the sheet.
+
+        Returns
+        -------
+        None.
+
+        """
+        if sheet_name in self.written:
+            raise ValueError(f'Sheet {sheet_name} has already been written.')
+        if sheet_name not in self.sheets:
+            self.new_sheets.append(sheet_name)
+            self.sheets[sheet_name] = self.get_new_part()
+        part = self.sheets[sheet_name]
+        if part in self.template.namelist():
+            template = self.template.read(part).decode('utf-8')
+        else:
+            template = self.empty_sheet
+        # Keep the template style of the header cells.
+        header_styles = dict(re.findall(r'<c r="([A-Z]+)1" s="(\d+)"',
+                                        template))
+        head, tail = re.split(r'<sheetData>.*?</sheetData>|<sheetData/>',
+                              template, maxsplit=1, flags=re.S)
+        letters = [self.get_column_letter(i) for i in range(df.shape[1])]
+        if df.shape[1]:
+            ref = f'A1:{letters[-1]}{len(df) + 1}'
+        else:
+            ref = 'A1'
+        head = re.sub(r'<dimension ref="[^"]*"/>', f'<dimension ref="{ref}"/>',
+                      head)
+        with self.output.open(part, 'w') as f:
+            f.write((head + '<sheetData>').encode('utf-8'))
+            header = [self.get_cell(f'{el}1', col, header_styles.get(el))
+                      for el, col in zip(letters, df.columns)]
+            rows = [f'<row r="1">{"".join(header)}</row>']
+            for i, values in enumerate(df.itertuples(index=False), 2):
+                cells = [self.get_cell(f'{el}{i}', value)
+                         for el, value in zip(letters, values)]
+                rows.append(f'<row r="{i}">{"".join(cells)}</row>')
+                if len(rows) >= self.rows_per_write:
+                    f.write(''.join(rows).encode('utf-8'))
+                    rows = []
+            f.write((''.join(rows) + '</sheetData>' + tail).encode('utf-8'))
+        self.written.add(sheet_name)
+
+    def get_new_part(self):
+        """
+        Get a worksheet part name that no template part or sheet uses.
+
+        Template sheet parts are not always numbered 1 to n.
+
+        Returns
+        -------
+        part : string
+            Part name, as xl/worksheets/sheet5.xml.
+
+        """
+        used = set(self.template.namelist()) | set(self.sheets.values())
+        i = len(self.sheets) + 1
+        while f'xl/worksheets/sheet{i}.xml' in used:
+            i += 1
+        return f'xl/worksheets/sheet{i}.xml'
+
+    def get_cell(self, ref, value, style=None):
+        """
+        Get the XML of a cell.
+
+        Parameters
+        ----------
+        ref : string
+            Cell reference.
+        value : object
+            Cell value. Missing values give an empty cell.
+        style : string, optional
+            Index of the cell style. The default is None.
+
+        Returns
+        -------
+        string
+            XML of the cell.
+
+        """
+        attrs = f'r="{ref}"' if style is None else f'r="{ref}" s="{style}"'
+        if isinstance(value, (bool, np.bool_)):
+            return f'<c {attrs} t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, np.integer)):
+            return f'<c {attrs}><v>{value}</v></c>'
+        if isinstance(value, (float, np.floating)):
+            if not np.isfinite(value):
+                return f'<c {attrs}/>'
+            return f'<c {attrs}><v>{float(value)!r}</v></c>'
+        if value is None or value is pd.NaT or value is pd.NA:
+            return f'<c {attrs}/>'
+        return f'<c {attrs} t="s"><v>{self.get_string(str(value))}</v></c>'
+
+    def get_string(self, value):
+        """
+        Get the shared string index of a string, adding it when new.
+
+        Parameters
+        ----------
+        value : string
+            Cell text.
+
+        Returns
+        -------
+        int
+            Index of the string in the shared string table.
+
+        """
+        value = self.illegal_chars.sub('', value)
+        if value != value.strip() or '\n' in value or '\t' in value:
+            si = f'<si><t xml:space="preserve">{escape(value)}</t></si>'
+        else:
+            si = f'<si><t>{escape(value)}</t></si>'
+        key = si.encode('utf-8')
+        self.string_count += 1
+        if key not in self.strings:
+            self.strings[key] = len(self.shared_strings)
+            self.shared_strings.append(key)
+        return self.strings[key]
+
+    @staticmethod
+    def get_column_letter(index):
+        """
+        Get the column letter of a zero based column index.
+
+        Parameters
+        ----------
+        index : int
+            Column index.
+
+        Returns
+        -------
+        letter : string
+            Column letter.
+
+        """
+        letter = ''
+        index += 1
+        while index:
+            index, rem = divmod(index - 1, 26)
+            letter = uc[rem] + letter
+        return letter
+
+    def close(self):
+        """
+        Copy the remaining template parts and close the output.
+
+        Returns
+        -------
+        None.
+
+        """
+        written = {self.sheets[el] for el in self.written}
+        dropped = {'xl/calcChain.xml', 'xl/sharedStrings.xml'}
+        for info in self.template.infolist():
+            name = info.filename
+            if name in written or name in dropped:
+                continue
+            data = self.template.read(name)
+            if name == 'xl/workbook.xml':
+                data = self.patch_workbook(data.decode('utf-8'))
+            elif name == 'xl/_rels/workbook.xml.rels':
+                data = self.patch_rels(data.decode('utf-8'))
+            elif name == '[Content_Types].xml':
+                data = self.patch_content_types(data.decode('utf-8'))
+            self.output.writestr(info, data)
+        sst = (b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               b'<sst xmlns="' + self.ns['main'].encode('utf-8') +
+               f'" count="{self.string_count}" '
+               f'uniqueCount="{len(self.shared_strings)}">'.encode('utf-8') +
+               b''.join(self.shared_strings) + b'</sst>')
+        self.output.writestr('xl/sharedStrings.xml', sst)
+        self.output.close()
+        self.template.close()
+
+    def discard(self):
+        """
+        Close and delete the unfinished output.
+
+        It is called while an error is raised, so it never raises itself.
+
+        Returns
+        -------
+        None.
+
+        """
+        path = self.output.filename
+        for el in (self.output, self.template):
+            try:
+                el.close()
+            except Exception:
+                # The output is deleted whatever state it was left in.
+                pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def patch_workbook(self, data):
+        """
+        Add the new sheets to the workbook and recalculate on load.
+
+        Parameters
+        ----------
+        data : string
+            Template workbook part.
+
+        Returns
+        -------
+        data : string
+            Patched workbook part.
+
+        """
+        data, found = re.subn(r'<calcPr([^>]*?)\s*/>',
+                              lambda m: '<calcPr' + re.sub(
+                                  r'\s*fullCalcOnLoad="[^"]*"', '',
+                                  m.group(1)) + ' fullCalcOnLoad="1"/>', data)
+        if not found:
+            # calcPr goes before the elements that follow it in the schema.
+            tags = '|'.join(self.after_calc)
+            end = re.search(rf'<(?:{tags})[\s/>]|</workbook>', data)
+            data = (data[:end.start()] + '<calcPr fullCalcOnLoad="1"/>' +
+                    data[end.start():])
+        sheet_ids = [int(el) for el in re.findall(r'sheetId="(\d+)"', data)]
+        new = ''.join(
+            f'<sheet name={quoteattr(el)} sheetId="{max(sheet_ids) + i}" '
+            f'r:id="rIdReport{i}"/>'
+            for i, el in enumerate(self.new_sheets, 1))
+        return data.replace('</sheets>', new + '</sheets>').encode('utf-8')
+
+    def patch_rels(self, data):
+        """
+        Drop the calculation chain and add the new sheets to the relations.
+
+        Parameters
+        ----------
+        data : string
+            Template workbook relations part.
+
+        Returns
+        -------
+        data : string
+            Patched workbook relations part.
+
+        """
+        data = re.sub(r'<Relationship [^>]*Target="calcChain.xml"/>', '',
+                      data)
+        rels = data
+        if 'sharedStrings.xml' not in rels:
+            rels = rels.replace(
+                '</Relationships>',
+                '<Relationship Id="rIdReportStrings" Type="http://schemas.'
+                'openxmlformats.org/officeDocument/2006/relationships/'
+                'sharedStrings" Target="sharedStrings.xml"/></Relationships>')
+        new = ''.join(
+            f'<Relationship Id="rIdReport{i}" Type="{self.sheet_rel}" '
+            f'Target="{self.sheets[el][3:]}"/>'
+            for i, el in enumerate(self.new_sheets, 1))
+        return rels.replace('</Relationships>',
+                            new + '</Relationships>').encode('utf-8')
+
+    def patch_content_types(self, data):
+        """
+        Drop the calculation chain and add the new parts to the types.
+
+        Parameters
+        ----------
+        data : string
+            Template content types part.
+
+        Returns
+        -------
+        data : string
+            Patched content types part.
+
+        """
+        data = re.sub(r'<Override PartName="/xl/calcChain.xml"[^>]*/>', '',
+                      data)
+        parts = [self.sheets[el] for el in self.new_sheets]
+        new = ''.join(f'<Override PartName="/{el}" '
+                      f'ContentType="{self.sheet_type}"/>' for el in parts)
+        if '/xl/sharedStrings.xml' not in data:
+            new += ('<Override PartName="/xl/sharedStrings.xml" ContentType='
+                    '"application/vnd.openxmlformats-officedocument.'
+                    'spreadsheetml.sharedStrings+xml"/>')
+        return data.replace('</Types>', new + '</Types>').encode('utf-8')
+
+
+def psv_loadwriter(src_template_path, output_path):
+    """
+    Load the excel writer.
+
+    Parameters
+    ----------
+    src_template_path : string
+        Path to the excel template.
+    output_path : string
+        Path to which the output will be written.
+
+    Returns
+    -------
+    writer : ReportWriter object
+        ReportWriter object streaming the sheets into the template.
+
+    """
+    return ReportWriter(src_template_path, output_path)
+
+
+class ResultExporter:
+    """
+    The ResultExporter class saves the report tables as Parquet or Arrow files.
+
+    Tables are partitioned by device and test, as
+    <export_dir>/device=<device>/test=<test>/<table>.<format>, where table
+    is result or debug. The raw result chunks are appended to
+    test=raw/result.<format> as they are read. pyarrow is only needed
+    when exporting.
+
+    Parameters
+    ----------
+    export_dir : string
+        Root directory of the export.
+    device : string
+        Name of the device partition, as the result file name.
+    fmt : string, optional
+        'parquet' or 'arrow' for the Arrow IPC file format. The default is
+        'parquet'.
+
+    """
+
+    formats = ('parquet', 'arrow')
+
+    def __init__(self, export_dir, device, fmt='parquet'):
+        """
+        Instantiate the ResultExporter class.
+
+        Returns
+        -------
+        None.
+
+        """
+        if fmt not in self.formats:
+            raise ValueError(f'Export format {fmt} is not one of '
+                             f'{", ".join(self.formats)}.')
+        if importlib.util.find_spec('pyarrow') is None:
+            raise ImportError(pyarrow_missing)
+        self.root = os.path.join(export_dir, f'device={device}')
+        self.fmt = fmt
+        self.raw_writer = None
+        # Files written since the exporter was created or last closed.
+        self.paths = []
+
+    def get_path(self, sheet_name):
+        """
+        Get the path of the file of a report sheet.
+
+        Parameters
+        ----------
+        sheet_name : string
+            Name of the report sheet, as 'Trigger Test Debug'.
+
+        Returns
+        -------
+        string
+            Path of the file.
+
+        """
+        table = 'result'
+        if sheet_name.endswith(' Debug'):
+            sheet_name = sheet_name[:-len(' Debug')]
+            table = 'debug'
+        test = re.sub(r'\W+', '_', sheet_name.strip()).lower()
+        directory = os.path.join(self.root, f'test={test}')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f'{table}.{self.fmt}')
+
+    @staticmethod
+    def get_table(df):
+        """
+        Convert a DataFrame to an Arrow table.
+
+        Object and category columns are stored as strings, as report
+        columns can mix numbers and text.
+
+        Parameters
+        ----------
+        df : DataFrame
+            DataFrame to convert.
+
+        Returns
+        -------
+        table : pyarrow.Table
+            Table without the DataFrame index.
+
+        """
+        import pyarrow as pa
+
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == object or df[col].dtype.name == 'category':
+                df[col] = df[col].astype(object).where(
+                    df[col].isna(), df[col].astype(str))
+        df.columns = [str(el) for el in df.columns]
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+    def open_writer(self, path, schema):
+        self.paths.append(path)
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+
+            return pq.ParquetWriter(path, schema)
+        import pyarrow as pa
+
+        return pa.ipc.new_file(path, schema)
+
+    def write_sheet(self, df, sheet_name):
+        """
+        Save a report sheet.
+
+        Parameters
+        ----------
+        df : DataFrame
+            DataFrame of the sheet.
+        sheet_name : string
+            Name of the report sheet.
+
+        Returns
+        -------
+        None.
+
+        """
+        table = self.get_table(df)
+        with self.open_writer(self.get_path(sheet_name), table.schema) as f:
+            f.write_table(table)
+
+    def write_raw(self, chunks):
+        """
+        Append the raw result chunks to the raw table while passing them on.
+
+        Parameters
+        ----------
+        chunks : iterable
+            Iterable of DataFrames containing consecutive test results.
+
+        Yields
+        ------
+        chunk : DataFrame
+            The unchanged chunks.
+
+        """
+        for chunk in chunks:
+            table = self.get_table(chunk)
+            if self.raw_writer is None:
+                self.raw_writer = self.open_writer(self.get_path('Raw'),
+                                                   table.schema)
+            self.raw_writer.write_table(table)
+            yield chunk
+
+    def close(self):
+        """
+        Close the raw table.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.raw_writer is not None:
+            self.raw_writer.close()
+            self.raw_writer = None
+        self.paths = []
+
+    def abort(self):
+        """
+        Close the raw table and delete the files of an unfinished export.
+
+        It is called while an error is raised, so it never raises itself.
+        The files of a closed export are kept.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.raw_writer is not None:
+            try:
+                self.raw_writer.close()
+            except Exception:
+                # The files are deleted whatever state they were left in.
+                pass
+            self.raw_writer = None
+        for path in self.paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.paths = []
+
+
+class ReportProgress:
+    """
+    The ReportProgress class reports the progress of a report to a job.
+
+    It is passed to psv_processfile as an exporter. The progress is the
+    share of the result file read, as the frames are processed as they are
+    read, and the report sheets are written once the file is read.
+
+    Parameters
+    ----------
+    job : Job
+        Job of the report.
+    result_file : file
+        Binary file object the results are read from.
+    report_file : string
+        Path to which the report is written.
+
+    """
+
+    def __init__(self, job, result_file, report_file):
+        """
+        Instantiate the ReportProgress class.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.job = job
+        self.result_file = result_file
+        self.report_file = report_file
+        self.size = os.fstat(result_file.fileno()).st_size
+        self.rows = 0
+
+    def write_sheet(self, df, sheet_name):
+        written = os.path.getsize(self.report_file) / 2**20
+        self.job.update(text=f'Writing {sheet_name} '
+                        f'({written:.1f} MiB written)...', force=True)
+
+    def write_raw(self, chunks):
+        """
+        Count the result chunks as they are read, passing them on.
+
+        Parameters
+        ----------
+        chunks : iterable
+            Iterable of DataFrames containing consecutive test results.
+
+        Yields
+        ------
+        chunk : DataFrame
+            The unchanged chunks.
+
+        """
+        for chunk in chunks:
+            self.rows += len(chunk)
+            self.job.update(self.result_file.tell(), self.size,
+                            f'Processing results ({self.rows:,} rows read)...')
+            yield chunk
+
+    def close(self):
+        self.job.update(self.size, self.size, force=True)
 
-    while True:
-        mt_evts, mt_vals = mt_window.read(timeout=100)
-        if mt_evts is None or mt_evts == 'Cancel':
-            mt_window.close()
-            return None
-        if mt_evts == 'Ok' and all(mt_vals.values()):
-            md = get_md(mtrigs, mt_vals)
-            mt_window.close()
-            break
-    return md 
 
-def psv_save_excel(writer, output_path):
+def condition_chunk(chunk):
     """
-    Save the excel output and use win32 to squash a format bug.
+    Validate a chunk of raw results and downcast it to result_dtypes.
+
+    Missing, non-numeric and out of range cells are set to their value in
+    result_fills, so one bad row does not fail the whole file.
 
     Parameters
     ----------
-    writer : TYPE
-        DESCRIPTION.
-    output_path : TYPE
-        DESCRIPTION.
+    chunk : DataFrame
+        Chunk of the result csv, as parsed by read_csv.
 
     Returns
     -------
-    None.
+    chunk : DataFrame
+        Chunk with the dtypes of result_dtypes.
+    bad_df : DataFrame
+        Row number and invalid columns of every bad row of the chunk.
 
     """
-    import win32com.client
+    invalid = pd.DataFrame(False, index=chunk.index, columns=list(result_fills))
+    for col, fill in result_fills.items():
+        values = chunk[col]
+        if result_dtypes[col] is bool and values.dtype == object:
+            values = values.replace(result_bools)
+        if values.dtype != bool:
+            values = pd.to_numeric(values, errors='coerce')
+        if result_dtypes[col] is bool:
+            bad = ~values.isin([0, 1])
+        else:
+            info = np.iinfo(result_dtypes[col])
+            bad = values.isna() | (values % 1 != 0) | \
+                (values < info.min) | (values > info.max)
+        if bad.any():
+            invalid[col] = bad
+            values = values.where(~bad, fill)
+        chunk[col] = values.astype(result_dtypes[col])
+    rows = invalid.any(axis=1).to_numpy()
+    bad_df = pd.DataFrame({
+        'Row': chunk.index[rows],
+        'Columns': [', '.join(result_columns[col] for col in invalid.columns[el])
+                    for el in invalid.to_numpy()[rows]]})
+    return chunk, bad_df
+
+
+def describe_bad_rows(bad_rows, limit=10):
+    """
+    Describe the bad rows of a result file.
+
+    Parameters
+    ----------
+    bad_rows : list
+        List of DataFrames of bad rows, as filled by psv_readchunks.
+    limit : int, optional
+        Number of rows listed. The default is 10.
 
-    writer.save()
-    xl = win32com.client.DispatchEx("Excel.Application")
-    wb = xl.workbooks.open(output_path)
-    xl.Visible = False
-    wb.Close(SaveChanges=1)
-    xl.Quit()
+    Returns
+    -------
+    str
+        Description of the bad rows, or '' if there are none.
 
+    """
+    if not bad_rows:
+        return ''
+    df = pd.concat(bad_rows, ignore_index=True)
+    rows = [f'{el.Row} ({el.Columns})' for el in df.head(limit).itertuples()]
+    if len(df) > limit:
+        rows.append('...')
+    rows_text = 'row has' if len(df) == 1 else 'rows have'
+    return (f'{len(df)} {rows_text} missing or invalid values and count as '
+            'failed.\nRows: ' + '; '.join(rows))
+
+
+def psv_readchunks(input_file, chunksize=result_chunk_size, bad_rows=None):
+    """
+    Read the result of TestStand sequence in chunks.
+
+    Parameters
+    ----------
+    input_file : string or file
+        Path to the csv file containing the test results or the file.
+    chunksize : int, optional
+        Number of rows per chunk. The default is result_chunk_size.
+    bad_rows : list, optional
+        List to which a DataFrame of the bad rows of every chunk is
+        appended, as for describe_bad_rows. The default is None.
+
+    Yields
+    ------
+    chunk : DataFrame
+        Dataframe containing the conditioned output of chunksize rows.
 
-def process_tbyb(df, trig_reg_ddict):
     """
-    Process the TBYB df to generate result list.
+    reader = pd.read_csv(input_file, header=8, usecols=list(result_columns),
+                         dtype={' COND_TYPE': 'category'},
+                         chunksize=chunksize)
+    with reader:
+        for chunk in tracer.iterate('read_results', reader):
+            chunk, bad_df = condition_chunk(chunk)
+            if bad_rows is not None and len(bad_df):
+                bad_rows.append(bad_df)
+            yield chunk.rename(mapper=result_columns, axis=1)
+
+
+def psv_loadfile(input_file, chunksize=result_chunk_size, bad_rows=None):
+    """
+    Load and condition the result of TestStand sequence.
 
     Parameters
     ----------
-    df : pandas dataframe
-        Contains all TBYB tests.
+    input_file : string
+        Path to the csv file containing the test results.
+    chunksize : int, optional
+        Number of rows read at a time. The default is result_chunk_size.
+    bad_rows : list, optional
+        List to which the bad rows are appended. The default is None.
 
     Returns
     -------
-    res_dict : dict of results
-        Dictionary containing result of all TBYB tests.
+    df : Pandas DataFrame
+        Dataframe containing the conditioned output.
 
     """
-    # Get indices of test starts.
-    indices = df.query('Address == 255 & Write == 2').index.tolist()
-    adrs_offset = 5
-    dv_offset = 5
-    dv2_offset = 7
-    nv1_offset = 10
-    nv2_offset = 12
-    fv_offset = 15
-    res_list = []
-    for idx in indices:
-        res_dict = {}
-        adrs = int(df['Address'].iloc[idx + adrs_offset])
-        adrs = f'Reg0x{adrs:02X}'
-        res_dict['Address'] = adrs
-        dv = int(df['Read'].iloc[idx + dv_offset])
-        dv2 = int(df['Read'].iloc[idx + dv2_offset])
-        nv1 = int(df['Read'].iloc[idx + nv1_offset])
-        nv2 = int(df['Read'].iloc[idx + nv2_offset])
-        fv = int(df['Read'].iloc[idx + fv_offset])
-        check1 = dv == dv2
-        check2 = nv1 != dv
-        check3 = nv2 != dv
-        check4 = fv == nv2
-        if all([check1, any([check2, check3]), check4]):
-            res_dict['TBYB Result'] = 'O'
-        else:
-            res_dict['TBYB Result'] = '---'
-        res_list += [res_dict]
-    res_df = pd.DataFrame(res_list)
-    debug_df = pd.DataFrame(res_list)
-    return debug_df, res_df
+    df = pd.concat(psv_readchunks(input_file, chunksize, bad_rows),
+                   ignore_index=True)
+    # Concatenating chunks with different categories falls back to object.
+    df['Type'] = df['Type'].astype('category')
+    return df
 
 
-def process_counters(df, trig_reg_ddict, mtrig=False):
+def psv_splitframes(chunks):
     """
-    Process the Counter df to generate result list.
+    Split chunks of test results into complete test frames.
 
-    Each test frame begins with a write of 0x03 to Reg0xFF.
-    The test frame will contain the results of each counter
-    register on the register address associated with the test frame.
+    A frame starts at a header of its test code and runs up to the next
+    header of the same test or of a test run after it. Headers of earlier
+    tests are nested in the frame, as the trigger frames of an mTrig frame.
+    The last frame of each chunk is carried over to the next chunk until
+    it is complete.
 
     Parameters
     ----------
-    df : pandas dataframe
-        Contains all Counter test frames.
+    chunks : iterable
+        Iterable of DataFrames containing consecutive test results.
+
+    Yields
+    ------
+    code : int
+        Header code of the test.
+    segment : Segment
+        Segment of one or more complete frames of the test.
+
+    """
+    ranks = np.full(256, -1)
+    ranks[list(test_codes)] = np.arange(len(test_codes))
+    section = -1
+    leftover = None
+    chunks = iter(chunks)
+    while True:
+        chunk = next(chunks, None)
+        if chunk is not None:
+            columns = {k: chunk[k].to_numpy() for k in chunk.columns}
+            if leftover is not None:
+                columns = {k: np.concatenate([leftover[k], v])
+                           for k, v in columns.items()}
+        elif leftover is not None:
+            columns = leftover
+        else:
+            return
+        # A header opens a frame unless it belongs to an earlier test.
+        headers = np.flatnonzero(columns['Address'] == 255)
+        header_ranks = ranks[columns['Write'][headers]]
+        current = np.maximum.accumulate(np.maximum(header_ranks, section))
+        bounds = headers[(header_ranks == current) & (header_ranks >= 0)]
+        if len(bounds) == 0:
+            # Rows before the first test are not part of any frame.
+            leftover = None
+            continue
+        section = current[-1]
+        codes = columns['Write'][bounds]
+        if chunk is not None:
+            # The last frame may continue in the next chunk.
+            stop = bounds[-1]
+            leftover = {k: v[stop:].copy() for k, v in columns.items()}
+            codes = codes[:-1]
+        else:
+            leftover = None
+            stop = len(columns['Address'])
+        edges = np.flatnonzero(np.diff(codes)) + 1
+        edges = np.append(edges, len(codes))
+        for first, last in zip(np.append(0, edges[:-1]), edges):
+            if first == last:
+                continue
+            end = bounds[last] if last < len(bounds) else stop
+            yield int(codes[first]), Segment(columns, int(bounds[first]),
+                                             int(end))
+        if chunk is None:
+            return
+
+
+def process_section(code, segment, trig_reg_ddict):
+    """
+    Process a segment of complete test frames.
+
+    Parameters
+    ----------
+    code : int
+        Header code of the test.
+    segment : Segment
+        Segment of complete frames of the test.
+    trig_reg_ddict or TriggerTable : dict or TriggerTable
+        Multlevel dictionary containing register information.
 
     Returns
     -------
-    debug_df : pandas dataframe
-        Dataframe containing result of timed trigger tests
-        with debug information.
-
-    result_df: pandas dataframe
-        Dataframe containing condensed result of timed trigger tests.
+    debug_df : DataFrame
+        Dataframe containing the result with debug information.
+    result_df : DataFrame
+        Dataframe containing the condensed result.
 
     """
-    # mtrig trigger test cant reset so we need to change the offset.
-    # If not mtrig, add 1
-    mtrig = int(not mtrig)
-    # Get indices of test frame starts.
-    indices = df.query('Address == 255 & Write == 3').index.tolist()
-    indices += [len(df)]
-    adrs_offset = 5 + mtrig
-    # dv_offset = 4 + mtrig      Works but unnecessary.
-    nv1_offset = 6 + mtrig
-    nv2_offset = 11 + mtrig
-    count_offset = 13 + mtrig
-    fv_offset = 29 + mtrig
-    debug_dicts = []
-    result_dicts = []
-    for i in range(len(indices)-1):
-        sub_df = df.iloc[indices[i]:indices[i+1]]
-        sub_indices = sub_df.query(
-            'Address == 255 & Write == 4').index.tolist()
-        # get the address
-        adrs = sub_df['Address'].loc[indices[i] + adrs_offset]
-        adrs = f"0x{adrs:02X}"
-        for sub_idx in sub_indices:
-            tmp_dict = {'Register Address': adrs}
-            # get the dv Works but unneccesary.
-            # dv = sub_df['Read'].loc[sub_idx + dv_offset]
-            # get the first new value
-            nv1 = sub_df['Read'].loc[sub_idx + nv1_offset]
-            # get the second new value
-            nv2 = sub_df['Read'].loc[sub_idx + nv2_offset]
-            # get the trigger counter register
-            count_reg = sub_df['Address'].loc[sub_idx + count_offset]
-            # get the count pass fail value
-            c = sub_df['Read'].loc[
-                sub_idx + count_offset:sub_idx + count_offset + 15
-                ].values.tolist()
-            c_chk = sub_df['Pass'].loc[
-                sub_idx + count_offset:sub_idx + count_offset + 15]
-            c_chk = all(c_chk)
-            # get final value
-            fv = sub_df['Read'].loc[sub_idx + fv_offset]
-            fv = int(fv)
-            # Check 1: Verify nv1 not 0
-            chk1 = nv1 != 0
-            # Check 2: Verify nv2 == nv1
-            chk2 = nv2 == nv1
-            # Check 3: Verify final value == 0
-            chk3 = fv == 0
-            count_reg = trig_reg_ddict[f'0x{count_reg:02X}']
-            tmp_dict['Trigger Register'] = count_reg
-            tmp_dict['Counter Test'] = 'O' if c_chk else '---'
-            tmp_dict['Trigger Test'] = 'O' if all([chk1, chk2, chk3]) \
-                else '---'
-            debug_string = count_reg + ':\t'
-            if chk1:
-                debug_string += ""
-            else:
-                debug_string += "Write failed with all triggers unmasked.\t"
-            if chk2:
-                debug_string += ""
-            else:
-                debug_string += "Write occurred with all triggers masked.\t"
-            if chk3:
-                debug_string += ""
-            else:
-                debug_string += f"Final value of 0x{fv:02X}" + \
-                    " is unexpected with write value of 0x00\t"
-            if c_chk:
-                debug_string += ''
-            else:
-                debug_string += 'Count failure. Count reads: '
-                debug_string += '; '.join([f'0x{int(el):02X}' for el in c])
-            tmp_dict['Debug'] = debug_string
-            debug_dicts += [tmp_dict]
-    debug_df = pd.DataFrame(debug_dicts)
-    addresses = list(set(debug_df['Register Address'].values.tolist()))
-    addresses.sort()
-    for adrs in addresses:
-        success_tc = debug_df.query(
-            '`Register Address` == ' + f'"{adrs}"' +
-            ' & `Trigger Test` == "O"'
-                                    ).index.tolist()
-        success_tc = debug_df['Trigger Register'].loc[
-            success_tc].values.tolist()
-        success_cnt = debug_df.query(
-            '`Register Address` == ' + f'"{adrs}"' +
-            ' & `Counter Test` == "O"'
-                                    ).index.tolist()
-        success_cnt = debug_df['Trigger Register'
-                               ].loc[success_cnt].values.tolist()
-        result_dicts += [{'Register Address': adrs,
-                          'Successful Timed Triggers': '; '.join(success_tc),
-                          'Successful Counter Readback': '; '.join(success_cnt)
-                          }]
-    result_df = pd.DataFrame(result_dicts)
-    return debug_df, result_df
+    processors = {0: process_triggers,
+                  2: process_tbyb,
+                  3: process_counters,
+                  5: process_mtrigs}
+    return processors[code](segment, trig_reg_ddict)
 
 
-def process_triggers(df, trig_reg_ddict, mtrig=False):
+def parallel_sections(sections, trig_reg_ddict, workers):
     """
-    Process the trigger df to generate result list.
+    Process test sections in a process pool, keeping the serial order.
 
-    Each test frame begins with a write of 0x00 to Reg0xFF.
-    The test frame will contain the results of each trigger
-    register on the register address associated with the test frame.
+    mTrig sections are split into the test of every mTrig setting and the
+    other sections into consecutive parts of their frames. The results are
+    yielded in test order with at most two parts per worker in flight.
 
     Parameters
     ----------
-    df : pandas dataframe
-        Contains all trigger test frames.
-
-    Returns
-    -------
-    debug_df : pandas dataframe
-        Dataframe containing result of trigger tests with debug information.
+    sections : iterable
+        Iterable of (code, segment) pairs, as from psv_splitframes.
+    trig_reg_ddict or TriggerTable : dict or TriggerTable
+        Multlevel dictionary containing register information.
+    workers : int
+        Number of worker processes.
 
-    result_df: pandas dataframe
-        Dataframe containing condensed result of trigger tests.
+    Yields
+    ------
+    code : int
+        Header code of the test.
+    result : tuple
+        Debug and result dataframes of a part of the section.
 
     """
-    # Get indices of test frame starts.
-    indices = df.query('Address == 255 & Write == 0').index.tolist()
-    indices += [len(df)]
-    # mtrig trigger test cant reset so we need to change the offset.
-    # If not mtrig, add 1
-    mtrig = int(not mtrig)
-    adrs_offset = 5 + mtrig
-    # Default value works but is unnecessary
-    # dv_offset = 5
-    nv1_offset = 6 + mtrig
-    nv2_offset = 11 + mtrig
-    trig_offset = 12 + mtrig
-    fv_offset = 13 + mtrig
-    debug_dicts = []
-    result_dicts = []
-    for i in range(len(indices)-1):
-        sub_df = df.iloc[indices[i]:indices[i+1]]
-        sub_indices = sub_df.query(
-            'Address == 255 & Write == 1').index.tolist()
-        # get the address
-        adrs = sub_df['Address'].loc[indices[i] + adrs_offset]
-        adrs = f"0x{adrs:02X}"
-        for sub_idx in sub_indices:
-            tmp_dict = {'Register Address': adrs}
-            # get the dv
-            # Default value works but is unnecessary
-            # dv = sub_df['Read'].loc[sub_idx + dv_offset]
-            # get the first new value
-            nv1 = sub_df['Read'].loc[sub_idx + nv1_offset]
-            # get the second new value
-            nv2 = sub_df['Read'].loc[sub_idx + nv2_offset]
-            # get the trigger register
-            trig_reg = sub_df['Address'].loc[sub_idx + trig_offset]
-            trig_reg = f'0x{int(trig_reg):02X}'
-            # get the trig value
-            trig_val = sub_df['Write'].loc[sub_idx + trig_offset]
-            trig_val = f'0x{int(trig_val):02X}'
-            # get the trig from the register and value
-            trig = trig_reg_ddict[trig_reg][trig_val]
-            # get final value
-            fv = sub_df['Read'].loc[sub_idx + fv_offset]
-            fv = int(fv)
-            # Check 1: Verify nv1 not 0
-            chk1 = nv1 != 0
-            # Check 2: Verify nv2 == nv1
-            chk2 = nv2 == nv1
-            # Check 3: Verify final value == 0
-            chk3 = fv == 0
-            tmp_dict['Trigger Register'] = trig
-            tmp_dict['Trigger Test'] = 'O' if all([chk1, chk2, chk3]) \
-                else '---'
-            debug_string = trig_reg + ':\t'
-            if chk1:
-                debug_string += ""
-            else:
-                debug_string += "Write failed with all triggers unmasked.\t"
-            if chk2:
-                debug_string += ""
+    def collect(code, futures):
+        if code == 5:
+            return code, combine_mtrigs(el.result() for el in futures)
+        return code, futures[0].result()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for code, segment in sections:
+            if code == 5:
+                futures = [executor.submit(process_mtrig_setting, setting_df,
+                                           trig_reg_ddict, *setting)
+                           for setting_df, *setting in get_mtrig_settings(
+                               segment, trig_reg_ddict)]
+                pending.append((code, futures))
             else:
-                debug_string += "Write occurred with all triggers masked.\t"
-            if chk3:
-                debug_string += ""
-            else:
-                debug_string += f"Final value of 0x{fv:02X}" + \
-                    " is unexpected with write value of 0x00\t"
-            tmp_dict['Debug'] = debug_string
-            debug_dicts += [tmp_dict]
-    debug_df = pd.DataFrame(debug_dicts)
-    addresses = list(set(debug_df['Register Address'].values.tolist()))
-    addresses.sort()
-    for adrs in addresses:
-        success_tc = debug_df.query(
-            '`Register Address` == ' + f'"{adrs}"' +
-            ' & `Trigger Test` == "O"'
-                                    ).index.tolist()
-        success_tc = debug_df['Trigger Register'].loc[
-            success_tc].values.tolist()
-        result_dicts += [{'Register Address': adrs,
-                          'Successful Triggers': '; '.join(success_tc)}]
-    result_df = pd.DataFrame(result_dicts)
-    return debug_df, result_df
+                frames = segment.frame_index.frames(code)
+                size = max(1, len(frames) // (workers * 4))
+                for i in range(0, len(frames), size):
+                    part = segment.segment(frames[i][0],
+                                           frames[min(i + size,
+                                                      len(frames)) - 1][1])
+                    pending.append((code, [executor.submit(
+                        process_section, code, part, trig_reg_ddict)]))
+            while len(pending) > 2 * workers:
+                yield collect(*pending.pop(0))
+        for el in pending:
+            yield collect(*el)
+
+
+def psv_processfile(result_df, writer, trig_reg_ddict, rsa_file, mrd_file,
+                    workers=None, exporters=()):
+    """
+    Process the results.
+
+    Parameters
+    ----------
+    result_df : DataFrame or iterable
+        Dataframe containing the conditioned test result or an iterable of
+        its chunks, as from psv_readchunks.
+    writer : ReportWriter
+        Writer used to write to the Excel Sheets.
+    trig_reg_ddict : Dictionary
+        Multlevel dictionary containing register information.
+    rsa_file : string
+        Path to Register Status Analyzer output csv.
+    mrd_file : string
+        Path to Machine Readable PRD csv.
+    workers : int, optional
+        Number of worker processes. The default is None, which processes
+        the tests in this process.
+    exporters : iterable, optional
+        Exporters, as ResultExporter, that also save the raw results and
+        every sheet. The default is (), which only writes the Excel sheets.
 
+    Returns
+    -------
+    None.
 
-def process_mtrigs(df, trig_reg_ddict):
     """
-    Process the mtrig df to generate result list.
+    def write_sheet(df, sheet_name):
+        with tracer.span('write_sheet', sheet=sheet_name, rows=len(df)):
+            writer.write_sheet(df, sheet_name)
+            for exporter in exporters:
+                exporter.write_sheet(df, sheet_name)
+
+    df_dict = {'Trigger Test': {'Summary': trigger_summary,
+                                'Debug DF': [],
+                                'Result DF': []},
+               'Timed Trigger Test': {'Summary': counter_summary,
+                                      'Debug DF': [],
+                                      'Result DF': []},
+               'TBYB Test': {'Summary': None,
+                             'Debug DF': [],
+                             'Result DF': []},
+               'mTrig Test': {'Summary': None,
+                              'Debug DF': [],
+                              'Result DF': []}}
+    test_list = ['mTrig Test', 'Timed Trigger Test',
+                 'TBYB Test', 'Trigger Test']
 
-    Each test frame begins with a write of 0x05 to Reg0xFF.
-    The test frame will contain the results of each trigger
-    register and trigger counter on the register address associated
-    with the test frame.
+    # Look trigger names up by number in the processors.
+    trig_reg_ddict = get_trigger_table(trig_reg_ddict)
+    if isinstance(result_df, pd.DataFrame):
+        result_df = [result_df]
+    for exporter in exporters:
+        result_df = exporter.write_raw(result_df)
+    sections = psv_splitframes(result_df)
+    if workers is None:
+        results = ((code, process_section(code, segment, trig_reg_ddict))
+                   for code, segment in sections)
+    else:
+        results = parallel_sections(sections, trig_reg_ddict, workers)
+    # Each span also holds the reads of the chunks of its section.
+    results = tracer.iterate('process_section', results,
+                             count=lambda el: len(el[1][0]))
+    for code, (debug_df, res_df) in results:
+        k = test_codes[code]
+        df_dict[k]['Debug DF'] += [debug_df]
+        df_dict[k]['Result DF'] += [res_df]
+    for k in test_list:
+        if len(df_dict[k]['Debug DF']) > 0:
+            with tracer.span('summarize', test=k) as span:
+                debug_df = pd.concat(df_dict[k]['Debug DF'], ignore_index=True)
+                if df_dict[k]['Summary'] is None:
+                    res_df = pd.concat(df_dict[k]['Result DF'],
+                                       ignore_index=True)
+                else:
+                    # A register can have frames in more than one part.
+                    res_df = summarize_registers(debug_df,
+                                                 df_dict[k]['Summary'])
+                span.add(rows=len(res_df))
+            write_sheet(res_df, k)
+            if k != 'TBYB Test':
+                write_sheet(debug_df, k + ' Debug')
+    with tracer.span('read_rsa_mrd'):
+        rsa = pd.read_csv(rsa_file)
+        rsa.rename(columns={'Unnamed: 0': 'Address'}, inplace=True)
+        mrd = pd.read_csv(mrd_file)
+    write_sheet(rsa, 'RSA')
+    write_sheet(mrd, 'MRD')
+    for exporter in exporters:
+        exporter.close()
+
+
+def get_mgroups(mapping_file):
+    """
+    Load the mGroup of every mTrig register nibble from a mapping file.
+
+    A JSON file maps each register to a dictionary of nibble to mGroup, as
+    {"0x2D": {"[3:0]": "A", "[7:4]": "B"}}. A csv file has the columns
+    Register, Nibble and mGroup. Nibbles are given as [3:0] and [7:4] or as
+    the write masks 0xF0 and 0x0F.
 
     Parameters
     ----------
-    df : pandas dataframe
-        Contains all mtrig test frames.
+    mapping_file : string
+        Path to the .json or .csv mapping file.
 
     Returns
     -------
-    debug_df : pandas dataframe
-        Dataframe containing result of mtrig tests with debug information.
-
-    result_df: pandas dataframe
-        Dataframe containing condensed result of mtrig tests.
+    md : dict
+        Dictionary containing the mappable trigger information.
 
     """
-    # Get indices of test frame starts.
-    indices = df.query('Address == 255 & Write == 5').index.tolist()
-    indices += [len(df)]
-    # Offsets referenced from indices
-    adrs_offset = 8
-    mtrig_offset = 2
-    # Offsets referenced from sub_indices
-    setting_offset = -1
-    result_list = []
-    debug_list = []
-    for i in range(len(indices)-1):
-        # Split off an mtrig frame
-        # get the address
-        adrs = df['Address'].loc[indices[i] + adrs_offset]
-        adrs = f"0x{adrs:02X}"
-        mtrig_adrs = df['Address'].loc[indices[i] + mtrig_offset]
-        mtrig_adrs = f"0x{mtrig_adrs:02X}"
-        msk = df['Mask'].loc[indices[i] + mtrig_offset]
-        msk = f"0x{int(msk):02X}"
-        mtrig_grp = trig_reg_ddict[mtrig_adrs][msk]
-        # Get indices of each mtrig setting.
-        sub_indices = df.iloc[indices[i]:indices[i+1]].query(
-            'Address == 255 & Write == 6').index.tolist()
-        sub_indices = [el+2 for el in sub_indices]
-        sub_indices += [indices[i+1]]
-        for j in range(len(sub_indices)-1):
-            setting = df['Write'].loc[sub_indices[j] + setting_offset]
-            if msk == '0xF0':
-                setting = int(setting)
-            else:
-                setting = int(setting) >> 4
-            setting = trig_reg_ddict['mtrig'][f'0x{setting:02X}']
-            # print(df.iloc[sub_indices[j]:sub_indices[j+1]])
-            trig_res_debug_df, trig_res_df = process_triggers(
-                df.iloc[sub_indices[j]:sub_indices[j+1]
-                        ].reset_index(drop=True), trig_reg_ddict, mtrig=True)
-            tt_res_debug_df, tt_res_df = process_counters(
-                df.iloc[sub_indices[j]:sub_indices[j+1]
-                        ].reset_index(drop=True), trig_reg_ddict, mtrig=True)
-            success_trigs = trig_res_df[
-                'Successful Triggers'].values.tolist()[0]
-            success_ttrigs = tt_res_df[
-                'Successful Timed Triggers'].values.tolist()[0]
-            success_count = tt_res_df[
-                'Successful Counter Readback'].values.tolist()[0]
-            tmp_dict = {'Register Address': adrs,
-                        'mTrig Group': mtrig_grp,
-                        'mTrig Setting': setting,
-                        'Successful Triggers': success_trigs,
-                        'Successful Timed Triggers': success_ttrigs,
-                        'Successful Counter Readback': success_count}
-            result_list += [tmp_dict]
-            # Need to add mTrig group and mTrig setting
-            trig_res_debug_df['mTrig Group'] = mtrig_grp
-            tt_res_debug_df['mTrig Group'] = mtrig_grp
-            trig_res_debug_df['mTrig Setting'] = setting
-            tt_res_debug_df['mTrig Setting'] = setting
-            trig_res_debug_df['Test Name'] = 'Trigger'
-            tt_res_debug_df['Test Name'] = 'Timed Trigger'
-            debug_list += [trig_res_debug_df]
-            debug_list += [tt_res_debug_df]
-    debug_df = pd.concat(debug_list, ignore_index=True, sort=False)
-    debug_df = debug_df[['Register Address',
-                         'mTrig Group',
-                         'mTrig Setting',
-                         'Trigger Register',
-                         'Trigger Test',
-                         'Counter Test',
-                         'Debug',
-                         'Test Name']]
-    result_df = pd.DataFrame(result_list)
-    # print(result_df)
-    return debug_df, result_df
+    nibbles = {'[3:0]': '0xF0', '[7:4]': '0x0F'}
+    if mapping_file.lower().endswith('.json'):
+        with open(mapping_file) as f:
+            mapping = json.load(f)
+        rows = [(reg, nibble, grp) for reg, groups in mapping.items()
+                for nibble, grp in groups.items()]
+    else:
+        mapping = pd.read_csv(mapping_file, dtype=str)
+        rows = mapping[['Register', 'Nibble', 'mGroup']].values.tolist()
+    md = {}
+    for reg, nibble, grp in rows:
+        reg = f"0x{int(str(reg).strip().replace('Reg', ''), 16):02X}"
+        nibble = str(nibble).strip()
+        if nibble in nibbles:
+            nibble = nibbles[nibble]
+        else:
+            nibble = f'0x{int(nibble, 16):02X}'
+        if nibble not in nibbles.values():
+            raise ValueError(f'{nibble} of Reg{reg} is not a nibble mask.')
+        md.setdefault(reg, {})[nibble] = str(grp).strip()
+    return md
 
 
-def psv_loadwriter(src_template_path, output_path):
+def generate_report(result_file, rsa_file, mrd_file, template_file,
+                    report_file, md, workers=None, export_dir=None,
+                    export_format='parquet', db_file=None, lot=None,
+                    usid=None):
     """
-    Load the excel writer.
+    Generate the report of a result file without the GUI.
 
     Parameters
     ----------
-    src_template_path : string
+    result_file : string
+        Path to the csv file containing the test results.
+    rsa_file : string
+        Path to Register Status Analyzer output csv.
+    mrd_file : string
+        Path to Machine Readable PRD csv.
+    template_file : string
         Path to the excel template.
-    output_path : string
-        Path to which the output will be written.
+    report_file : string
+        Path to which the report is written.
+    md : dict
+        Dictionary containing the mappable trigger information, as from
+        get_mgroups.
+    workers : int, optional
+        Number of worker processes used for the tests of the file. The
+        default is None, which processes them in this process.
+    export_dir : string, optional
+        Root directory of a Parquet or Arrow export of the results. The
+        default is None, which only writes the report.
+    export_format : string, optional
+        'parquet' or 'arrow'. The default is 'parquet'.
+    db_file : string, optional
+        Path to a result database the run is added to. The default is None.
+    lot : string, optional
+        Lot of the device, stored with the run. The default is None.
+    usid : int, optional
+        USID of the device, stored with the run. The default is None.
 
     Returns
     -------
-    writer : ExcelWriter object
-        ExcelWriter object facilitates the writing of Excel documents.
+    report_file : string
+        Path of the report.
 
     """
-    from shutil import copyfile
-    from openpyxl import load_workbook
-
-    copyfile(src_template_path, output_path)
-    writer = pd.ExcelWriter(output_path, engine='openpyxl')
-    book = load_workbook(output_path)
-    writer.book = book
-    writer.sheets = dict((ws.title, ws) for ws in book.worksheets)
-    return writer
-
-
-def psv_loadfile(input_file):
+    tr_dict = get_tr_dict(None, md)
+    device = os.path.splitext(os.path.basename(result_file))[0]
+    exporters = []
+    bad_rows = []
+    writer = psv_loadwriter(template_file, report_file)
+    try:
+        if export_dir is not None:
+            exporters.append(ResultExporter(export_dir, device,
+                                            export_format))
+        if db_file is not None:
+            from psv_db import RunRecorder
+
+            exporters.append(RunRecorder(db_file, device, lot, usid,
+                                         result_file))
+        psv_processfile(psv_readchunks(result_file, bad_rows=bad_rows),
+                        writer, tr_dict, rsa_file, mrd_file, workers,
+                        exporters)
+        writer.close()
+    except BaseException:
+        # A failed report leaves no half written files or open exporters.
+        writer.discard()
+        for exporter in exporters:
+            exporter.abort()
+        raise
+    if bad_rows:
+        print(f'{result_file}: {describe_bad_rows(bad_rows)}')
+    return report_file
+
+
+def get_result_files(paths):
     """
-    Load and condition the result of TestStand sequence.
+    Expand directories and glob patterns into a list of result files.
 
     Parameters
     ----------
-    input_file : string
-        Path to the csv file containing the test results.
+    paths : list
+        List containing files, directories or glob patterns.
 
     Returns
     -------
-    df : Pandas DataFrame
-        Dataframe containing the conditioned output.
+    result_files : list
+        List containing the paths of the result csv files.
 
     """
-    header_dict = {' COND_TYPE': 'Type',
-                   ' COND_REG_ADDR': 'Address',
-                   ' COND_WRITE_MASK': 'Mask',
-                   ' COND_WRITE_DATA': 'Write',
-                   ' COND_EXPECTED_DATA': 'Expected',
-                   ' MEAS_READ_DATA': 'Read',
-                   ' MEAS_PARITY_OK': 'Parity',
-                   ' MEAS_PASS': 'Pass'}
-    df = pd.read_csv(input_file, header=8,
-                     usecols=[' COND_TYPE',
-                              ' COND_REG_ADDR',
-                              ' COND_WRITE_MASK',
-                              ' COND_WRITE_DATA',
-                              ' COND_EXPECTED_DATA',
-                              ' MEAS_READ_DATA',
-                              ' MEAS_PARITY_OK',
-                              ' MEAS_PASS'])
-    df = df.rename(mapper=header_dict, axis=1)
-    return df
+    result_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            result_files += sorted(glob(os.path.join(path, '*.csv')))
+        else:
+            result_files += sorted(glob(path))
+    result_files = [os.path.abspath(el) for el in result_files]
+    return list(dict.fromkeys(result_files))
 
 
-def psv_processfile(result_df, writer, trig_reg_ddict, rsa_file, mrd_file):
+def report_batch(result_files, rsa_file, mrd_file, template_file, output_dir,
+                 md, workers=None, **options):
     """
-    Process the results.
+    Generate the report of many result files in a process pool.
 
     Parameters
     ----------
-    result_df : DataFrame
-        Dataframe containing the conditioned test result.
-    writer : ExcelWriter
-        Writer used to write to the Excel Sheets.
-    trig_reg_ddict : Dictionary
-        Multlevel dictionary containing register information.
+    result_files : list
+        List containing the paths of the result csv files.
     rsa_file : string
         Path to Register Status Analyzer output csv.
     mrd_file : string
         Path to Machine Readable PRD csv.
+    template_file : string
+        Path to the excel template.
+    output_dir : str
+        Directory in which one '<result name>_Report.xlsx' file per result
+        file is saved.
+    md : dict
+        Dictionary containing the mappable trigger information.
+    workers : int, optional
+        Number of worker processes. The default is None, which uses one
+        process per core.
+    **options
+        Export and database options passed on to generate_report.
 
     Returns
     -------
-    None.
+    results : dict
+        Dictionary mapping each result file to the path of its report, or
+        to the exception raised while generating it.
 
     """
-    from copy import deepcopy
-
-    df_dict = {'Trigger Test': {'Query': 'Address == 255 & Write == 0',
-                                'Function': process_triggers,
-                                'input DF': pd.DataFrame([]),
-                                'Debug DF': pd.DataFrame([]),
-                                'Result DF': pd.DataFrame([])},
-               'Timed Trigger Test': {'Query': 'Address == 255 & Write == 3',
-                                      'Function': process_counters,
-                                      'input DF': pd.DataFrame([]),
-                                      'Debug DF': pd.DataFrame([]),
-                                      'Result DF': pd.DataFrame([])},
-               'TBYB Test': {'Query': 'Address == 255 & Write == 2',
-                             'Function': process_tbyb,
-                             'input DF': pd.DataFrame([]),
-                             'Debug DF': pd.DataFrame([]),
-                             'Result DF': pd.DataFrame([])},
-               'mTrig Test': {'Query': 'Address == 255 & Write == 5',
-                              'Function': process_mtrigs,
-                              'input DF': pd.DataFrame([]),
-                              'Debug DF': pd.DataFrame([]),
-                              'Result DF': pd.DataFrame([])}}
-    test_list = ['mTrig Test', 'Timed Trigger Test',
-                 'TBYB Test', 'Trigger Test']
-
-    for k in test_list:
-        index = result_df.query(df_dict[k]['Query']).head(n=1)
-        if len(index) > 0:
-            index = index.index.tolist()[0]
-            df_dict[k]['input DF'] = deepcopy(result_df.iloc[index:])
-            df_dict[k]['input DF'].reset_index(drop=True, inplace=True)
-            result_df = result_df.truncate(after=index-1)
-            df_dict[k]['Debug DF'], df_dict[k]['Result DF'] = df_dict[
-                k]['Function'](df_dict[k]['input DF'], trig_reg_ddict)
-            df_dict[k]['Result DF'].to_excel(writer, sheet_name=k, index=False)
-            if k != 'TBYB Test':
-                df_dict[k]['Debug DF'].to_excel(writer,
-                                                sheet_name=k + ' Debug',
-                                                index=False)
-    rsa = pd.read_csv(rsa_file)
-    rsa.rename(columns={'Unnamed: 0': 'Address'}, inplace=True)
-    mrd = pd.read_csv(mrd_file)
-    rsa.to_excel(writer, sheet_name='RSA', index=False)
-    mrd.to_excel(writer, sheet_name='MRD', index=False)
+    os.makedirs(output_dir, exist_ok=True)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for result_file in result_files:
+            stem = os.path.splitext(os.path.basename(result_file))[0]
+            report_file = os.path.join(output_dir, f'{stem}_Report.xlsx')
+            futures[executor.submit(generate_report, result_file, rsa_file,
+                                    mrd_file, template_file, report_file,
+                                    md, **options)] = result_file
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except (Exception, SystemExit) as e:
+                results[futures[future]] = e
+    return {el: results[el] for el in result_files}
 
 
 def get_report_fn():
+    import PySimpleGUI as sg
+
     fn = sg.popup_get_file('Save Report As', title='Save As', save_as=True, file_types=(("XLSX Files","*.xlsx"),))
     if fn.endswith('.xlsx'):
         return fn
@@ -628,8 +2216,9 @@ def get_report_fn():
     return None
 
 
-def get_tr_dict(df):
-    md = get_mtrigs_result(df)
+def get_tr_dict(df, md=None):
+    if md is None:
+        md = get_mtrigs_result(df)
     if md is None:
         return
     tr_dict = {'0x1C': {'0x01': 'T0',
@@ -731,55 +2320,81 @@ def get_report_input():
     Returns
     -------
     _ : None or tuple
-        Returns tuple containing filenames for the RSA, MRD, Test Stand Results and Template or returns None.
+        Returns tuple containing filenames for the RSA, MRD, Test Stand Results and Template and the number of workers or returns None.
     """
+    import PySimpleGUI as sg
+
     tmp_path = str(Path(__file__).parent.resolve().as_posix()) + "/Resources/TEMPLATE_Post-Silicon Verification.xlsx"
     layout = [[sg.Text('RSA File:',size=(10, 1), justification='right'), sg.InputText('',size=(70, 1), key='-RSA-'), sg.FileBrowse(file_types=(("CSV Files","*.csv"),))],
               [sg.Text('MRD File:',size=(10, 1), justification='right'), sg.InputText('',size=(70, 1), key='-MRD-'), sg.FileBrowse(file_types=(("CSV Files","*.csv"),))],
               [sg.Text('Result File:',size=(10, 1), justification='right'), sg.InputText('',size=(70, 1), key='-RSLT-'), sg.FileBrowse(file_types=(("CSV Files","*.csv"),))],
               [sg.Text('Template File:',size=(10, 1), justification='right'), sg.InputText(tmp_path,size=(70, 1), key='-TMP-'), sg.FileBrowse(file_types=(("XLSX Files","*.xlsx"),))],
+              [sg.Checkbox('Process on all cores', key='-PAR-')],
               [sg.Stretch(), sg.Ok(size=(10, 1)), sg.Cancel(size=(10, 1)), sg.Stretch()]]
 
     ini_window = sg.Window("Report Generator",layout=layout)
 
     while True:
-        ini_evts, ini_vals = ini_window.read(timeout=100)
+        ini_evts, ini_vals = ini_window.read()
         if ini_evts is None or ini_evts == 'Cancel':
             ini_window.close()
             return None
         if ini_evts == "Ok" and validate_init(ini_vals):
             ini_window.close()
-            return ini_vals['-RSA-'], ini_vals['-MRD-'], ini_vals['-RSLT-'], ini_vals['-TMP-']
+            workers = os.cpu_count() if ini_vals['-PAR-'] else None
+            return ini_vals['-RSA-'], ini_vals['-MRD-'], ini_vals['-RSLT-'], ini_vals['-TMP-'], workers
     
 
 
+@tracer.session('report_gendo')
 def report_gendo():
     # Collect RSA, MRD, Results and Template
+    import PySimpleGUI as sg
+
     putin = get_report_input()
     if putin is None:
         return
-    rsa_fn, mrd_fn, rslt_fn, template_fn = putin
-
-    result_df = psv_loadfile(rslt_fn)
+    rsa_fn, mrd_fn, rslt_fn, template_fn, workers = putin
 
     # Populate trigger register dict
-    tr_dict = get_tr_dict(result_df)
+    tr_dict = get_tr_dict(psv_readchunks(rslt_fn))
     if tr_dict is None:
         return
     # Load Results
     report_fn = get_report_fn()
     if report_fn is None:
         return
-    try:
-
-        writer = psv_loadwriter(template_fn, report_fn)
-
-        psv_processfile(result_df, writer, tr_dict, rsa_fn, mrd_fn)
+    bad_rows = []
+
+    def generate(job):
+        with tracer.span('psv_loadwriter'):
+            writer = psv_loadwriter(template_fn, report_fn)
+
+        try:
+            with tracer.span('psv_processfile', workers=workers), \
+                    open(rslt_fn, 'rb') as f:
+                psv_processfile(psv_readchunks(f, bad_rows=bad_rows), writer,
+                                tr_dict, rsa_fn, mrd_fn, workers,
+                                [ReportProgress(job, f, report_fn)])
+            with tracer.span('save_report') as span:
+                writer.close()
+                span.add(bytes=os.path.getsize(report_fn))
+        except BaseException:
+            # A failed or cancelled report is not left half written.
+            writer.discard()
+            raise
 
-        psv_save_excel(writer, report_fn)
-
-        sg.popup_ok('Report Generation Complete')
-    except Exception as e:
-        print(e)
+    try:
+        run_job('Report Generator', generate, message='Generating report...',
+                progress=True)
+        if bad_rows:
+            sg.popup_ok('Report Generation Complete',
+                        describe_bad_rows(bad_rows))
+        else:
+            sg.popup_ok('Report Generation Complete')
+    except JobCancelled:
+        return
+    except (Exception, SystemExit) as e:
+        sg.popup(f'Unable to generate {report_fn}.\n{e}')
 
     return
@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+"""RFFE device simulator that runs test sequences offline."""
+import os
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from psv_report_gen import result_columns
+from psv_test_gen import (append_header, generate_mtrig_dict,
+                          get_tbyb_registers, get_trigger_registers, get_usid,
+                          rffe_dict)
+
+###################################################################################################
+#   RFFE Simulator   ##############################################################################
+###################################################################################################
+# Columns of a TestStand sequence, from its header line.
+sequence_columns = append_header()[-1].strip().split(',')
+# Result name of every command type. Types above 10 are array writes.
+command_names = {1: 'WRITE',
+                 2: 'READ',
+                 3: 'EXT_WRITE',
+                 4: 'EXT_READ',
+                 5: 'MASKED_WRITE'}
+read_types = (2, 4)
+sim_chunk_size = 2**18
+# SIREV_ID values that switch TBYB mode on and off.
+tbyb_on = 0xEE
+tbyb_off = 0xEF
+# Trigger loaded by every timed trigger counter register.
+counter_triggers = {rffe_dict[f'EXT_TRIG_CNT_{el}_H']: el for el in range(3, 18)}
+# A loaded counter runs down counter_load_steps half counts before the next
+# command and counter_steps half counts per command after that. This
+# reproduces the readback the sequence expects of a counter loaded with 0xFF.
+counter_load_steps = 21
+counter_steps = 33
+
+
+def get_byte(value):
+    """
+    Get the integer value of an MRD hex field, 0 for '---' or ''.
+
+    Parameters
+    ----------
+    value : str
+        MRD field, as '0x2B'.
+
+    Returns
+    -------
+    int
+        Value of the field.
+
+    """
+    try:
+        return int(str(value), 16)
+    except ValueError:
+        return 0
+
+
+class RffeDevice:
+    """
+    The RffeDevice class models a MIPI RFFE slave described by an MRD.
+
+    Registers hold their MRD default value and only their R/W bits (or bits
+    of unknown type) are written. A register with a trigger takes writes
+    directly while its trigger is masked and into a shadow register while it
+    is unmasked, which is copied into the register when the trigger fires.
+    Triggers 0-2 are fired and masked through PM_TRIG, triggers 3-17 through
+    EXT_TRIG_REG_A/B and EXT_TRIG_MASK_A/B, and the timed trigger counters
+    fire their trigger when they run out. The registers of an mTrig group
+    follow the trigger selected by their nibble of the mTrig control
+    register, with nibble 0 for T3 and 0xF for masked. TBYB registers are
+    only written while TBYB mode is set through SIREV_ID.
+
+    Parameters
+    ----------
+    mrd_df : DataFrame
+        DataFrame containing the MRD.
+    usid : int, optional
+        USID of the device. The default is None, which reads it from the MRD.
+    mgroups : dict, optional
+        mGroup of every mTrig register nibble, as from get_mgroups. The
+        default is None, which reads the mTrig control registers from the
+        MRD register names.
+
+    """
+
+    def __init__(self, mrd_df, usid=None, mgroups=None):
+        """
+        Instantiate the RffeDevice class.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.usid = get_usid(mrd_df) if usid is None else usid
+        self.defaults = [0] * 256
+        self.writable = [255] * 256
+        self.triggers = [None] * 256
+        bits = [f'D{el}' for el in range(7, -1, -1)]
+        for row in mrd_df[['Address', 'Value', 'Trig N'] + bits].values:
+            adrs = get_byte(row[0])
+            self.defaults[adrs] = get_byte(row[1])
+            # Reserved bits keep their default value.
+            self.writable[adrs] = sum(128 >> i for i, el in enumerate(row[3:])
+                                      if el not in ('R0', 'R1'))
+            trig = str(row[2]).strip().upper()
+            if trig[1:].isdigit() and trig[0] == 'T':
+                self.triggers[adrs] = int(trig[1:])
+            elif trig[:1] == 'M':
+                self.triggers[adrs] = trig
+        self.tbyb_registers = {get_byte(el[1]) for el in get_tbyb_registers(mrd_df)}
+        # mTrig group to control register and nibble shift.
+        self.mtrig_controls = {}
+        if mgroups is None:
+            regs = get_trigger_registers(mrd_df, mtrig=True)
+            for grp, control in generate_mtrig_dict(regs, mrd_df).items():
+                if control['Reg']:
+                    self.mtrig_controls[grp] = (get_byte(control['Reg']),
+                                                4 * (control['U/L'] == 'U'))
+        else:
+            for reg, nibbles in mgroups.items():
+                for msk, grp in nibbles.items():
+                    grp = grp.upper()
+                    grp = grp if grp.startswith('M') else f'M{grp}'
+                    self.mtrig_controls[grp] = (get_byte(reg),
+                                                4 * (msk == '0x0F'))
+        self.step = 0
+        self.reset()
+
+    def reset(self, power=True):
+        """
+        Reset the registers to their defaults.
+
+        Parameters
+        ----------
+        power : Boolean, optional
+            Flag for a power reset, which also leaves TBYB mode. The default
+            is True.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.registers = self.defaults.copy()
+        self.shadow = {}
+        # Trigger to counter register, load step and half counts.
+        self.counters = {}
+        self.next_fire = None
+        if power:
+            self.tbyb = False
+
+    def get_trigger(self, adrs):
+        trig = self.triggers[adrs]
+        if trig is None or isinstance(trig, int):
+            return trig
+        control = self.mtrig_controls.get(trig)
+        if control is None:
+            return None
+        setting = (self.registers[control[0]] >> control[1]) & 15
+        return None if setting == 15 else setting + 3
+
+    def is_masked(self, trig):
+        if trig < 3:
+            return bool(self.registers[rffe_dict['PM_TRIG']] & (8 << trig))
+        if trig < 11:
+            return bool(self.registers[rffe_dict['EXT_TRIG_MASK_A']] & (1 << (trig - 3)))
+        return bool(self.registers[rffe_dict['EXT_TRIG_MASK_B']] & (1 << (trig - 11)))
+
+    def fire(self, trig):
+        """
+        Copy the shadow registers of an unmasked trigger into the registers.
+
+        Parameters
+        ----------
+        trig : int
+            Trigger number.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.is_masked(trig):
+            return
+        for adrs in [el for el in self.shadow if self.get_trigger(el) == trig]:
+            self.registers[adrs] = self.shadow.pop(adrs)
+
+    def fire_bits(self, data, first):
+        for i in range(8):
+            if data & (1 << i) and first + i < 18:
+                self.fire(first + i)
+
+    def load_counter(self, adrs, data):
+        """
+        Load a timed trigger counter, or stop it with 0.
+
+        Parameters
+        ----------
+        adrs : int
+            Counter register address.
+        data : int
+            Counter value.
+
+        Returns
+        -------
+        None.
+
+        """
+        trig = counter_triggers[adrs]
+        self.registers[adrs] = data
+        self.counters.pop(trig, None)
+        if data:
+            self.counters[trig] = (adrs, self.step,
+                                   2 * data - counter_load_steps)
+        self.next_fire = min([self.get_fire_step(el) for el in self.counters.values()],
+                             default=None)
+
+    def get_fire_step(self, counter):
+        _, start, count = counter
+        return start + 1 + max(0, -(-count // counter_steps))
+
+    def get_count(self, counter):
+        _, start, count = counter
+        return max(0, count - counter_steps * (self.step - start - 1)) // 2
+
+    def run_counters(self):
+        """
+        Fire the triggers of the counters that ran out before this step.
+
+        Returns
+        -------
+        None.
+
+        """
+        for trig, counter in list(self.counters.items()):
+            if self.get_fire_step(counter) <= self.step:
+                del self.counters[trig]
+                self.registers[counter[0]] = 0
+                self.fire(trig)
+        self.next_fire = min([self.get_fire_step(el) for el in self.counters.values()],
+                             default=None)
+
+    def write(self, adrs, data):
+        """
+        Write a register.
+
+        Parameters
+        ----------
+        adrs : int
+            Register address.
+        data : int
+            Written value.
+
+        Returns
+        -------
+        None.
+
+        """
+        if adrs == rffe_dict['PM_TRIG']:
+            if data >> 6 == 1:
+                self.reset()
+                return
+            # The trigger bits are self clearing.
+            self.registers[adrs] = data & 0xF8
+            self.fire_bits(data & 7, 0)
+        elif adrs == rffe_dict['UDR_RST']:
+            if data & 128:
+                self.reset(power=False)
+        elif adrs == rffe_dict['EXT_TRIG_REG_A']:
+            self.fire_bits(data, 3)
+        elif adrs == rffe_dict['EXT_TRIG_REG_B']:
+            self.fire_bits(data, 11)
+        elif adrs in counter_triggers:
+            self.load_counter(adrs, data)
+        elif adrs == rffe_dict['SIREV_ID']:
+            if data in (tbyb_on, tbyb_off):
+                self.tbyb = data == tbyb_on
+        elif adrs in self.tbyb_registers and not self.tbyb:
+            return
+        else:
+            writable = self.writable[adrs]
+            data = (self.defaults[adrs] & ~writable) | (data & writable)
+            trig = self.get_trigger(adrs)
+            if trig is None or self.is_masked(trig):
+                self.registers[adrs] = data
+                self.shadow.pop(adrs, None)
+            else:
+                self.shadow[adrs] = data
+
+    def read(self, adrs):
+        """
+        Read a register.
+
+        Parameters
+        ----------
+        adrs : int
+            Register address.
+
+        Returns
+        -------
+        int
+            Register value, or the count of a running counter.
+
+        """
+        if adrs in counter_triggers:
+            counter = self.counters.get(counter_triggers[adrs])
+            if counter is not None:
+                return self.get_count(counter)
+        return self.registers[adrs]
+
+    def execute(self, commands):
+        """
+        Execute a chunk of sequence commands.
+
+        Every command, answered or not, takes one step of bus time. Writes
+        are taken on the device USID and on the broadcast USID 0, reads only
+        on the device USID. Unanswered reads return 0 with a parity failure.
+
+        Parameters
+        ----------
+        commands : DataFrame
+            Enabled commands with the sequence_columns.
+
+        Returns
+        -------
+        read : ndarray
+            Read value of every command, 0 for writes.
+        parity : ndarray
+            Parity flag of every command.
+        passed : ndarray
+            Pass flag of every command.
+
+        """
+        step = self.step
+        read = [0] * len(commands)
+        columns = [commands[el].values.tolist() for el in sequence_columns[1:6]]
+        for i, (typ, usid, adrs, msk, data) in enumerate(zip(*columns)):
+            self.step = step + i
+            if self.next_fire is not None and self.next_fire <= self.step:
+                self.run_counters()
+            if typ in read_types:
+                if usid == self.usid:
+                    read[i] = self.read(adrs)
+            elif usid == self.usid or usid == 0:
+                if typ == 5:
+                    self.write(adrs, (self.registers[adrs] & msk) | (data & ~msk & 255))
+                elif typ > 10:
+                    ary = commands[sequence_columns[7:]].values[i, :typ - 10]
+                    for j, el in enumerate(ary.tolist()):
+                        self.write((adrs + j) & 255, el)
+                else:
+                    self.write(adrs, data)
+        self.step = step + len(commands)
+        read = np.array(read)
+        is_read = np.isin(commands['type'].values, read_types)
+        parity = ~is_read | (commands['usid'].values == self.usid)
+        passed = ~is_read | (parity & (read == commands['expectedReadData'].values))
+        return read, parity, passed
+
+
+def read_sequence(sequence_file, chunksize=sim_chunk_size):
+    """
+    Read the commands of a TestStand sequence in chunks.
+
+    Parameters
+    ----------
+    sequence_file : str
+        Path to the sequence csv file.
+    chunksize : int, optional
+        Number of commands per chunk. The default is sim_chunk_size.
+
+    Yields
+    ------
+    DataFrame
+        Enabled commands with the sequence_columns.
+
+    """
+    # Commands with array items end with a trailing ','.
+    reader = pd.read_csv(sequence_file, comment='#', header=0,
+                         names=sequence_columns, index_col=False,
+                         chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            chunk = chunk.fillna(0).astype(int)
+            yield chunk[chunk['enabled'] != 0]
+
+
+def format_results(first, commands, read, parity, passed):
+    """
+    Format executed commands as TestStand result lines.
+
+    The command fields and the measured fields are each formatted once per
+    distinct value and the lines are joined from the two lookups.
+
+    Parameters
+    ----------
+    first : int
+        Step of the first command.
+    commands : DataFrame
+        Executed commands with the sequence_columns.
+    read : ndarray
+        Read value of every command.
+    parity : ndarray
+        Parity flag of every command.
+    passed : ndarray
+        Pass flag of every command.
+
+    Returns
+    -------
+    str
+        Result lines.
+
+    """
+    fields = [commands[el].values.astype(np.int64) for el in sequence_columns[1:7]
+              if el != 'usid']
+    keys = fields[0]
+    for el in fields[1:]:
+        keys = keys << 8 | el
+    keys, inverse = np.unique(keys, return_inverse=True)
+    conditions = np.array([f"{command_names.get(el >> 32, 'EXT_WRITE_ARRAY')},"
+                           f"{el >> 24 & 255},{el >> 16 & 255},{el >> 8 & 255},"
+                           f"{el & 255},"
+                           for el in keys.tolist()], dtype=object)[inverse]
+    keys = read.astype(np.int64) << 2 | parity << 1 | passed
+    keys, inverse = np.unique(keys, return_inverse=True)
+    measures = np.array([f'{el >> 2},{el >> 1 & 1},{el & 1}\n'
+                         for el in keys.tolist()], dtype=object)[inverse]
+    return ''.join([f'{step},{condition}{measure}' for step, condition, measure
+                    in zip(range(first, first + len(commands)),
+                           conditions.tolist(), measures.tolist())])
+
+
+def get_preamble(sequence_file, mrd_file, usid):
+    lines = ['PSVerGUI RFFE simulator result',
+             f'Sequence: {os.path.basename(sequence_file)}',
+             f'MRD: {os.path.basename(mrd_file)}',
+             f'USID: 0x{usid:X}',
+             f"Date: {datetime.now().isoformat(timespec='seconds')}"]
+    lines += [''] * (8 - len(lines))
+    # The loader skips 8 lines, which must not hold field separators.
+    return ''.join([f"# {el.replace(',', ' ')}\n" for el in lines])
+
+
+def simulate(sequence_file, mrd_file, result_file, usid=None, mgroups=None,
+             chunksize=sim_chunk_size):
+    """
+    Run a TestStand sequence on an RFFE device modelled from an MRD.
+
+    The result is written in the TestStand result csv format read by
+    psv_loadfile.
+
+    Parameters
+    ----------
+    sequence_file : str
+        Path to the sequence csv file.
+    mrd_file : str
+        Path to the MRD csv file.
+    result_file : str
+        Path of the result csv file.
+    usid : int, optional
+        USID of the device. The default is None, which reads it from the MRD.
+    mgroups : dict, optional
+        mGroup of every mTrig register nibble, as from get_mgroups. The
+        default is None.
+    chunksize : int, optional
+        Number of commands per chunk. The default is sim_chunk_size.
+
+    Returns
+    -------
+    stats : dict
+        Number of commands, failed reads and simulated commands per second.
+
+    """
+    start = perf_counter()
+    device = RffeDevice(pd.read_csv(mrd_file, na_filter=False), usid, mgroups)
+    failed = 0
+    with open(result_file, 'w', newline='') as f:
+        f.write(get_preamble(sequence_file, mrd_file, device.usid))
+        f.write(', '.join(['STEP'] + [el.strip() for el in result_columns]) + '\n')
+        for commands in read_sequence(sequence_file, chunksize):
+            first = device.step
+            read, parity, passed = device.execute(commands)
+            failed += np.count_nonzero(~passed)
+            f.write(format_results(first, commands, read, parity, passed))
+    seconds = perf_counter() - start
+    return {'commands': device.step,
+            'failed': failed,
+            'rate': device.step / seconds if seconds else 0.0}
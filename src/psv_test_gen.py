@@ -4,10 +4,17 @@ Created on Wed Apr 29 16:17:20 2020.
 
 @author: joslaton
 """
-import PySimpleGUI as sg
+import numpy as np
 import pandas as pd
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain
 from string import ascii_uppercase as uc
+
+from psv_jobs import JobCancelled, run_job
+from psv_trace import tracer
 ###################################################################################################
 #   Command Sequence Gen  #########################################################################
 ###################################################################################################
@@ -40,6 +47,27 @@ rffe_dict = {
     'EXT_TRIG_CNT_9_H': 62,
     'EXT_TRIG_CNT_10_H': 63,
     'SIREV_ID': 164}
+write_buffer_size = 2**20
+write_batch_size = 2**14
+# Command record. Every field holds a byte and array holds nary items.
+# Commands are passed around packed into bytes in this layout.
+cmd_dtype = np.dtype([('enabled', np.uint8),
+                      ('type', np.uint8),
+                      ('usid', np.uint8),
+                      ('addr', np.uint8),
+                      ('mask', np.uint8),
+                      ('data', np.uint8),
+                      ('expected', np.uint8),
+                      ('array', np.uint8, 4),
+                      ('nary', np.uint8)])
+# Formatted line of every distinct command seen so far.
+cmd_lines = {}
+cmd_lines_max = 2**16
+# Test generated for every test key, as named in traces.
+test_names = {'-T-': 'triggered_write_test',
+              '-TBYB-': 'tbyb_test',
+              '-TT-': 'trig_counter_test',
+              '-MT-': 'mtrig_test'}
 
 # Functions
 def cmd_str_generator(enabled, typ, usid, regaddr, wrt_msk, reg_wrt_data, exp_rd_data, regwrary=[]):
@@ -73,24 +101,79 @@ def cmd_str_generator(enabled, typ, usid, regaddr, wrt_msk, reg_wrt_data, exp_rd
     Returns
     -------
     list
-        DESCRIPTION.
+        list contains a command packed in the layout of cmd_dtype.
 
     """
-    cmd_str = str(enabled) + ','
-    cmd_str += str(typ) + ','
-    cmd_str += str(usid) + ','
-    cmd_str += str(regaddr) + ','
-    cmd_str += str(wrt_msk) + ','
-    cmd_str += str(reg_wrt_data) + ','
-    cmd_str += str(exp_rd_data) + '\n'
     if regwrary:
         assert type(regwrary) == list
         assert len(regwrary) < 5
-        cmd_str = cmd_str.strip('\n') + ','
-        for val in regwrary:
-            cmd_str += str(val) + ','
-        cmd_str += '\n'
-    return [cmd_str]
+        array = regwrary + [0] * (4 - len(regwrary))
+        return [bytes([enabled, typ, usid, regaddr, wrt_msk, reg_wrt_data,
+                       exp_rd_data, *array, len(regwrary)])]
+    return [bytes((enabled, typ, usid, regaddr, wrt_msk, reg_wrt_data,
+                   exp_rd_data, 0, 0, 0, 0, 0))]
+
+
+def format_command(record):
+    """
+    Format a command record as a Test Stand sequence line.
+
+    Parameters
+    ----------
+    record : bytes
+        Command packed in the layout of cmd_dtype.
+
+    Returns
+    -------
+    str
+        Command line. Commands with array items end with a trailing ','.
+
+    """
+    cmd = np.frombuffer(record, dtype=cmd_dtype)[0]
+    fields = ['enabled', 'type', 'usid', 'addr', 'mask', 'data', 'expected']
+    line = ','.join([str(cmd[el]) for el in fields])
+    if cmd['nary']:
+        line += ',' + ''.join([f'{el},' for el in cmd['array'][:cmd['nary']]])
+    return line + '\n'
+
+
+def format_commands(records):
+    """
+    Serialize command records to the Test Stand sequence format.
+
+    Each distinct record is formatted once, the records are then a single
+    table lookup.
+
+    Parameters
+    ----------
+    records : ndarray
+        Structured array of commands with dtype cmd_dtype.
+
+    Returns
+    -------
+    str
+        Command lines.
+
+    """
+    if len(cmd_lines) > cmd_lines_max:
+        cmd_lines.clear()
+    rows = records.view(np.uint8).reshape(-1, cmd_dtype.itemsize)
+    if rows[:, 8:].any():
+        keys = records.view(f'V{cmd_dtype.itemsize}')
+    else:
+        # Without array items beyond the first, the first 8 bytes identify
+        # a record and sort much faster as an integer.
+        keys = np.ascontiguousarray(rows[:, :8]).view(np.uint64)[:, 0]
+    keys, inverse = np.unique(keys, return_inverse=True)
+    pad = bytes(cmd_dtype.itemsize - keys.itemsize)
+    lines = []
+    for key in keys:
+        key = key.tobytes() + pad
+        line = cmd_lines.get(key)
+        if line is None:
+            line = cmd_lines[key] = format_command(key)
+        lines.append(line)
+    return ''.join(np.array(lines, dtype=object)[inverse].tolist())
 
 
 def read_cmd_generator(adrs, usid, erd):
@@ -109,7 +192,7 @@ def read_cmd_generator(adrs, usid, erd):
     Returns
     -------
     list
-        list contains a command string.
+        list contains a command record.
 
     """
     return cmd_str_generator(1, 2, usid, adrs, 0, 0, erd)
@@ -131,7 +214,7 @@ def extend_read_cmd_generator(adrs, usid, erd):
     Returns
     -------
     list
-        list contains a command string.
+        list contains a command record.
 
     """
     return cmd_str_generator(1, 4, usid, adrs, 0, 0, erd)
@@ -182,7 +265,7 @@ def extend_write_cmd_generator(adrs, usid, wrt, ary=[]):
     """
     typ = 3
     if ary:
-        typ = '1' + str(len(ary))
+        typ = 10 + len(ary)
     return cmd_str_generator(1, typ, usid, adrs, 0, wrt, 0,
                              regwrary=ary)
 
@@ -219,18 +302,19 @@ def check_err_cmd_generator(usid, exp_read_err=False):
     ----------
     usid : int
         Set the USID for the command.
-    exp_read_err : TYPE, optional
-        DESCRIPTION. The default is False.
+    exp_read_err : bool, optional
+        Expect the read error bit to be set. The default is False, which
+        expects no error bits.
 
     Returns
     -------
-    TYPE
-        DESCRIPTION.
+    list
+        list contains a command packed in the layout of cmd_dtype.
 
     """
     if exp_read_err:
         return cmd_str_generator(1, 2, usid, rffe_dict['ERR_SUM'], 0, 0, 4)
-    return cmd_str_generator(1, 2, usid, rffe_dict['ERR_SUM'], 0, 0, -1)
+    return cmd_str_generator(1, 2, usid, rffe_dict['ERR_SUM'], 0, 0, 0)
 
 
 def pwr_rst_cmd_generator(usid, useusid=False):
@@ -567,6 +651,340 @@ def generate_mtrig_dict(regs, df):
     return md
 
 
+def triggered_write_block(usid, adrs, dv, mtrig=False):
+    """
+    Generate the PM and Extended Trigger test of one register.
+
+    Parameters
+    ----------
+    usid : int
+        Set the USID for the test.
+    adrs : int
+        Address to test.
+    dv : int
+        Default value of the register.
+    mtrig : Boolean, optional
+        Flag for registers tested inside an mTrig sequence, which skips the
+        UDR Reset. The default is False.
+
+    Yields
+    ------
+    bytes
+        Command packed in the layout of cmd_dtype.
+
+    """
+    # Send address change header.
+    yield from extend_write_cmd_generator(255, usid, 0)
+    for trig in range(18):
+        # Send trigger change header.
+        yield from extend_write_cmd_generator(255, usid, 1)
+        # Perform UDR Reset if not mtrig.
+        if not mtrig:
+            yield from udr_rst_cmd_generator(usid)
+        # Set all trigger masking.
+        yield from set_pm_trig_mask_cmd_generator(usid)
+        yield from set_ext_trig_mask_a_cmd_generator(usid)
+        yield from set_ext_trig_mask_b_cmd_generator(usid)
+        # Verify default value is correct.
+        yield from extend_read_cmd_generator(adrs, usid, dv)
+        # Write 0xFF to the register.
+        yield from extend_write_cmd_generator(adrs, usid, 255)
+        # Verify write occured.
+        yield from extend_read_cmd_generator(adrs, usid, 255)
+        # Clear all trigger masks.
+        yield from rm_pm_trig_msk_cmd_generator(usid)
+        yield from rm_ext_trig_msk_a_cmd_generator(usid)
+        yield from rm_ext_trig_msk_b_cmd_generator(usid)
+        # Write 0x00 to the register.
+        yield from extend_write_cmd_generator(adrs, usid, 0)
+        # Verify write hasnt occurred.
+        yield from extend_read_cmd_generator(adrs, usid, 0)
+        # Trigger
+        yield from trigger_cmd_generator(usid, trig)
+        # Verify write has occurred.
+        yield from extend_read_cmd_generator(adrs, usid, 0)
+
+
+def tbyb_block(usid, adrs, dv):
+    """
+    Generate the TBYB test of one register.
+
+    Parameters
+    ----------
+    usid : int
+        Set the USID for the test.
+    adrs : int
+        Address to test.
+    dv : int
+        Default value of the register.
+
+    Yields
+    ------
+    bytes
+        Command packed in the layout of cmd_dtype.
+
+    """
+    # Send address change header.
+    yield from extend_write_cmd_generator(255, usid, 2)
+    # Perform PWR Reset.
+    yield from pwr_rst_cmd_generator(usid)
+    # Set all trigger masking.
+    yield from set_pm_trig_mask_cmd_generator(usid)
+    yield from set_ext_trig_mask_a_cmd_generator(usid)
+    yield from set_ext_trig_mask_b_cmd_generator(usid)
+    # Verify default value is correct.
+    yield from extend_read_cmd_generator(adrs, usid, dv)
+    # Write 0xFF to the register.
+    yield from extend_write_cmd_generator(adrs, usid, 255)
+    # Verify no write occured.
+    yield from extend_read_cmd_generator(adrs, usid, dv)
+    # Set TBYB Mode to active.
+    yield from extend_write_cmd_generator(rffe_dict['SIREV_ID'], usid, 238)
+    # Write 0xFF to the register.
+    yield from extend_write_cmd_generator(adrs, usid, 255)
+    # Verify write occured.
+    yield from extend_read_cmd_generator(adrs, usid, 255)
+    # Write 0x00 to the register.
+    yield from extend_write_cmd_generator(adrs, usid, 0)
+    # Verify write occured.
+    yield from extend_read_cmd_generator(adrs, usid, 0)
+    # Set TBYB Mode to inactive.
+    yield from extend_write_cmd_generator(rffe_dict['SIREV_ID'], usid, 239)
+    # Write 0xFF to the register.
+    yield from extend_write_cmd_generator(adrs, usid, 255)
+    # Verify write did not occur.
+    yield from extend_read_cmd_generator(adrs, usid, 0)
+
+
+def trig_counter_block(usid, adrs, dv, mtrig=False):
+    """
+    Generate the Trigger Counter test of one register.
+
+    Parameters
+    ----------
+    usid : int
+        Set the USID for the test.
+    adrs : int
+        Address to test.
+    dv : int
+        Default value of the register.
+    mtrig : Boolean, optional
+        Flag for registers tested inside an mTrig sequence, which skips the
+        UDR Reset. The default is False.
+
+    Yields
+    ------
+    bytes
+        Command packed in the layout of cmd_dtype.
+
+    """
+    def set_clk_top_cmd_gen(usid, clk):
+        return write_cmd_generator(clk, usid, 255)
+
+    def read_clk_mult_cmd_gen(usid, clk):
+        c = [244, 228, 211, 195, 178, 162, 145, 129, 112, 96,
+             79, 63, 46, 30, 13, 0]
+        for el in c:
+            yield from read_cmd_generator(clk, usid, el)
+
+    # Send address change header.
+    yield from extend_write_cmd_generator(255, usid, 3)
+    for trig in range(3, 18):
+        # Send trigger change header.
+        yield from extend_write_cmd_generator(255, usid, 4)
+        # Perform UDR Reset if not mtrig.
+        if not mtrig:
+            yield from udr_rst_cmd_generator(usid)
+        # Set all trigger masking.
+        yield from set_pm_trig_mask_cmd_generator(usid)
+        yield from set_ext_trig_mask_a_cmd_generator(usid)
+        yield from set_ext_trig_mask_b_cmd_generator(usid)
+        # Verify default value is correct.
+        yield from extend_read_cmd_generator(adrs, usid, dv)
+        # Write 0xFF to the register.
+        yield from extend_write_cmd_generator(adrs, usid, 255)
+        # Verify write occured.
+        yield from extend_read_cmd_generator(adrs, usid, 255)
+        # Clear all trigger masks.
+        yield from rm_pm_trig_msk_cmd_generator(usid)
+        yield from rm_ext_trig_msk_a_cmd_generator(usid)
+        yield from rm_ext_trig_msk_b_cmd_generator(usid)
+        # Write 0x00 to the register.
+        yield from extend_write_cmd_generator(adrs, usid, 0)
+        # Verify write hasnt occurred.
+        yield from extend_read_cmd_generator(adrs, usid, 0)
+        # Set the clk to top value.
+        clk = rffe_dict[f'EXT_TRIG_CNT_{trig}_H']
+        yield from set_clk_top_cmd_gen(usid, clk)
+        # Verify clock readback.
+        yield from read_clk_mult_cmd_gen(usid, clk)
+        # Verify write has occurred.
+        yield from extend_read_cmd_generator(adrs, usid, 0)
+
+
+def mtrig_block(usid, adrs, dv, mtrig_reg, mtrig_mask):
+    """
+    Generate the mTrig test of one register.
+
+    Parameters
+    ----------
+    usid : int
+        Set the USID for the test.
+    adrs : int
+        Address to test.
+    dv : int
+        Default value of the register.
+    mtrig_reg : int
+        Address of the mTrig control register of the register's group.
+    mtrig_mask : int
+        Write mask selecting the group's nibble of mtrig_reg.
+
+    Yields
+    ------
+    bytes
+        Command packed in the layout of cmd_dtype.
+
+    """
+    # Send address change header
+    yield from extend_write_cmd_generator(255, usid, 5)
+    for i in range(15):
+        # Send mtrig change header
+        yield from extend_write_cmd_generator(255, usid, 6)
+        if mtrig_mask == 240:
+            val = i
+        elif mtrig_mask == 15:
+            val = i << 4
+        # Change the mtrig group's trigger.
+        yield from msk_wrt_cmd_generator(mtrig_reg, usid, mtrig_mask, val)
+        yield from triggered_write_block(usid, adrs, dv, mtrig=True)
+        yield from trig_counter_block(usid, adrs, dv, mtrig=True)
+
+
+class BlockTemplate:
+    """
+    The BlockTemplate class holds the commands of a per-register test block.
+
+    The block is generated once for two probe registers. The command fields
+    that follow the probe address or default value become slots, which are
+    filled for a whole register list at once by broadcasting.
+
+    Parameters
+    ----------
+    block : function
+        Generator function called as block(usid, adrs, dv, *args).
+    usid : int
+        Set the USID for the test.
+    *args
+        Remaining arguments of block.
+
+    """
+
+    probes = [(1, 3), (2, 4)]
+
+    def __init__(self, block, usid, *args):
+        """
+        Instantiate the BlockTemplate class.
+
+        Returns
+        -------
+        None.
+
+        """
+        runs = [np.frombuffer(b''.join(block(usid, adrs, dv, *args)),
+                              dtype=np.uint8).reshape(-1, cmd_dtype.itemsize)
+                for adrs, dv in self.probes]
+        (adrs_a, dv_a), (adrs_b, dv_b) = self.probes
+        varies = runs[0] != runs[1]
+        self.records = runs[0]
+        self.adrs_slots = varies & (runs[0] == adrs_a) & (runs[1] == adrs_b)
+        self.dv_slots = varies & (runs[0] == dv_a) & (runs[1] == dv_b)
+        assert not (varies & ~self.adrs_slots & ~self.dv_slots).any()
+        # Registers per tile, so that a tile stays around write_batch_size.
+        self.tile_size = max(1, write_batch_size // len(self.records))
+
+    def tile(self, adrs_lst, dv_lst):
+        """
+        Fill the template for a list of registers.
+
+        Parameters
+        ----------
+        adrs_lst : list of ints
+            Addresses to test.
+        dv_lst : list of ints
+            Default values list.
+
+        Returns
+        -------
+        records : ndarray
+            Structured array of dtype cmd_dtype containing the blocks of
+            all registers in order.
+
+        Raises
+        ------
+        ValueError
+            If an address or default value does not fit in a byte, as
+            cmd_str_generator does for a wide default such as 0x1FF.
+
+        """
+        adrs = np.array(adrs_lst, dtype=np.int64)
+        dv = np.array(dv_lst, dtype=np.int64)
+        for name, values in (('Address', adrs), ('Default value', dv)):
+            wide = (values < 0) | (values > 0xFF)
+            if wide.any():
+                i = np.flatnonzero(wide)[0]
+                raise ValueError(f'{name} 0x{values[i]:02X} of register '
+                                 f'0x{adrs[i]:02X} must be in range(0, 256)')
+        adrs = adrs.astype(np.uint8)[:, None, None]
+        dv = dv.astype(np.uint8)[:, None, None]
+        blocks = np.where(self.adrs_slots, adrs,
+                          np.where(self.dv_slots, dv, self.records))
+        return blocks.reshape(-1, cmd_dtype.itemsize).view(cmd_dtype)[:, 0]
+
+    def tiles(self, adrs_lst, dv_lst):
+        """
+        Fill the template for a list of registers, tile_size at a time.
+
+        Parameters
+        ----------
+        adrs_lst : list of ints
+            Addresses to test.
+        dv_lst : list of ints
+            Default values list.
+
+        Yields
+        ------
+        records : ndarray
+            Structured array of dtype cmd_dtype.
+
+        """
+        for i in range(0, len(adrs_lst), self.tile_size):
+            yield self.tile(adrs_lst[i:i + self.tile_size],
+                            dv_lst[i:i + self.tile_size])
+
+
+@lru_cache(maxsize=64)
+def get_template(block, usid, *args):
+    """
+    Get the cached template of a per-register test block.
+
+    Parameters
+    ----------
+    block : function
+        Generator function called as block(usid, adrs, dv, *args).
+    usid : int
+        Set the USID for the test.
+    *args
+        Remaining arguments of block.
+
+    Returns
+    -------
+    BlockTemplate
+        Template of the block.
+
+    """
+    return BlockTemplate(block, usid, *args)
+
+
 def triggered_write_test(usid, adrs_lst, dv_lst, mtrig=False):
     """
     Test PM and Extended Triggers with this function.
@@ -580,45 +998,14 @@ def triggered_write_test(usid, adrs_lst, dv_lst, mtrig=False):
     dv_lst : list of ints
         Default values list.
 
-    Returns
-    -------
-    TYPE
-        DESCRIPTION.
+    Yields
+    ------
+    records : ndarray
+        Structured array of dtype cmd_dtype.
 
     """
-    cmd_lst = []
-    for i in range(len(adrs_lst)):
-        # Send address change header.
-        cmd_lst += extend_write_cmd_generator(255, usid, 0)
-        for trig in range(18):
-            # Send trigger change header.
-            cmd_lst += extend_write_cmd_generator(255, usid, 1)
-            # Perform UDR Reset if not mtrig.
-            if not mtrig:
-                cmd_lst += udr_rst_cmd_generator(usid)
-            # Set all trigger masking.
-            cmd_lst += set_pm_trig_mask_cmd_generator(usid)
-            cmd_lst += set_ext_trig_mask_a_cmd_generator(usid)
-            cmd_lst += set_ext_trig_mask_b_cmd_generator(usid)
-            # Verify default value is correct.
-            cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, dv_lst[i])
-            # Write 0xFF to the register.
-            cmd_lst += extend_write_cmd_generator(adrs_lst[i], usid, 255)
-            # Verify write occured.
-            cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, 255)
-            # Clear all trigger masks.
-            cmd_lst += rm_pm_trig_msk_cmd_generator(usid)
-            cmd_lst += rm_ext_trig_msk_a_cmd_generator(usid)
-            cmd_lst += rm_ext_trig_msk_b_cmd_generator(usid)
-            # Write 0x00 to the register.
-            cmd_lst += extend_write_cmd_generator(adrs_lst[i], usid, 0)
-            # Verify write hasnt occurred.
-            cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, 0)
-            # Trigger
-            cmd_lst += trigger_cmd_generator(usid, trig)
-            # Verify write has occurred.
-            cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, 0)
-    return cmd_lst
+    template = get_template(triggered_write_block, usid, mtrig)
+    yield from template.tiles(adrs_lst, dv_lst)
 
 
 def tbyb_test(usid, adrs_lst, dv_lst):
@@ -634,44 +1021,14 @@ def tbyb_test(usid, adrs_lst, dv_lst):
     dv_lst : list of ints
         Default values list.
 
-    Returns
-    -------
-    cmd_lst
+    Yields
+    ------
+    records : ndarray
+        Structured array of dtype cmd_dtype.
 
     """
-    cmd_lst = []
-    for i in range(len(adrs_lst)):
-        # Send address change header.
-        cmd_lst += extend_write_cmd_generator(255, usid, 2)
-        # Perform PWR Reset.
-        cmd_lst += pwr_rst_cmd_generator(usid)
-        # Set all trigger masking.
-        cmd_lst += set_pm_trig_mask_cmd_generator(usid)
-        cmd_lst += set_ext_trig_mask_a_cmd_generator(usid)
-        cmd_lst += set_ext_trig_mask_b_cmd_generator(usid)
-        # Verify default value is correct.
-        cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, dv_lst[i])
-        # Write 0xFF to the register.
-        cmd_lst += extend_write_cmd_generator(adrs_lst[i], usid, 255)
-        # Verify no write occured.
-        cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, dv_lst[i])
-        # Set TBYB Mode to active.
-        cmd_lst += extend_write_cmd_generator(rffe_dict['SIREV_ID'], usid, 238)
-        # Write 0xFF to the register.
-        cmd_lst += extend_write_cmd_generator(adrs_lst[i], usid, 255)
-        # Verify write occured.
-        cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, 255)
-        # Write 0x00 to the register.
-        cmd_lst += extend_write_cmd_generator(adrs_lst[i], usid, 0)
-        # Verify write occured.
-        cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, 0)
-        # Set TBYB Mode to inactive.
-        cmd_lst += extend_write_cmd_generator(rffe_dict['SIREV_ID'], usid, 239)
-        # Write 0xFF to the register.
-        cmd_lst += extend_write_cmd_generator(adrs_lst[i], usid, 255)
-        # Verify write did not occur.
-        cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, 0)
-    return cmd_lst
+    template = get_template(tbyb_block, usid)
+    yield from template.tiles(adrs_lst, dv_lst)
 
 
 def trig_counter_test(usid, adrs_lst, dv_lst, mtrig=False):
@@ -687,60 +1044,14 @@ def trig_counter_test(usid, adrs_lst, dv_lst, mtrig=False):
     dv_lst : list of ints
         Default values list.
 
-    Returns
-    -------
-    cmd_lst
+    Yields
+    ------
+    records : ndarray
+        Structured array of dtype cmd_dtype.
 
     """
-    def set_clk_top_cmd_gen(usid, clk):
-        return write_cmd_generator(clk, usid, 255)
-
-    def read_clk_mult_cmd_gen(usid, clk):
-        c = [244, 228, 211, 195, 178, 162, 145, 129, 112, 96,
-             79, 63, 46, 30, 13, 0]
-        cmd_lst = []
-        for el in c:
-            cmd_lst += read_cmd_generator(clk, usid, el)
-        return cmd_lst
-
-    cmd_lst = []
-    if len(adrs_lst) < 1:
-        return cmd_lst
-    for i in range(len(adrs_lst)):
-        # Send address change header.
-        cmd_lst += extend_write_cmd_generator(255, usid, 3)
-        for trig in range(3, 18):
-            # Send trigger change header.
-            cmd_lst += extend_write_cmd_generator(255, usid, 4)
-            # Perform UDR Reset if not mtrig.
-            if not mtrig:
-                cmd_lst += udr_rst_cmd_generator(usid)
-            # Set all trigger masking.
-            cmd_lst += set_pm_trig_mask_cmd_generator(usid)
-            cmd_lst += set_ext_trig_mask_a_cmd_generator(usid)
-            cmd_lst += set_ext_trig_mask_b_cmd_generator(usid)
-            # Verify default value is correct.
-            cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, dv_lst[i])
-            # Write 0xFF to the register.
-            cmd_lst += extend_write_cmd_generator(adrs_lst[i], usid, 255)
-            # Verify write occured.
-            cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, 255)
-            # Clear all trigger masks.
-            cmd_lst += rm_pm_trig_msk_cmd_generator(usid)
-            cmd_lst += rm_ext_trig_msk_a_cmd_generator(usid)
-            cmd_lst += rm_ext_trig_msk_b_cmd_generator(usid)
-            # Write 0x00 to the register.
-            cmd_lst += extend_write_cmd_generator(adrs_lst[i], usid, 0)
-            # Verify write hasnt occurred.
-            cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, 0)
-            # Set the clk to top value.
-            clk = rffe_dict[f'EXT_TRIG_CNT_{trig}_H']
-            cmd_lst += set_clk_top_cmd_gen(usid, clk)
-            # Verify clock readback.
-            cmd_lst += read_clk_mult_cmd_gen(usid, clk)
-            # Verify write has occurred.
-            cmd_lst += extend_read_cmd_generator(adrs_lst[i], usid, 0)
-    return cmd_lst
+    template = get_template(trig_counter_block, usid, mtrig)
+    yield from template.tiles(adrs_lst, dv_lst)
 
 
 def mtrig_test(usid, mgroup_lst, mtrig_dict):
@@ -754,13 +1065,12 @@ def mtrig_test(usid, mgroup_lst, mtrig_dict):
     mgroup_lst : list
         List containing registers in the format [['Address', 'Value', 'Trig N']...].
 
-    Returns
-    -------
-    cmd_lst : TYPE
-        DESCRIPTION.
+    Yields
+    ------
+    records : ndarray
+        Structured array of dtype cmd_dtype.
 
     """
-    cmd_lst = []
     for reg in mgroup_lst:
         # Collect the register and mask for the mgroup
         mtrig_reg = mtrig_dict[reg[2]]['Reg']
@@ -770,22 +1080,8 @@ def mtrig_test(usid, mgroup_lst, mtrig_dict):
             mtrig_mask = 240
         elif mtrig_mask == 'U':
             mtrig_mask = 15
-        # Send address change header
-        cmd_lst += extend_write_cmd_generator(255, usid, 5)
-        for i in range(15):
-            # Send mtrig change header
-            cmd_lst += extend_write_cmd_generator(255, usid, 6)
-            if mtrig_mask == 240:
-                val = i
-            elif mtrig_mask == 15:
-                val = i << 4
-            # Change the mtrig group's trigger.
-            cmd_lst += msk_wrt_cmd_generator(mtrig_reg, usid, mtrig_mask, val)
-            cmd_lst += triggered_write_test(
-                usid, [int(reg[0], 16)], [int(reg[1], 16)], mtrig=True)
-            cmd_lst += trig_counter_test(
-                usid, [int(reg[0], 16)], [int(reg[1], 16)], mtrig=True)
-    return cmd_lst
+        template = get_template(mtrig_block, usid, mtrig_reg, mtrig_mask)
+        yield template.tile([int(reg[0], 16)], [int(reg[1], 16)])
 
 
 def append_header():
@@ -961,8 +1257,10 @@ def get_commands(df, mtrig_dict, usid):
 
     Returns
     -------
-    cmd_lst : list
-        List of strings containing commands to Test Stand sequence.
+    cmd_iter : iterator
+        Iterator over structured arrays of dtype cmd_dtype containing the
+        commands of the Test Stand sequence. The header is added by
+        save_commands.
 
     """
     # Collect information from MRD
@@ -971,16 +1269,14 @@ def get_commands(df, mtrig_dict, usid):
     mtrig_regs = get_trigger_registers(df, mtrig=True)
     addresses, default_values = get_register_info(trigger_regs)
     tbyb_addresses, tbyb_default_values = get_register_info(tbyb_regs)
-    # Construct command list
-    cmd_lst = append_header()
-    cmd_lst += triggered_write_test(usid, addresses, default_values)
-    cmd_lst += tbyb_test(usid, tbyb_addresses, tbyb_default_values)
-    cmd_lst += trig_counter_test(usid, addresses, default_values)
-    cmd_lst += mtrig_test(usid, mtrig_regs, mtrig_dict)
-    return cmd_lst
+    # Chain the command sequence
+    return chain(triggered_write_test(usid, addresses, default_values),
+                 tbyb_test(usid, tbyb_addresses, tbyb_default_values),
+                 trig_counter_test(usid, addresses, default_values),
+                 mtrig_test(usid, mtrig_regs, mtrig_dict))
 
 
-def get_test(key, usid, regs):
+def get_test(key, usid, regs, workers=None):
     """
     Get the test corresponding to the selected key.
 
@@ -992,8 +1288,19 @@ def get_test(key, usid, regs):
         Integer decimal valued USID for testing purposes.
     regs: list[list]
         List of lists containing information on selected registers.
+    workers : int, optional
+        Number of processes generating the test in parallel. The default is
+        None, which generates the test in this process.
+
+    Returns
+    -------
+    generator
+        Generator yielding structured arrays of dtype cmd_dtype containing
+        the commands of the test, or the formatted commands when workers is
+        given.
     """
-    
+    if workers is not None:
+        return parallel_test(key, usid, regs, workers)
     addresses, defaults = get_register_info(regs, key)
 
     if key == '-T-':
@@ -1008,26 +1315,154 @@ def get_test(key, usid, regs):
         return mtrig_test(usid, regs, md)
 
 
+def render_test(key, usid, regs):
+    """
+    Generate a test and format its commands.
+
+    Parameters
+    ----------
+    key : str
+        Key used to determine which test to generate.
+    usid : int
+        Integer decimal valued USID for testing purposes.
+    regs: list[list]
+        List of lists containing information on selected registers.
+
+    Returns
+    -------
+    str
+        Command lines of the test.
+
+    """
+    return ''.join([format_commands(el) for el in get_test(key, usid, regs)])
+
+
+def parallel_test(key, usid, regs, workers):
+    """
+    Generate a test in a process pool, keeping the serial command order.
+
+    The registers are split into consecutive parts that are generated and
+    formatted by the workers. The parts are yielded in register order with
+    at most two parts per worker in flight.
+
+    Parameters
+    ----------
+    key : str
+        Key used to determine which test to generate.
+    usid : int
+        Integer decimal valued USID for testing purposes.
+    regs: list[list]
+        List of lists containing information on selected registers.
+    workers : int
+        Number of worker processes.
+
+    Yields
+    ------
+    str
+        Command lines of consecutive parts of the test.
+
+    """
+    # The mTrig selection carries the mTrig control registers as last item.
+    tail = [regs.pop()] if key == '-MT-' else []
+    size = max(1, len(regs) // (workers * 4))
+    parts = [regs[i:i + size] + tail for i in range(0, len(regs), size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for part in parts:
+            pending.append(executor.submit(render_test, key, usid, part))
+            if len(pending) > 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
 def save_commands(cmd_lst, output_file):
     """
-    Save the command list to output_file.
+    Stream the header and the commands to output_file.
 
     Parameters
     ----------
-    cmd_lst : list
-        List of strings containing commands to Test Stand sequence.
+    cmd_lst : iterable
+        Iterable of structured arrays of dtype cmd_dtype containing the
+        commands of the Test Stand sequence, or of already formatted command
+        lines. Generators are consumed lazily so the sequence is never held
+        in memory.
     output_file : list
         Path of file to save commands in.
 
     Returns
     -------
-    None.
+    output_file : str
+        Path of the saved file.
 
     """
     if output_file.split('.')[-1] != 'csv':
         output_file += '.csv'
-    with open(output_file, 'w') as f:
-        f.writelines(cmd_lst)
+    with open(output_file, 'w', buffering=write_buffer_size) as f:
+        f.writelines(append_header())
+        for records in cmd_lst:
+            if isinstance(records, str):
+                f.write(records)
+            else:
+                f.write(format_commands(records))
+    return output_file
+
+
+def get_command_count(records):
+    """
+    Count the commands of a part of a test.
+
+    Parameters
+    ----------
+    records : ndarray or str
+        Structured array of dtype cmd_dtype or formatted command lines.
+
+    Returns
+    -------
+    int
+        Number of commands.
+
+    """
+    if isinstance(records, str):
+        return records.count('\n')
+    return len(records)
+
+
+def track_tests(job, tests, output_file=None):
+    """
+    Pass the parts of the tests on, reporting their progress to a job.
+
+    Parameters
+    ----------
+    job : Job
+        Job of the test generation.
+    tests : list[tuple]
+        List of (name, registers, test) of every test, where registers is
+        the number of registers of the test and test its generator.
+    output_file : str, optional
+        Path of the file the commands are saved in, to report the bytes
+        written. The default is None.
+
+    Yields
+    ------
+    ndarray or str
+        The unchanged parts of the tests.
+
+    """
+    total = sum(el[1] for el in tests)
+    done = 0
+    commands = 0
+    for name, registers, test in tests:
+        job.update(done, total, f'Generating {name}...', force=True)
+        for records in test:
+            commands += get_command_count(records)
+            text = f'{done:,} of {total:,} registers, {commands:,} commands'
+            if output_file is not None and os.path.exists(output_file):
+                text += f', {os.path.getsize(output_file) / 2**20:.1f} MiB'
+            job.update(done, total, text)
+            yield records
+        done += registers
+    job.update(done, total, force=True)
 
 
 def load_mrd():
@@ -1043,6 +1478,8 @@ def load_mrd():
     mrd_df : DataFrame
         DataFrame containing the MRD. Returns None if load or validation fails.
     """
+    import PySimpleGUI as sg
+
     mrd_filename = sg.popup_get_file('Select MRD File', file_types=(("CSV Files","*.csv"),)) 
     
     if mrd_filename is None or mrd_filename == '':
@@ -1080,16 +1517,20 @@ def choose_tests():
         Dictionary containing the selected tests.
 
     """
+    import PySimpleGUI as sg
+
     frame_layout = [[sg.Checkbox('TBYB', key='-TBYB-')],
                     [sg.Checkbox('Trigger', key='-T-')],
                     [sg.Checkbox('Timed Trigger', key='-TT-')],
                     [sg.Checkbox('Mappable Trigger', key='-MT-')]]
     layout = [[sg.Frame('Select Tests', frame_layout)],
+              [sg.Checkbox('Generate on all cores', key='-PAR-')],
               [sg.Ok(size=(10, 1)), sg.Cancel(size=(10, 1))]]
     test_window = sg.Window('Test Generator', layout=layout)
     test_events, test_values = test_window.read()
     test_window.Close()
-    if test_events is None or test_events == 'Cancel' or not any(test_values.values()):
+    if test_events is None or test_events == 'Cancel' or not any(
+            [test_values[k] for k in ['-TBYB-', '-T-', '-TT-', '-MT-']]):
         return None
     return test_values
 
@@ -1109,6 +1550,8 @@ def get_mgroup(reg):
         List containing information on an mTrig register.
 
     """
+    import PySimpleGUI as sg
+
     layout = [[sg.Text(f'Mappable Trigger Group for Register{reg[1]}:'),sg.DropDown([el for el in uc], uc[0], key='-G-', size=(4, 1))],
               [sg.Stretch(), sg.Ok(size=(10, 1)), sg.Cancel(size=(10, 1)), sg.Stretch()]]
     mg_window = sg.Window('Get mGroup', layout=layout)
@@ -1122,6 +1565,8 @@ def get_mgroup(reg):
 
 
 def generate_mt_layout(md):
+    import PySimpleGUI as sg
+
     col1 = [[sg.Text('mGroup')]]
     col2 = [[sg.Text('Control Register')]]
     col3 = [[sg.Text('Nibble')]]
@@ -1158,6 +1603,8 @@ def get_mtrig_dict(regs, df):
         List containing mtrig triggerable registers and Dictionary for the mtrig control group registers.
 
     """
+    import PySimpleGUI as sg
+
     # Collect mtrig group of any regs for which an mTrig group is not yet assigned. 
     for i in range(len(regs)):
         if 'M' not in regs[i][2]:
@@ -1173,7 +1620,7 @@ def get_mtrig_dict(regs, df):
     mt_window = sg.Window('mTrig Group Config',layout=layout)
     
     while True:
-        mt_evts, mt_vals = mt_window.read(timeout=100)
+        mt_evts, mt_vals = mt_window.read()
         if mt_evts is None or mt_evts == "Cancel":
             mt_window.close()
             return None
@@ -1206,6 +1653,8 @@ def generate_gs_layout(key, t1_values, t2_values):
         The layout for the Register Selection window.
 
     """
+    import PySimpleGUI as sg
+
     mx_w = max([len(el[0]) for el in t1_values + t2_values]) + 4
     
     ld = {'-TBYB-': {'Headings': ["Name","Address"],
@@ -1301,6 +1750,8 @@ def get_selections(key, df):
         List of lists containing information on selected registers as needed for testing.
 
     """
+    import PySimpleGUI as sg
+
     regs = []
     sd = {'-TBYB-': 'TBYB Register Selection',
           '-T-': 'Triggered Register Selection',
@@ -1312,7 +1763,7 @@ def get_selections(key, df):
     selection_window = sg.Window(sd[key], layout=layout)
     
     while True:
-        events, values = selection_window.Read(timeout=100)
+        events, values = selection_window.Read()
         if events is None or events == 'Cancel':
             selection_window.Close()
             break
@@ -1327,7 +1778,10 @@ def get_selections(key, df):
     return regs
 
 
+@tracer.session('test_gendo')
 def test_gendo():
+    import PySimpleGUI as sg
+
     mrd_df = load_mrd()
     if mrd_df is None:
         return
@@ -1335,17 +1789,42 @@ def test_gendo():
     if tv is None:
         return
     usid = get_usid(mrd_df)
-    cmd_lst = append_header()
+    workers = os.cpu_count() if tv['-PAR-'] else None
+    tests = []
     for key in ['-T-', '-TBYB-', '-TT-', '-MT-']:
         if tv[key]:
             regs = get_selections(key, mrd_df)
             if regs:
-                cmd_lst += get_test(key, usid, regs)
+                # Spans time the generation of the tests, not their writing.
+                tests += [(test_names[key], len(regs) - (key == '-MT-'),
+                           tracer.iterate(test_names[key],
+                                          get_test(key, usid, regs, workers),
+                                          count=get_command_count))]
             else:
                 return
     
     seq_filename = sg.popup_get_file('Save Test File As', save_as=True, file_types=(("CSV Files","*.csv"),))
     if seq_filename:
-        save_commands(cmd_lst, seq_filename)
+        if seq_filename.split('.')[-1] != 'csv':
+            seq_filename += '.csv'
+
+        def generate(job):
+            # The tests are generated as they are saved.
+            with tracer.span('save_commands') as span:
+                save_commands(track_tests(job, tests, seq_filename),
+                              seq_filename)
+                span.add(bytes=os.path.getsize(seq_filename))
+
+        try:
+            run_job('Test Generator', generate, message='Generating tests...',
+                    progress=True)
+        except (Exception, SystemExit) as e:
+            # A failed or cancelled sequence is not left half written.
+            try:
+                os.remove(seq_filename)
+            except OSError:
+                pass
+            if not isinstance(e, JobCancelled):
+                sg.popup(f'Unable to generate {seq_filename}.\n{e}')
     return
  
\ No newline at end of file
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""Tracing of the stages of MRD, test and report generation."""
+import json
+import os
+import threading
+import tracemalloc
+from contextlib import ContextDecorator
+from datetime import datetime
+from time import perf_counter_ns
+
+import pandas as pd
+
+###################################################################################################
+#   Trace Module   ################################################################################
+###################################################################################################
+# Directory to which every session saves its traces, if set.
+trace_dir = os.environ.get('PSV_TRACE_DIR')
+# Set PSV_TRACE_MEMORY=1 to trace the peak memory of every span.
+trace_memory = os.environ.get('PSV_TRACE_MEMORY') == '1'
+# Spans kept per session. Later spans are counted but dropped.
+max_spans = 2**14
+
+
+class Span:
+    """
+    The Span class times one stage and collects its counts.
+
+    Spans are created by Tracer.span and recorded when they exit.
+
+    Parameters
+    ----------
+    tracer : Tracer
+        Tracer that records the span.
+    name : str
+        Name of the stage.
+    args : dict
+        Counts and labels of the span, as rows or the sheet name.
+
+    """
+
+    def __init__(self, tracer, name, args):
+        """
+        Instantiate the Span class.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def add(self, **counts):
+        """
+        Add to the counts of the span.
+
+        Parameters
+        ----------
+        **counts
+            Counts added to the span, as rows=len(df). Labels are replaced.
+
+        Returns
+        -------
+        None.
+
+        """
+        for k, v in counts.items():
+            if isinstance(v, (int, float)) and isinstance(self.args.get(k), (int, float)):
+                self.args[k] += v
+            else:
+                self.args[k] = v
+
+    def __enter__(self):
+        if self.tracer.memory:
+            self.tracer.enter_peak()
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = perf_counter_ns()
+        peak = self.tracer.exit_peak() if self.tracer.memory else None
+        self.tracer.record(self, end, peak)
+        return False
+
+
+class NullSpan:
+    """
+    The NullSpan class stands in for a Span while tracing is disabled.
+
+    """
+
+    def add(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class Tracer:
+    """
+    The Tracer class records the spans of the stages of a session.
+
+    A span costs a few microseconds, so spans wrap whole stages, chunks or
+    register blocks. Tracing the peak memory of the spans starts tracemalloc,
+    which slows Python allocations down, so it is off unless requested.
+
+    Parameters
+    ----------
+    enabled : Boolean, optional
+        Flag to record spans. The default is True.
+    memory : Boolean, optional
+        Flag to trace the peak memory of every span. The default is False.
+
+    """
+
+    def __init__(self, enabled=True, memory=False):
+        """
+        Instantiate the Tracer class.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.enabled = enabled
+        self.memory = memory
+        self.lock = threading.Lock()
+        self.peaks = threading.local()
+        self.clear()
+
+    def clear(self):
+        self.epoch = perf_counter_ns()
+        self.spans = []
+        self.dropped = 0
+
+    def span(self, name, **args):
+        """
+        Time a stage.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        **args
+            Counts and labels of the span.
+
+        Returns
+        -------
+        Span or NullSpan
+            Context manager timing the stage.
+
+        """
+        if not self.enabled:
+            return NullSpan()
+        return Span(self, name, args)
+
+    def iterate(self, name, iterable, count=len, **args):
+        """
+        Time the production of every item of an iterable in its own span.
+
+        Only the time spent getting an item is traced, not the time the
+        consumer spends on it.
+
+        Parameters
+        ----------
+        name : str
+            Name of the spans.
+        iterable : iterable
+            Iterable of the stage, as the chunks of a reader.
+        count : callable, optional
+            Gives the rows of an item. The default is len.
+        **args
+            Labels of the spans.
+
+        Yields
+        ------
+        object
+            Items of iterable.
+
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.span(name, **args) as span:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    # The exhausted call is not a stage of its own.
+                    span.args['done'] = True
+                    break
+                span.add(rows=count(item))
+            yield item
+
+    def enter_peak(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        stack = self.get_peak_stack()
+        if stack:
+            stack[-1] = max(stack[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        stack.append(0)
+
+    def exit_peak(self):
+        stack = self.get_peak_stack()
+        peak = max(stack.pop(), tracemalloc.get_traced_memory()[1])
+        # The peak of a span counts toward the peak of its parent.
+        if stack:
+            stack[-1] = max(stack[-1], peak)
+        return peak
+
+    def get_peak_stack(self):
+        if not hasattr(self.peaks, 'stack'):
+            self.peaks.stack = []
+        return self.peaks.stack
+
+    def record(self, span, end, peak):
+        if span.args.pop('done', False):
+            return
+        event = {'name': span.name,
+                 'start': (span.start - self.epoch) / 1e9,
+                 'seconds': (end - span.start) / 1e9,
+                 'pid': os.getpid(),
+                 'tid': threading.get_ident(),
+                 'args': span.args}
+        if peak is not None:
+            event['peak_bytes'] = peak
+        with self.lock:
+            if len(self.spans) < max_spans:
+                self.spans.append(event)
+            else:
+                self.dropped += 1
+
+    def summary(self):
+        """
+        Summarize the spans of every stage.
+
+        Returns
+        -------
+        DataFrame
+            Calls, total and longest seconds, rows and peak memory of every
+            stage, in the order the stages first ended.
+
+        """
+        columns = ['Stage', 'Calls', 'Seconds', 'Longest', 'Rows', 'Peak MiB']
+        if not self.spans:
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame({
+            'Stage': [el['name'] for el in self.spans],
+            'Seconds': [el['seconds'] for el in self.spans],
+            'Rows': [el['args'].get('rows', 0) for el in self.spans],
+            'Peak MiB': [el.get('peak_bytes', float('nan')) / 2**20
+                         for el in self.spans]})
+        df = df.groupby('Stage', sort=False).agg(
+            Calls=('Seconds', 'size'), Seconds=('Seconds', 'sum'),
+            Longest=('Seconds', 'max'), Rows=('Rows', 'sum'),
+            **{'Peak MiB': ('Peak MiB', 'max')})
+        return df.reset_index()[columns]
+
+    def to_json(self, session=None):
+        return {'session': session,
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'memory': self.memory,
+                'dropped': self.dropped,
+                'spans': self.spans,
+                'summary': self.summary().to_dict(orient='records')}
+
+    def to_chrome(self):
+        """
+        Convert the spans to Chrome trace events.
+
+        The trace opens in chrome://tracing or Perfetto.
+
+        Returns
+        -------
+        dict
+            Trace with one complete event per span.
+
+        """
+        events = []
+        for el in self.spans:
+            args = dict(el['args'])
+            if 'peak_bytes' in el:
+                args['peak_bytes'] = el['peak_bytes']
+            events.append({'name': el['name'],
+                           'ph': 'X',
+                           'ts': el['start'] * 1e6,
+                           'dur': el['seconds'] * 1e6,
+                           'pid': el['pid'],
+                           'tid': el['tid'],
+                           'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, output_file, session=None, chrome=False):
+        """
+        Save the spans as a JSON trace or a Chrome trace-event file.
+
+        Parameters
+        ----------
+        output_file : str
+            Path of the .json file.
+        session : str, optional
+            Name of the session. The default is None.
+        chrome : Boolean, optional
+            Flag to save Chrome trace events. The default is False.
+
+        Returns
+        -------
+        output_file : str
+            Path of the .json file.
+
+        """
+        trace = self.to_chrome() if chrome else self.to_json(session)
+        with open(output_file, 'w') as f:
+            json.dump(trace, f, default=str)
+        return output_file
+
+    def session(self, name, output_dir=None):
+        """
+        Trace a session, as one run of a generator.
+
+        The spans of earlier sessions are cleared. If an output directory is
+        given, or set by PSV_TRACE_DIR, the session saves its JSON trace and
+        its Chrome trace there when it ends. The session has no span of its
+        own, as its time includes the popups waiting on the user.
+
+        Parameters
+        ----------
+        name : str
+            Name of the session.
+        output_dir : str, optional
+            Directory of the trace files. The default is None.
+
+        Returns
+        -------
+        Session
+            Context manager or decorator tracing the session.
+
+        """
+        return Session(self, name, output_dir or trace_dir)
+
+
+class Session(ContextDecorator):
+    """
+    The Session class traces one run of a generator.
+
+    It is used as a context manager or as a decorator of the generator.
+
+    Parameters
+    ----------
+    tracer : Tracer
+        Tracer that records the session.
+    name : str
+        Name of the session.
+    output_dir : str
+        Directory of the trace files, or None.
+
+    """
+
+    def __init__(self, tracer, name, output_dir):
+        """
+        Instantiate the Session class.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.tracer = tracer
+        self.name = name
+        self.output_dir = output_dir
+
+    def __enter__(self):
+        self.tracer.clear()
+        return self.tracer
+
+    def __exit__(self, *exc):
+        if self.output_dir and self.tracer.enabled:
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            path = os.path.join(self.output_dir, f'{self.name}_{stamp}')
+            try:
+                os.makedirs(self.output_dir, exist_ok=True)
+                self.tracer.save(f'{path}.json', self.name)
+                self.tracer.save(f'{path}.trace.json', chrome=True)
+            except OSError as e:
+                # A trace must never fail the run it traced.
+                print(f'Unable to save the trace: {e}')
+        return False
+
+
+tracer = Tracer(memory=trace_memory)
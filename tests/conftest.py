@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Fixtures shared by the tests of the PSVerGUI generators."""
+import gzip
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+from openpyxl import Workbook
+
+src_dir = Path(__file__).resolve().parents[1] / 'src'
+sys.path.insert(0, str(src_dir))
+
+from psv_mrd_gen import get_register_df, import_cols, save_mrd  # noqa: E402
+from psv_test_gen import (append_header, generate_mtrig_dict,  # noqa: E402
+                          get_estimated_registers, get_usid)
+
+data_dir = Path(__file__).resolve().parent / 'data'
+template_file = str(src_dir / 'Resources' /
+                    'TEMPLATE_Post-Silicon Verification.xlsx')
+sheets = ('Standard', 'Extended')
+
+###################################################################################################
+#   PRD Workbooks   ###############################################################################
+###################################################################################################
+# Rows of the standard sheet: address, name, [(bits, bit name, default)],
+# trigger and R/W.
+standard_rows = [
+    ('0x01', 'CTRL', [('[7:0]', 'DATA', '0x5A')], 'T0', 'R/W'),
+    ('0x02', 'CTRL_RSV', [('[7:4]', 'RESERVED', '0xA0'),
+                          ('[3:0]', 'DATA', None)], 'T1', 'R/W'),
+    ('0x04', 'BINARY', [('[7:4]', 'HI', '0101'),
+                        ('[3:0]', 'LO', '1010')], 'T2', 'R/W'),
+    ('0x06', 'READ_ONLY', [('[7:0]', 'STATUS', '0x3C')], None, 'R'),
+    ('0x1C', 'PM_TRIG', [('[7:0]', 'PM_TRIG', '0x00')], None, 'R/W'),
+    ('0x1D', 'PRODUCT_ID', [('[7:0]', 'PRODUCT_ID', '0x4F')], None, 'R'),
+    ('0x1E', 'MANUFACTURER_ID', [('[7:0]', 'MANUFACTURER_ID', '0x1A')],
+     None, 'R'),
+    ('0x1F', 'USID', [('[7:4]', 'RESERVED', '0x0B'),
+                      ('[3:0]', 'USID', None)], None, 'R/W'),
+]
+# Rows of the extended sheet: address, name, [(bits, function, default)],
+# trigger and TBYB.
+extended_rows = [
+    ('0x80', 'EXT_CTRL', [('[7:0]', 'CTRL', '0xCD')], 'T3', 'N'),
+    ('0xB0', 'EXT_TBYB', [('[7:0]', 'TBYB_CTRL', '0xA5')], 'N', 'Y'),
+]
+# Defaults of the edge case PRD cover lowercase hex, don't-care digits,
+# binary nibbles, a binary default wider than 8 bits and a non-hex default.
+edge_standard_rows = [
+    ('0x01', 'LOWER', [('[7:0]', 'DATA', '0x5a')], 'T0', 'R/W'),
+    ('0x02', 'LOWER_RSV', [('[7:4]', 'RESERVED', '0xab'),
+                           ('[3:0]', 'DATA', None)], 'T1', 'R/W'),
+    ('0x03', 'DONT_CARE', [('[7:0]', 'DATA', '0xXf')], 'T2', 'R/W'),
+    ('0x04', 'BINARY', [('[7:4]', 'HI', '0101'),
+                        ('[3:0]', 'LO', '1010')], 'T3', 'R/W'),
+    ('0x05', 'WIDE', [('[7]', 'RESERVED', '1'),
+                      ('[6:0]', 'DATA', '11111111')], 'T4', 'R/W'),
+    ('0x06', 'READ_ONLY', [('[7:0]', 'STATUS', '0x3c')], None, 'R'),
+    ('0x07', 'NOT_HEX', [('[7:0]', 'DATA', '0xzz')], 'T5', 'R/W'),
+    ('0x1C', 'PM_TRIG', [('[7:0]', 'PM_TRIG', '0x00')], None, 'R/W'),
+    ('0x1D', 'PRODUCT_ID', [('[7:0]', 'PRODUCT_ID', '0x4f')], None, 'R'),
+    ('0x1E', 'MANUFACTURER_ID', [('[7:0]', 'MANUFACTURER_ID', '0x1a')],
+     None, 'R'),
+    ('0x1F', 'USID', [('[7:4]', 'RESERVED', '0x1b'),
+                      ('[3:0]', 'USID', None)], None, 'R/W'),
+]
+edge_extended_rows = [
+    ('0x80', 'EXT_LOWER', [('[7:0]', 'CTRL', '0xcd')], 'T6', 'N'),
+    ('0x81', 'EXT_DONT_CARE', [('[7:0]', 'CTRL', '0x1x')], 'T7', 'N'),
+    ('0x82', 'EXT_NOT_HEX', [('[7:0]', 'CTRL', 'TBD.')], 'T8', 'N'),
+    ('0x83', 'EXT_PARTIAL', [('[3:0]', 'CTRL', '0x0F')], 'T9', 'N'),
+    ('0xB0', 'EXT_TBYB', [('[7:0]', 'TBYB_CTRL', '0xa5')], 'N', 'Y'),
+]
+
+
+def write_prd(prd_file, standard=standard_rows, extended=extended_rows):
+    """
+    Write a PRD workbook with a standard and an extended register sheet.
+
+    Parameters
+    ----------
+    prd_file : str
+        Path of the PRD .xlsx file.
+    standard : list, optional
+        Rows of the standard sheet. The default is standard_rows.
+    extended : list, optional
+        Rows of the extended sheet. The default is extended_rows.
+
+    Returns
+    -------
+    prd_file : str
+        Path of the PRD .xlsx file.
+
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheets[0])
+    ws.append(import_cols['standard'])
+    for adrs, name, fields, trig, rw in standard:
+        for i, (bits, bit_name, default) in enumerate(fields):
+            first = i == 0
+            ws.append(['User Defined' if first else None,
+                       'Yes' if first else None,
+                       adrs if first else None,
+                       name if first else None,
+                       bits, bit_name, default,
+                       'Yes', 'Yes',
+                       trig if first else None,
+                       'Yes', 'Yes', rw])
+    ws = wb.create_sheet(sheets[1])
+    ws.append(import_cols['extended'])
+    for adrs, name, fields, trig, tbyb in extended:
+        for i, (bits, function, default) in enumerate(fields):
+            first = i == 0
+            ws.append([adrs if first else None,
+                       name if first else None,
+                       8, bits, function, default,
+                       trig if first else None,
+                       'Y',
+                       tbyb if first else None])
+    wb.save(prd_file)
+    return prd_file
+
+
+@pytest.fixture(scope='session')
+def simple_prd(tmp_path_factory):
+    return write_prd(str(tmp_path_factory.mktemp('prd') / 'PRD.xlsx'))
+
+
+@pytest.fixture(scope='session')
+def edge_prd(tmp_path_factory):
+    return write_prd(str(tmp_path_factory.mktemp('prd') / 'edge_PRD.xlsx'),
+                     edge_standard_rows, edge_extended_rows)
+
+
+###################################################################################################
+#   Tiny Device   #################################################################################
+###################################################################################################
+# Tests of the tiny sequence, in the order they are generated.
+tiny_tests = ('-T-', '-TBYB-', '-TT-', '-MT-')
+# mGroup of the mTrig control register of tiny_PRD.xlsx.
+tiny_mgroups = {'0x06': {'0xF0': 'A'}}
+
+
+@pytest.fixture(scope='session')
+def tiny_files(tmp_path_factory):
+    """
+    Load the tiny device and unpack its sequence and result.
+
+    tiny_PRD.xlsx has four triggered registers, two triggers, one mGroup
+    and two TBYB registers. tiny_RSA.csv reads back the default of every
+    register and tiny_result.csv.gz is a run of the sequence with failures.
+
+    Returns
+    -------
+    files : dict
+        Paths of the PRD, MRD, RSA, sequence and result files and the usid,
+        mrd_df, register selections and mGroups of the device.
+
+    """
+    work_dir = tmp_path_factory.mktemp('tiny')
+    files = {'PRD': str(data_dir / 'tiny_PRD.xlsx'),
+             'MRD': str(work_dir / 'tiny_MRD.csv'),
+             'RSA': str(data_dir / 'tiny_RSA.csv'),
+             'sequence': str(work_dir / 'tiny_sequence.csv'),
+             'result': str(work_dir / 'tiny_result.csv')}
+    mrd_df, _ = get_register_df(files['PRD'], *sheets, use_cache=False)
+    save_mrd(mrd_df, files['MRD'])
+    selections = {}
+    for key in tiny_tests:
+        selections[key], _ = get_estimated_registers(key, mrd_df)
+    mtrig = selections['-MT-']
+    selections['-MT-'] = mtrig + [generate_mtrig_dict(mtrig, mrd_df)]
+    with gzip.open(data_file('tiny_sequence.csv.gz'), 'rt', newline='') as f:
+        with open(files['sequence'], 'w', newline='') as out:
+            out.writelines(append_header())
+            shutil.copyfileobj(f, out)
+    with gzip.open(data_file('tiny_result.csv.gz'), 'rb') as f:
+        with open(files['result'], 'wb') as out:
+            shutil.copyfileobj(f, out)
+    files.update(usid=get_usid(mrd_df), mrd_df=mrd_df, selections=selections,
+                 md=tiny_mgroups)
+    return files
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # Keep the register map cache of every test apart from the user's.
+    path = tmp_path / 'cache'
+    monkeypatch.setenv('PSV_CACHE_DIR', str(path))
+    return path
+
+
+def read_text(path):
+    with open(path, newline='') as f:
+        return f.read()
+
+
+def data_file(name):
+    return os.path.join(data_dir, name)
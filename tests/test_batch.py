@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""Tests of the batch command line."""
+import psv_batch
+from psv_report_gen import pyarrow_missing
+
+
+def test_report_export_needs_pyarrow(tiny_files, tmp_path, monkeypatch,
+                                     capsys):
+    monkeypatch.setattr(psv_batch, 'find_spec', lambda name: None)
+    code = psv_batch.main(['report', tiny_files['result'],
+                           '--rsa', tiny_files['RSA'],
+                           '--mrd', tiny_files['MRD'],
+                           '-o', str(tmp_path),
+                           '--export-dir', str(tmp_path / 'export')])
+    assert code == 1
+    assert capsys.readouterr().out.strip() == pyarrow_missing
+    assert not list(tmp_path.iterdir())
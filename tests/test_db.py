@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Tests of the result database."""
+import pandas as pd
+import pytest
+
+import psv_batch
+from conftest import data_dir, template_file
+from psv_db import ResultStore, sheet_columns
+from psv_report_gen import generate_report
+
+
+def read_sheet(sheet_name):
+    return pd.read_csv(data_dir / 'tiny_report' / f'{sheet_name}.csv')
+
+
+def get_failed(df):
+    # Rows of a debug sheet whose trigger or counter test failed.
+    failed = df['Trigger Test'] != 'O'
+    if 'Counter Test' in df:
+        failed |= df['Counter Test'] == '---'
+    return df[failed]
+
+
+@pytest.fixture
+def db_file(tiny_files, tmp_path):
+    """
+    Store the run of the tiny device in lot A, twice, and a passing device.
+
+    """
+    db_file = str(tmp_path / 'results.db')
+    for _ in range(2):
+        # A run added again replaces the earlier one.
+        generate_report(tiny_files['result'], tiny_files['RSA'],
+                        tiny_files['MRD'], template_file,
+                        str(tmp_path / 'Report.xlsx'), tiny_files['md'],
+                        db_file=db_file, lot='A', usid=tiny_files['usid'])
+    store = ResultStore(db_file)
+    run_id = store.add_run('passing', lot='A', usid=tiny_files['usid'])
+    for sheet_name in sheet_columns:
+        df = read_sheet(sheet_name)
+        for col in ('Trigger Test', 'Counter Test', 'TBYB Result'):
+            if col in df:
+                df[col] = df[col].where(df[col].isna(), 'O')
+        store.add_sheet(run_id, df, sheet_name)
+    store.add_run('other', lot='B')
+    store.close()
+    return db_file
+
+
+def test_runs(db_file):
+    store = ResultStore(db_file)
+    runs = store.query('SELECT device, lot, usid FROM runs ORDER BY run_id')
+    store.close()
+    assert runs.astype(object).where(runs.notna(), None).values.tolist() == [
+        ['tiny_result', 'A', 11], ['passing', 'A', 11], ['other', 'B', None]]
+
+
+def test_get_failures(db_file):
+    store = ResultStore(db_file)
+    failures = store.get_failures()
+    expected = sum(len(get_failed(read_sheet(el)))
+                   for el in sheet_columns if el != 'TBYB Test')
+    expected += (read_sheet('TBYB Test')['TBYB Result'] != 'O').sum()
+    assert len(failures) == expected
+    assert set(failures['device']) == {'tiny_result'}
+    assert failures['usid'].dtype == 'Int64'
+
+    df = get_failed(read_sheet('Trigger Test Debug'))
+    df = df.query('`Register Address` == "0x00" and '
+                  '`Trigger Register` == "T1"')
+    failures = store.get_failures(trig='T1', register='Reg0x00',
+                                  test='Trigger Test')
+    assert failures['debug'].tolist() == df['Debug'].tolist()
+    assert set(failures['register']) == {'0x00'}
+
+    df = get_failed(read_sheet('mTrig Test Debug'))
+    failures = store.get_failures(mtrig_setting='T3')
+    assert len(failures) == (df['mTrig Setting'] == 'T3').sum()
+    assert set(failures['mtrig_test']) == set(
+        df.query('`mTrig Setting` == "T3"')['Test Name'])
+    assert store.get_failures(lot='B').empty
+    store.close()
+
+
+def test_get_failing_lots(db_file, capsys):
+    store = ResultStore(db_file)
+    lots = store.get_failing_lots()
+    assert lots.values.tolist() == [['A', 2, 1]]
+    assert store.get_failing_lots(trig='T0', register='0x7F').empty
+    store.close()
+    assert psv_batch.main(['query', db_file, '--lots']) == 0
+    assert capsys.readouterr().out.split() == ['lot', 'devices', 'failing',
+                                               'A', '2', '1']
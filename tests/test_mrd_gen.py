@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""Tests of the MRD generator."""
+import os
+
+import pandas as pd
+import pytest
+
+import psv_mrd_gen
+from conftest import (data_file, edge_extended_rows, edge_standard_rows,
+                      read_text, sheets, standard_rows, write_prd)
+from psv_mrd_gen import (generate_mrd, get_cache_dir, get_cache_key,
+                         get_hash_file, get_mrd_diff, get_register_df,
+                         get_register_tables, parse_values, save_mrd,
+                         store_cached_tables, update_mrd)
+
+
+def get_row(df, address):
+    return df.set_index('Address').loc[address]
+
+
+def test_parse_values():
+    ints, dont_care, valid = parse_values(['0x5a', '0x1FF', '0x1x', 'TBD.'])
+    assert ints.tolist() == [0x5A, 0xFF, 0x10, 0]
+    assert dont_care.tolist() == [0, 0, 0x0F, 0]
+    assert valid.tolist() == [True, True, False, False]
+
+
+def test_mrd_matches_baseline(edge_prd, tmp_path):
+    # edge_MRD.csv was written by the baseline generator from the same PRD.
+    df, _ = get_register_df(edge_prd, *sheets, use_cache=False)
+    save_mrd(df, tmp_path / 'MRD.csv')
+    assert read_text(tmp_path / 'MRD.csv') == read_text(
+        data_file('edge_MRD.csv'))
+
+
+def test_value_case_is_kept(edge_prd):
+    df, _ = get_register_df(edge_prd, *sheets, use_cache=False)
+    values = df.set_index('Address')['Value']
+    assert values['0x01'] == '0x5a'
+    assert values['0x03'] == '0xxf'
+    assert values['0x04'] == '0x5A'
+    assert values['0x80'] == '0xcd'
+
+
+def test_wide_and_non_hex_defaults(edge_prd):
+    df, usid = get_register_df(edge_prd, *sheets, use_cache=False)
+    assert usid == 0xB
+    # The reserved bit of a 9 bit default takes the bit of its low byte.
+    assert get_row(df, '0x05')['D7'] == 'R1'
+    assert get_row(df, '0x07')['D7'] == 'R/W'
+    assert get_row(df, '0x82')['D0'] == 'R/W'
+
+
+@pytest.mark.parametrize('default, error', [('0x1x', SystemExit),
+                                            ('0xzz', SystemExit),
+                                            ('0012', Exception)])
+def test_invalid_defaults(tmp_path, default, error):
+    # Reserved bits need a hex default and binary defaults must be binary.
+    rows = [('0x02', 'RSV', [('[7:4]', 'RESERVED', default),
+                             ('[3:0]', 'DATA', None)], 'T1', 'R/W')]
+    prd_file = write_prd(str(tmp_path / 'PRD.xlsx'),
+                         standard=rows + standard_rows[-4:])
+    with pytest.raises(error):
+        get_register_df(prd_file, *sheets, use_cache=False)
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    # Count the register maps built instead of loaded from the cache.
+    calls = []
+    build = psv_mrd_gen.build_register_tables
+
+    def counted(*args):
+        calls.append(args)
+        return build(*args)
+
+    monkeypatch.setattr(psv_mrd_gen, 'build_register_tables', counted)
+    return calls
+
+
+def test_cache_hit_and_miss(edge_prd, cache_dir, builds, tmp_path):
+    miss = get_register_tables(edge_prd, *sheets)
+    hit = get_register_tables(edge_prd, *sheets)
+    assert len(builds) == 1
+    assert hit['usid'] == miss['usid']
+    for name in ('s_df', 'e_df', 'register_df'):
+        pd.testing.assert_frame_equal(hit[name], miss[name])
+    assert os.listdir(cache_dir) == [
+        get_cache_key(edge_prd, *sheets) + '.npz']
+    # A revised PRD misses the cache.
+    rows = edge_standard_rows[:1] + [
+        ('0x08', 'NEW', [('[7:0]', 'DATA', '0x01')], 'T0', 'R/W')
+    ] + edge_standard_rows[1:]
+    get_register_tables(write_prd(str(tmp_path / 'PRD.xlsx'), rows,
+                                  edge_extended_rows), *sheets)
+    assert len(builds) == 2
+
+
+def test_cache_corrupt_entry(edge_prd, cache_dir, builds):
+    get_register_tables(edge_prd, *sheets)
+    path = cache_dir / (get_cache_key(edge_prd, *sheets) + '.npz')
+    path.write_bytes(b'not an npz file')
+    df, _ = get_register_df(edge_prd, *sheets)
+    assert len(builds) == 2
+    assert path.read_bytes() != b'not an npz file'
+    assert df.equals(get_register_df(edge_prd, *sheets, use_cache=False)[0])
+
+
+def test_cache_eviction(edge_prd, cache_dir):
+    tables = get_register_tables(edge_prd, *sheets)
+    entry = next(cache_dir.iterdir())
+    size = os.path.getsize(entry)
+    entry.unlink()
+    for i, key in enumerate(['a', 'b', 'c']):
+        store_cached_tables(key, tables, str(cache_dir), 3 * size)
+        os.utime(cache_dir / f'{key}.npz', (i, i))
+    # The least recently used entries are evicted first.
+    store_cached_tables('d', tables, str(cache_dir), 3 * size)
+    assert sorted(os.listdir(cache_dir)) == ['b.npz', 'c.npz', 'd.npz']
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='POSIX permissions')
+def test_cache_dir_is_private(edge_prd, cache_dir, monkeypatch, tmp_path):
+    cache_dir.mkdir(mode=0o755)
+    os.chmod(cache_dir, 0o755)
+    get_register_tables(edge_prd, *sheets)
+    assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+    monkeypatch.delenv('PSV_CACHE_DIR')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'xdg'))
+    assert get_cache_dir() == str(tmp_path / 'xdg' / 'psv_cache')
+
+
+def test_cache_of_another_user(edge_prd, cache_dir, builds, monkeypatch):
+    get_register_tables(edge_prd, *sheets)
+    monkeypatch.setattr(os, 'getuid', lambda: os.stat(cache_dir).st_uid + 1,
+                        raising=False)
+    monkeypatch.setattr(os, 'name', 'posix')
+    get_register_tables(edge_prd, *sheets)
+    assert len(builds) == 2
+
+
+def test_get_mrd_diff():
+    old_df = pd.DataFrame({'Address': ['0x01', '0x02'],
+                           'Value': ['0x5a', '0x00'],
+                           'D0': ['R/W', 'R0']})
+    new_df = pd.DataFrame({'Address': ['0x01', '0x02'],
+                           'Value': ['0x5b', '0x00'],
+                           'D0': ['R/W', 'R1']})
+    diff_df = get_mrd_diff(old_df, new_df)
+    assert diff_df.values.tolist() == [['0x01', 'Value', '0x5a', '0x5b'],
+                                       ['0x02', 'D0', 'R0', 'R1']]
+    assert get_mrd_diff(old_df, old_df).empty
+
+
+@pytest.mark.parametrize('hashes', [True, False])
+def test_update_mrd(simple_prd, tmp_path, hashes):
+    mrd_file = generate_mrd(simple_prd, str(tmp_path / 'MRD.csv'), *sheets)
+    if not hashes:
+        # Without the row hashes of the old PRD every register is rebuilt.
+        os.remove(get_hash_file(mrd_file))
+    rows = [el for el in standard_rows if el[0] != '0x06']
+    rows[0] = ('0x01', 'CTRL', [('[7:0]', 'DATA', '0x5B')], 'T0', 'R/W')
+    rows.insert(1, ('0x08', 'NEW', [('[7:0]', 'DATA', '0x01')], 'T1', 'R'))
+    prd_file = write_prd(str(tmp_path / 'PRD.xlsx'), rows)
+    register_df, diff_df = update_mrd(prd_file, mrd_file, *sheets,
+                                      output_file=str(tmp_path / 'new.csv'),
+                                      diff_file=str(tmp_path / 'diff.csv'))
+    # The update gives the MRD of a full regeneration.
+    save_mrd(get_register_df(prd_file, *sheets, use_cache=False)[0],
+             tmp_path / 'full.csv')
+    assert read_text(tmp_path / 'new.csv') == read_text(tmp_path / 'full.csv')
+    old_df = pd.read_csv(mrd_file, dtype=str, keep_default_na=False)
+    assert diff_df.equals(get_mrd_diff(old_df, register_df))
+    assert set(diff_df['Address']) == {'0x01', '0x06', '0x08'}
+    assert diff_df.query('Address == "0x01" and Field == "Value"')[
+        ['Old', 'New']].values.tolist() == [['0x5A', '0x5B']]
+    assert pd.read_csv(tmp_path / 'diff.csv', dtype=str,
+                       keep_default_na=False).equals(diff_df)
+    assert os.path.exists(get_hash_file(str(tmp_path / 'new.csv')))
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Tests of the report generator."""
+import os
+import re
+import zipfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import psv_report_gen
+from conftest import data_dir, read_text, template_file
+from psv_db import ResultStore
+from psv_report_gen import (describe_bad_rows, generate_report, get_tr_dict,
+                            psv_loadfile, psv_loadwriter, psv_processfile,
+                            psv_readchunks, result_chunk_size, result_columns,
+                            result_dtypes)
+
+
+def write_result(result_file, source_file, cells):
+    # Replace cells of the source result, given as {(row, column): text}.
+    with open(source_file) as f:
+        lines = f.read().splitlines()
+    header = lines[8].split(',')
+    for (row, col), text in cells.items():
+        values = lines[9 + row].split(',')
+        values[header.index(f' {col}')] = text
+        lines[9 + row] = ','.join(values)
+    with open(result_file, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return str(result_file)
+
+
+class SheetCollector:
+    # Writer keeping the sheets of a report as DataFrames.
+    def __init__(self):
+        self.sheets = {}
+
+    def write_sheet(self, df, sheet_name):
+        self.sheets[sheet_name] = df
+
+
+@pytest.mark.parametrize('chunksize, workers', [(result_chunk_size, None),
+                                                (1000, None),
+                                                (97, None),
+                                                (1000, 2)])
+def test_report_sheets_match_baseline(tiny_files, chunksize, workers):
+    # The tiny_report sheets were written by the baseline report generator
+    # from the same results. Frames are split across chunk boundaries.
+    writer = SheetCollector()
+    psv_processfile(psv_readchunks(tiny_files['result'], chunksize), writer,
+                    get_tr_dict(None, tiny_files['md']), tiny_files['RSA'],
+                    tiny_files['MRD'], workers)
+    expected = sorted((data_dir / 'tiny_report').iterdir())
+    assert sorted(writer.sheets) == sorted(
+        [el.stem for el in expected] + ['MRD', 'RSA'])
+    for path in expected:
+        assert writer.sheets[path.stem].to_csv(index=False) == \
+            read_text(path), path.stem
+
+
+bad_cells = {(3, 'MEAS_READ_DATA'): '',
+             (5, 'MEAS_PASS'): '',
+             (5, 'MEAS_PARITY_OK'): 'maybe',
+             (7, 'COND_REG_ADDR'): 'zz',
+             (9, 'COND_WRITE_DATA'): '300',
+             (11, 'COND_EXPECTED_DATA'): '1.5',
+             (999, 'MEAS_READ_DATA'): '',
+             (1000, 'MEAS_READ_DATA'): 'nan'}
+bad_indices = [3, 5, 7, 9, 11, 999, 1000]
+
+
+@pytest.mark.parametrize('chunksize', [1000, 2**20])
+def test_bad_rows(tiny_files, tmp_path, chunksize):
+    result_file = write_result(tmp_path / 'result.csv',
+                               tiny_files['result'], bad_cells)
+    bad_rows = []
+    df = psv_loadfile(result_file, chunksize, bad_rows)
+    clean = psv_loadfile(tiny_files['result'])
+    assert len(df) == len(clean)
+    for col, dtype in result_dtypes.items():
+        if col in result_columns and dtype != 'category':
+            assert df[result_columns[col]].dtype == np.dtype(dtype)
+    text = describe_bad_rows(bad_rows)
+    assert text.startswith('7 rows have missing or invalid values')
+    assert text.endswith('Rows: 3 (Read); 5 (Parity, Pass); 7 (Address); '
+                         '9 (Write); 11 (Expected); 999 (Read); 1000 (Read)')
+    assert df.loc[[3, 999, 1000], 'Read'].tolist() == [-1, -1, -1]
+    assert not df.loc[5, 'Pass'] and not df.loc[5, 'Parity']
+    assert df.loc[7, 'Address'] == 0
+    assert df.loc[11, 'Expected'] == -1
+    good = ~df.index.isin(bad_indices)
+    assert df[good].equals(clean[good])
+
+
+def test_describe_bad_rows():
+    assert describe_bad_rows([]) == ''
+
+
+def test_report_with_bad_rows(tiny_files, tmp_path, capsys):
+    result_file = write_result(tmp_path / 'result.csv',
+                               tiny_files['result'], bad_cells)
+    report_file = generate_report(result_file, tiny_files['RSA'],
+                                  tiny_files['MRD'], template_file,
+                                  str(tmp_path / 'Report.xlsx'),
+                                  tiny_files['md'])
+    assert report_file == str(tmp_path / 'Report.xlsx')
+    assert '7 rows have missing or invalid values' in capsys.readouterr().out
+
+
+def test_report_error_leaves_no_output(tiny_files, tmp_path, monkeypatch):
+    def fail(*args):
+        raise RuntimeError('processor failed')
+
+    closed = []
+    close = ResultStore.close
+    monkeypatch.setattr(psv_report_gen, 'process_section', fail)
+    monkeypatch.setattr(ResultStore, 'close',
+                        lambda self: closed.append(close(self)))
+    report_file = tmp_path / 'Report.xlsx'
+    db_file = str(tmp_path / 'results.db')
+    with pytest.raises(RuntimeError, match='processor failed'):
+        generate_report(tiny_files['result'], tiny_files['RSA'],
+                        tiny_files['MRD'], template_file, str(report_file),
+                        tiny_files['md'], export_dir=str(tmp_path / 'export'),
+                        db_file=db_file)
+    # The report and the raw export table are deleted and no run is stored.
+    assert not report_file.exists()
+    assert [el for *_, files in os.walk(tmp_path / 'export')
+            for el in files] == []
+    assert len(closed) == 1
+    store = ResultStore(db_file)
+    assert store.query('SELECT * FROM runs').empty
+    store.close()
+
+def test_report_writer_opens_in_openpyxl(tmp_path):
+    df = pd.DataFrame({'Register': ['0x01', 'a < b & "c"', ' padded\tcell'],
+                       'Count': [1, 2, 3],
+                       'Ratio': [0.5, np.nan, 2.25],
+                       'Pass': [True, False, True],
+                       'Debug': ['ok', 'bell\x07', None]})
+    report_file = str(tmp_path / 'Report.xlsx')
+    writer = psv_loadwriter(template_file, report_file)
+    writer.write_sheet(df, 'Trigger Test')
+    writer.write_sheet(df.iloc[:0], 'TBYB Test')
+    writer.write_sheet(df, 'Extra')
+    writer.close()
+    template = openpyxl.load_workbook(template_file)
+    wb = openpyxl.load_workbook(report_file)
+    assert wb.sheetnames == template.sheetnames + ['Extra']
+    rows = [tuple(df.columns),
+            ('0x01', 1, 0.5, True, 'ok'),
+            ('a < b & "c"', 2, None, False, 'bell'),
+            (' padded\tcell', 3, 2.25, True, None)]
+    for name in ('Trigger Test', 'Extra'):
+        assert list(wb[name].values) == rows
+    assert list(wb['TBYB Test'].values) == [tuple(df.columns)]
+    # Sheets that are not written keep the template content.
+    assert list(wb['PRD RSA Comparison'].values) == \
+        list(template['PRD RSA Comparison'].values)
+
+
+def copy_template(path, patch):
+    # Copy the template, passing the name and data of every part to patch.
+    with zipfile.ZipFile(template_file) as src, \
+            zipfile.ZipFile(path, 'w') as out:
+        for info in src.infolist():
+            out.writestr(*patch(info.filename, src.read(info.filename)))
+    return str(path)
+
+
+def test_report_writer_adds_calc_pr(tmp_path):
+    def patch(name, data):
+        if name == 'xl/workbook.xml':
+            data = re.sub(rb'<calcPr[^>]*/>', b'', data)
+        return name, data
+
+    report_file = str(tmp_path / 'Report.xlsx')
+    writer = psv_loadwriter(copy_template(tmp_path / 'template.xlsx', patch),
+                            report_file)
+    writer.write_sheet(pd.DataFrame({'Register': ['0x01']}), 'Trigger Test')
+    writer.close()
+    with zipfile.ZipFile(report_file) as z:
+        workbook = z.read('xl/workbook.xml').decode('utf-8')
+        assert 'xl/calcChain.xml' not in z.namelist()
+    # The formulas of a template without calcPr are recalculated too.
+    assert '</sheets><calcPr fullCalcOnLoad="1"/><extLst>' in workbook
+    openpyxl.load_workbook(report_file)
+
+
+def test_report_writer_part_names(tmp_path):
+    def patch(name, data):
+        # The template sheet parts are not numbered 1 to n.
+        if name == 'xl/worksheets/sheet10.xml':
+            name = 'xl/worksheets/sheet11.xml'
+        elif not name.endswith('.bin'):
+            data = data.replace(b'sheet10.xml', b'sheet11.xml')
+        return name, data
+
+    template = copy_template(tmp_path / 'template.xlsx', patch)
+    report_file = str(tmp_path / 'Report.xlsx')
+    writer = psv_loadwriter(template, report_file)
+    writer.write_sheet(pd.DataFrame({'Register': ['0x01']}), 'Extra')
+    writer.close()
+    with zipfile.ZipFile(report_file) as z:
+        names = z.namelist()
+    assert len(names) == len(set(names))
+    template = openpyxl.load_workbook(template)
+    wb = openpyxl.load_workbook(report_file)
+    assert wb.sheetnames == template.sheetnames + ['Extra']
+    for name in template.sheetnames:
+        assert list(wb[name].values) == list(template[name].values), name
+    assert list(wb['Extra'].values) == [('Register',), ('0x01',)]
+
+
+def test_report_writer_discard(tmp_path):
+    report_file = str(tmp_path / 'Report.xlsx')
+    writer = psv_loadwriter(template_file, report_file)
+    with pytest.raises(RuntimeError):
+        with writer.output.open('xl/worksheets/partial.xml', 'w') as f:
+            f.write(b'<worksheet>')
+            raise RuntimeError('failed mid sheet')
+    writer.discard()
+    assert not os.path.exists(report_file)
+    # Discarding a closed writer does not raise.
+    writer.discard()
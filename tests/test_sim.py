@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests of the RFFE device simulator."""
+import json
+
+import numpy as np
+import pandas as pd
+
+import psv_batch
+from conftest import read_text
+from psv_report_gen import get_tr_dict, psv_loadfile, psv_processfile
+from psv_sim import command_names, read_types, simulate
+
+
+def read_result(path):
+    # Rows of a result file without the header naming its files and date.
+    return [el for el in read_text(path).splitlines(True)
+            if not el.startswith('#')]
+
+
+class SheetCollector:
+    # Writer keeping the sheets of a report as DataFrames.
+    def __init__(self):
+        self.sheets = {}
+
+    def write_sheet(self, df, sheet_name):
+        self.sheets[sheet_name] = df
+
+
+def test_simulate_round_trip(tiny_files, tmp_path):
+    sequence = pd.read_csv(tiny_files['sequence'], skiprows=3,
+                           usecols=range(7))
+    result_file = str(tmp_path / 'result.csv')
+    stats = simulate(tiny_files['sequence'], tiny_files['MRD'], result_file,
+                     tiny_files['usid'], tiny_files['md'], chunksize=1000)
+    # The size of the chunks does not change the result.
+    assert read_result(result_file) == read_result(tiny_files['result'])
+    df = psv_loadfile(result_file)
+    assert stats['commands'] == len(df) == len(sequence)
+    assert stats['failed'] == (~df['Pass']).sum()
+    assert df['Type'].astype(str).tolist() == \
+        sequence['type'].map(command_names).tolist()
+    for col, name in (('Address', 'regAddr'), ('Mask', 'writeMask'),
+                      ('Write', 'regWriteData'),
+                      ('Expected', 'expectedReadData')):
+        assert np.array_equal(df[col], sequence[name]), col
+    # A read passes when it returns the expected value.
+    reads = sequence['type'].isin(read_types).to_numpy()
+    assert np.array_equal(df['Pass'][reads],
+                          (df['Read'] == df['Expected'])[reads])
+    assert df['Pass'][~reads].all()
+
+    writer = SheetCollector()
+    psv_processfile(df, writer, get_tr_dict(None, tiny_files['md']),
+                    tiny_files['RSA'], tiny_files['MRD'])
+    selections = tiny_files['selections']
+    for sheet_name, key in (('Trigger Test', '-T-'),
+                            ('Timed Trigger Test', '-TT-')):
+        assert writer.sheets[sheet_name]['Register Address'].tolist() == \
+            [el[1] for el in selections[key]]
+    assert writer.sheets['TBYB Test']['Address'].tolist() == \
+        [f'Reg{el[1]}' for el in selections['-TBYB-']]
+    assert set(writer.sheets['mTrig Test']['Register Address']) == \
+        {el[1] for el in selections['-MT-'][:-1]}
+
+
+def test_sim_command(tiny_files, tmp_path, capsys):
+    mgroups_file = tmp_path / 'mgroups.json'
+    mgroups_file.write_text(json.dumps(tiny_files['md']))
+    result_file = str(tmp_path / 'result.csv')
+    assert psv_batch.main(['sim', tiny_files['sequence'],
+                           '--mrd', tiny_files['MRD'],
+                           '-o', result_file,
+                           '--mgroups', str(mgroups_file)]) == 0
+    assert read_result(result_file) == read_result(tiny_files['result'])
+    out = capsys.readouterr().out.splitlines()
+    assert out[0] == f"{tiny_files['sequence']} -> {result_file}"
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Tests of the test sequence generator."""
+import pytest
+
+from conftest import read_text, tiny_tests
+from psv_test_gen import (check_err_cmd_generator, format_command,
+                          get_command_count, get_test, save_commands)
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_sequence_matches_baseline(tiny_files, tmp_path, workers):
+    # tiny_sequence.csv.gz holds the commands the baseline generator wrote
+    # for the same register selections.
+    usid, selections = tiny_files['usid'], tiny_files['selections']
+    output_file = save_commands(
+        (el for key in tiny_tests
+         for el in get_test(key, usid, list(selections[key]), workers)),
+        str(tmp_path / 'sequence'))
+    assert output_file == str(tmp_path / 'sequence.csv')
+    assert read_text(output_file) == read_text(tiny_files['sequence'])
+
+
+def test_command_count(tiny_files):
+    usid, selections = tiny_files['usid'], tiny_files['selections']
+    counts = {key: sum(get_command_count(el) for el in
+                       get_test(key, usid, list(selections[key])))
+              for key in tiny_tests}
+    assert counts == {'-T-': 1084, '-TBYB-': 32, '-TT-': 1864, '-MT-': 21182}
+
+
+@pytest.mark.parametrize('key', tiny_tests)
+def test_wide_default(tiny_files, key):
+    # A default wider than a byte does not fit in a command record.
+    regs = [list(el) if isinstance(el, list) else el
+            for el in tiny_files['selections'][key]]
+    regs[1][-1] = '0x1FF'
+    address = regs[1][1]
+    with pytest.raises(ValueError, match=f'Default value 0x1FF of register '
+                                         f'{address} must be'):
+        list(get_test(key, tiny_files['usid'], regs))
+
+
+def test_check_err_command():
+    assert format_command(check_err_cmd_generator(0xB)[0]) == '1,2,11,36,0,0,0\n'
+    assert format_command(check_err_cmd_generator(0xB, True)[0]) == \
+        '1,2,11,36,0,0,4\n'